@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Per-tile overhead of loading the user process file.
+
+Compares loading and validating the process file on every tile (behavior before
+the process file cache was introduced) with the cached lookup used by
+``Mapchete._execute()``.
+
+Usage: python benchmarks/bench_process_cache.py [<process_file>] [<iterations>]
+"""
+
+import imp
+import os
+import sys
+import timeit
+
+import mapchete
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_PROCESS_FILE = os.path.join(
+    SCRIPT_DIR, "..", "test", "example_process.py")
+
+
+def load_uncached(process_file):
+    """Load and validate process file like it was done for every tile."""
+    user_process_py = imp.load_source("benchmark_process_file", process_file)
+    mapchete._getargspec(user_process_py.execute)
+    return user_process_py.execute
+
+
+def load_cached(process_file):
+    """Get process entry point from cache."""
+    return mapchete._load_user_process(process_file, "benchmark_process_file")
+
+
+def main(args=None):
+    """Run benchmark and print per-tile overhead."""
+    args = sys.argv[1:] if args is None else args
+    process_file = os.path.abspath(
+        args[0] if len(args) > 0 else DEFAULT_PROCESS_FILE)
+    iterations = int(args[1]) if len(args) > 1 else 1000
+    for name, func in [("uncached", load_uncached), ("cached", load_cached)]:
+        elapsed = min(timeit.repeat(
+            lambda: func(process_file), number=iterations, repeat=3))
+        print("%-10s %10.2f us per tile" % (
+            name, elapsed / iterations * 1000000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+"""
+Scenario benchmarks with results written as JSON.
+
+Synthetic input data (see ``synthetic.py``) is generated into a temporary
+directory, so runs on different machines or commits use identical data. Every
+case of a scenario is run several times; the JSON output contains all timings
+together with the software versions and the machine, and can be compared with
+the results of a previous run.
+
+Scenarios:
+
+    read_raster      read_raster_window() per dtype and source CRS
+    read_vector      read_vector_window() per geometry type and density
+    create_mosaic    create_mosaic() of neighboring tiles
+    baselevels       tiles interpolated from the next higher or lower zoom
+    write            writing process tiles as GTiff, PNG and GeoJSON
+    count_tiles      count_tiles() over a country sized polygon
+    batch_process    end-to-end batch_process() per number of workers
+
+Usage:
+python benchmarks/bench_suite.py [-o <json>] [-c <previous json>]
+    [-s <scenario> ...] [-r <repeat>] [-w <workers> ...] [--quick]
+"""
+
+import argparse
+import json
+import math
+import numpy as np
+import os
+import platform
+import rasterio
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime
+from multiprocessing import cpu_count
+from shapely.geometry import Polygon, box
+
+import mapchete
+from mapchete._batch import count_tiles
+from mapchete.io.raster import create_mosaic, read_raster_window
+from mapchete.io.vector import read_vector_window
+from mapchete.tile import BufferedTilePyramid
+
+from synthetic import DEFAULT_BOUNDS, create_raster, create_vector
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+PROCESS_FILE = os.path.join(SCRIPT_DIR, "..", "test", "example_process.py")
+
+SCENARIOS = OrderedDict()
+
+
+def scenario(name):
+    """Register function yielding parameters and callable of each case."""
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+class SyntheticData(object):
+    """
+    Generate synthetic files on first use and keep them for all scenarios.
+
+    Parameters
+    ----------
+    path : string
+        directory for generated files
+    quick : bool
+        generate smaller files
+    """
+
+    def __init__(self, path, quick=False):
+        """Initialize."""
+        self.path = path
+        self.quick = quick
+
+    def raster(self, dtype="uint16", crs="EPSG:4326"):
+        """Return path to a synthetic raster."""
+        path = os.path.join(self.path, "%s_%s.tif" % (
+            dtype, crs.split(":")[1]))
+        if not os.path.exists(path):
+            width, height = (1024, 512) if self.quick else (8192, 4096)
+            create_raster(
+                path, width=width, height=height, dtype=dtype, crs=crs)
+        return path
+
+    def vector(self, geometry_type="Polygon", features=1000):
+        """Return path to a synthetic vector file."""
+        path = os.path.join(self.path, "%s_%s.geojson" % (
+            geometry_type.lower(), features))
+        if not os.path.exists(path):
+            create_vector(path, geometry_type, features)
+        return path
+
+    def process_config(self, output, name, **kwargs):
+        """Return process configuration reading a synthetic raster."""
+        output_path = os.path.join(self.path, "output", name)
+        shutil.rmtree(output_path, ignore_errors=True)
+        config = dict(
+            process_file=os.path.realpath(PROCESS_FILE),
+            config_dir=self.path,
+            pyramid=dict(grid="geodetic"),
+            input=dict(file1=self.raster(output.get("dtype", "uint16"))),
+            output=dict(output, path=output_path),
+            zoom_levels=9 if self.quick else 11
+        )
+        config.update(kwargs)
+        return config
+
+
+def tiles_in_bounds(pyramid, zoom, limit, bounds=DEFAULT_BOUNDS):
+    """Return up to limit tiles from the center of bounds."""
+    left, bottom, right, top = bounds
+    center = box(*bounds).centroid
+    tiles = sorted(
+        pyramid.tiles_from_bounds(
+            (left + 1, bottom + 1, right - 1, top - 1), zoom),
+        key=lambda tile: tile.bbox.centroid.distance(center)
+    )
+    return tiles[:limit]
+
+
+@scenario("read_raster")
+def bench_read_raster(data):
+    """Read process tiles from rasters with overviews."""
+    pyramid = BufferedTilePyramid("geodetic", pixelbuffer=16)
+    for dtype in ["uint8", "uint16", "float32"]:
+        for crs in ["EPSG:4326", "EPSG:3857"]:
+            path = data.raster(dtype, crs)
+            for zoom in [6, 9]:
+                tiles = tiles_in_bounds(pyramid, zoom, 4 if data.quick else 16)
+                yield (
+                    dict(dtype=dtype, crs=crs, zoom=zoom, tiles=len(tiles)),
+                    lambda path=path, tiles=tiles: [
+                        read_raster_window(path, tile) for tile in tiles]
+                )
+
+
+@scenario("read_vector")
+def bench_read_vector(data):
+    """Read process tiles from vector files."""
+    pyramid = BufferedTilePyramid("geodetic", pixelbuffer=16)
+    tiles = tiles_in_bounds(pyramid, 8, 4 if data.quick else 16)
+    for geometry_type in ["Point", "LineString", "Polygon"]:
+        for features in [100, 2000] if data.quick else [1000, 20000]:
+            path = data.vector(geometry_type, features)
+            yield (
+                dict(
+                    geometry_type=geometry_type, features=features,
+                    tiles=len(tiles)),
+                lambda path=path: [
+                    list(read_vector_window(path, tile)) for tile in tiles]
+            )
+
+
+@scenario("create_mosaic")
+def bench_create_mosaic(data):
+    """Mosaic neighboring tiles into one array."""
+    pyramid = BufferedTilePyramid("geodetic", pixelbuffer=16)
+    rng = np.random.RandomState(0)
+    for side in [2, 4, 16]:
+        tiles = [
+            (tile, rng.randint(0, 10000, (1, ) + tile.shape).astype("uint16"))
+            for tile in (
+                pyramid.tile(10, 300 + row, 1100 + col)
+                for row in range(side) for col in range(side)
+            )
+        ]
+        yield (
+            dict(tiles=len(tiles)),
+            lambda tiles=tiles: create_mosaic(tiles)
+        )
+
+
+@scenario("baselevels")
+def bench_baselevels(data):
+    """Interpolate tiles from the next higher and lower zoom level."""
+    base = 8 if data.quick else 10
+    for direction, zoom in [("lower", base - 1), ("higher", base + 1)]:
+        for resampling in ["nearest", "bilinear"]:
+            config = data.process_config(
+                dict(format="GTiff", dtype="uint16", bands=1),
+                "baselevels_%s_%s" % (direction, resampling),
+                zoom_levels=dict(min=base - 1, max=base + 1),
+                baselevels=dict(
+                    min=base, max=base, lower=resampling, higher=resampling)
+            )
+            pyramid = BufferedTilePyramid("geodetic")
+            tiles = tiles_in_bounds(pyramid, zoom, 4 if data.quick else 16)
+            bounds = box(*tiles[0].bounds)
+            for tile in tiles[1:]:
+                bounds = bounds.union(box(*tile.bounds))
+            mp = mapchete.open(config, mode="continue", bounds=bounds.bounds)
+            # baselevel output is prepared once and is not timed
+            mp.batch_process(zoom=base, multi=1, quiet=True, journal=False)
+            yield (
+                dict(
+                    direction=direction, resampling=resampling,
+                    tiles=len(tiles)),
+                lambda mp=mp, tiles=tiles: [mp.execute(tile) for tile in tiles]
+            )
+            mp.__exit__(None, None, None)
+
+
+@scenario("write")
+def bench_write(data):
+    """Write process tiles."""
+    pyramid = BufferedTilePyramid("geodetic")
+    for output in [
+        dict(format="GTiff", dtype="uint16", bands=1),
+        dict(format="GTiff", dtype="uint16", bands=1, compress="deflate"),
+        dict(format="PNG", dtype="uint8", bands=1),
+        dict(
+            format="GeoJSON",
+            schema=dict(geometry="Point", properties=dict(id="int"))
+        ),
+    ]:
+        mp = mapchete.open(
+            data.process_config(output, "write"), mode="overwrite")
+        tiles = tiles_in_bounds(pyramid, 9, 4 if data.quick else 16)
+        if output["format"] == "GeoJSON":
+            path = data.vector("Point", 2000 if data.quick else 20000)
+            outputs = [
+                (tile, [
+                    dict(geometry=feature["geometry"], properties=dict(id=i))
+                    for i, feature in enumerate(
+                        read_vector_window(path, tile))
+                ])
+                for tile in tiles
+            ]
+        else:
+            path = data.raster(output["dtype"])
+            outputs = [
+                (tile, read_raster_window(path, tile)) for tile in tiles]
+        yield (
+            dict(output, tiles=len(tiles)),
+            lambda mp=mp, outputs=outputs: [
+                mp.write(tile, output) for tile, output in outputs]
+        )
+        mp.__exit__(None, None, None)
+
+
+@scenario("count_tiles")
+def bench_count_tiles(data):
+    """Count process tiles of a country sized polygon."""
+    pyramid = BufferedTilePyramid("geodetic", metatiling=2, pixelbuffer=2)
+    geometry = Polygon([
+        (
+            13.3 + 3. * (1 + .3 * math.sin(7 * a)) * math.cos(a),
+            47.6 + 1.8 * (1 + .2 * math.cos(11 * a)) * math.sin(a)
+        )
+        for a in (2 * math.pi * i / 500 for i in range(500))
+    ]).buffer(0)
+    for maxzoom in [10, 13] if data.quick else [10, 13, 16]:
+        yield (
+            dict(minzoom=0, maxzoom=maxzoom),
+            lambda maxzoom=maxzoom: count_tiles(
+                geometry, pyramid, 0, maxzoom)
+        )
+
+
+@scenario("batch_process")
+def bench_batch_process(data, workers=(1, 2, 4)):
+    """Run a process end-to-end."""
+    for multi in workers:
+        config = data.process_config(
+            dict(format="GTiff", dtype="uint16", bands=1),
+            "batch_process_%s" % multi
+        )
+        mp = mapchete.open(config, mode="overwrite")
+        yield (
+            dict(multi=multi, tiles=len(list(mp.get_process_tiles()))),
+            lambda mp=mp, multi=multi: mp.batch_process(
+                multi=multi, quiet=True, journal=False)
+        )
+        mp.__exit__(None, None, None)
+
+
+def run(scenarios, data, repeat=3, options=None):
+    """
+    Run scenarios and return results.
+
+    Parameters
+    ----------
+    scenarios : list
+        scenario names
+    data : SyntheticData
+    repeat : int
+        number of runs per case
+    options : dict
+        keyword arguments per scenario name
+
+    Returns
+    -------
+    results : list
+        one dictionary per case
+    """
+    results = []
+    for name in scenarios:
+        cases = SCENARIOS[name](data, **(options or {}).get(name, {}))
+        for params, case in cases:
+            timings = []
+            for _ in range(repeat):
+                start = time.time()
+                case()
+                timings.append(time.time() - start)
+            result = OrderedDict([
+                ("scenario", name),
+                ("params", params),
+                ("timings", timings),
+                ("min", min(timings)),
+                ("median", float(np.median(timings)))
+            ])
+            print("%-14s %-60s %9.4fs" % (
+                result["scenario"], _format_params(params), result["min"]))
+            results.append(result)
+    return results
+
+
+def environment():
+    """Return versions and machine the benchmarks were run with."""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=SCRIPT_DIR,
+            stderr=open(os.devnull, "w")
+        ).decode().strip()
+    except Exception:
+        commit = None
+    return OrderedDict([
+        ("date", datetime.utcnow().isoformat()),
+        ("commit", commit),
+        ("mapchete", mapchete.__version__),
+        ("python", platform.python_version()),
+        ("numpy", np.__version__),
+        ("rasterio", rasterio.__version__),
+        ("gdal", rasterio.__gdal_version__),
+        ("platform", platform.platform()),
+        ("cpu_count", cpu_count())
+    ])
+
+
+def compare(results, previous):
+    """Print ratio of minimum timings to those of a previous run."""
+    before = dict(
+        (_case_key(result), result) for result in previous["results"])
+    print("%-14s %-60s %9s %9s %7s" % (
+        "scenario", "params", "before", "after", "ratio"))
+    for result in results:
+        old = before.get(_case_key(result))
+        if old is None:
+            continue
+        print("%-14s %-60s %8.4fs %8.4fs %7.2f" % (
+            result["scenario"], _format_params(result["params"]), old["min"],
+            result["min"], result["min"] / old["min"] if old["min"] else 0.
+        ))
+
+
+def _case_key(result):
+    return result["scenario"], json.dumps(result["params"], sort_keys=True)
+
+
+def _format_params(params):
+    return " ".join("%s=%s" % (k, v) for k, v in sorted(params.items()))
+
+
+def main(args=None):
+    """Run benchmarks and write results as JSON."""
+    parser = argparse.ArgumentParser(
+        description="Run scenario benchmarks and write results as JSON.")
+    parser.add_argument(
+        "--output", "-o", type=str, metavar="<path>",
+        help="write results to JSON file")
+    parser.add_argument(
+        "--compare", "-c", type=str, metavar="<path>",
+        help="compare with results of previous run")
+    parser.add_argument(
+        "--scenarios", "-s", type=str, nargs="*", metavar="<scenario>",
+        choices=list(SCENARIOS),
+        help="scenarios to run (default: all)")
+    parser.add_argument(
+        "--repeat", "-r", type=int, default=3, metavar="<int>",
+        help="number of runs per case")
+    parser.add_argument(
+        "--workers", "-w", type=int, nargs="*", default=[1, 2, 4],
+        metavar="<int>", help="numbers of batch_process workers")
+    parser.add_argument(
+        "--data", "-d", type=str, metavar="<path>",
+        help="keep synthetic data in this directory")
+    parser.add_argument(
+        "--quick", "-q", action="store_true",
+        help="use small data sets")
+    parsed = parser.parse_args(sys.argv[1:] if args is None else args)
+    scenarios = [
+        name for name in SCENARIOS
+        if not parsed.scenarios or name in parsed.scenarios
+    ]
+    data_dir = parsed.data or tempfile.mkdtemp()
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    try:
+        results = run(
+            scenarios, SyntheticData(data_dir, quick=parsed.quick),
+            repeat=parsed.repeat,
+            options=dict(batch_process=dict(workers=parsed.workers)))
+    finally:
+        if parsed.data:
+            shutil.rmtree(os.path.join(data_dir, "output"), ignore_errors=True)
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    report = OrderedDict([
+        ("environment", environment()),
+        ("quick", parsed.quick),
+        ("repeat", parsed.repeat),
+        ("results", results)
+    ])
+    if parsed.output:
+        with open(parsed.output, "w") as dst:
+            json.dump(report, dst, indent=2)
+    if parsed.compare:
+        with open(parsed.compare) as src:
+            compare(results, json.load(src))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Tile enumeration and counting over a process area.
+
+Compares the rasterized tile matrix enumeration used by
+``Mapchete.get_process_tiles()`` and ``count_tiles()`` with the previous
+implementations intersecting every tile (``tiles_from_geom()``) and recursing
+through the quad tree.
+
+Usage: python benchmarks/bench_tile_enumeration.py [<minzoom>] [<maxzoom>]
+"""
+
+import math
+import sys
+import time
+from itertools import product
+from shapely.geometry import Polygon
+from tilematrix import TilePyramid
+
+from mapchete.tile import (
+    BufferedTilePyramid, tile_ids_from_geom, count_tiles_from_geom)
+
+
+def country_polygon(x=13.3, y=47.6, radius=3., vertices=500):
+    """Return an irregular country sized polygon (in degrees)."""
+    return Polygon([
+        (
+            x + radius * (1 + .3 * math.sin(7 * a)) * math.cos(a),
+            y + radius * .6 * (1 + .2 * math.cos(11 * a)) * math.sin(a)
+        )
+        for a in (2 * math.pi * i / vertices for i in range(vertices))
+    ]).buffer(0)
+
+
+def enumerate_old(pyramid, geometry, zoom):
+    """Enumerate tiles like it was done before."""
+    return sum(1 for _ in pyramid.tiles_from_geom(geometry, zoom))
+
+
+def enumerate_new(pyramid, geometry, zoom):
+    """Enumerate tiles from rasterized tile matrix."""
+    return sum(1 for _ in tile_ids_from_geom(pyramid, geometry, zoom))
+
+
+def count_old(pyramid, geometry, zoom):
+    """Count tiles recursing through the quad tree like it was done before."""
+    unbuffered_pyramid = TilePyramid(
+        pyramid.grid, tile_size=pyramid.tile_size,
+        metatiling=pyramid.metatiling
+    )
+    geometry = geometry.buffer(-0.000000001)
+    return _count_tiles_old(
+        [
+            unbuffered_pyramid.tile(*tile_id)
+            for tile_id in product(
+                [0], range(pyramid.matrix_height(0)),
+                range(pyramid.matrix_width(0))
+            )
+        ], geometry, zoom, zoom
+    )
+
+
+def _count_tiles_old(tiles, geometry, minzoom, maxzoom):
+    count = 0
+    for tile in tiles:
+        tile_intersection = tile.bbox().intersection(geometry)
+        if tile_intersection.is_empty:
+            continue
+        elif tile.zoom >= minzoom:
+            count += 1
+        if tile.zoom < maxzoom:
+            if tile.zoom >= minzoom and tile_intersection.equals(tile.bbox()):
+                count += sum([
+                     4**z_diff
+                     for z_diff in range(1, (maxzoom - tile.zoom) + 1)
+                ])
+            else:
+                count += _count_tiles_old(
+                    tile.get_children(), tile_intersection, minzoom, maxzoom
+                )
+    return count
+
+
+def count_new(pyramid, geometry, zoom):
+    """Count tiles from rasterized tile matrix."""
+    return count_tiles_from_geom(pyramid, geometry, zoom)
+
+
+def main(args=None):
+    """Run benchmark and print timings per zoom level."""
+    args = sys.argv[1:] if args is None else args
+    minzoom = int(args[0]) if len(args) > 0 else 8
+    maxzoom = int(args[1]) if len(args) > 1 else 12
+    pyramid = BufferedTilePyramid("geodetic", pixelbuffer=2)
+    geometry = country_polygon()
+    print("%4s %10s %12s %12s %12s %12s" % (
+        "zoom", "tiles", "enum old", "enum new", "count old", "count new"))
+    for zoom in range(minzoom, maxzoom + 1):
+        timings = []
+        for func in [enumerate_old, enumerate_new, count_old, count_new]:
+            start = time.time()
+            tiles = func(pyramid, geometry, zoom)
+            timings.append(time.time() - start)
+        print("%4s %10s %11.3fs %11.3fs %11.3fs %11.3fs" % (
+            (zoom, tiles) + tuple(timings)))
+
+
+if __name__ == "__main__":
+    main()
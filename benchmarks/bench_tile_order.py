@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Input I/O volume of batch runs depending on the process tile order.
+
+Simulates workers reading a blocked input raster aligned with the process
+tiles. Chunks of process tiles are dealt to the workers like by
+``batch_process()``, every worker keeps the most recently read blocks in a LRU
+block cache (like the GDAL block cache) and every block not found in the cache
+is counted as read from disk. Compares row by row order with tiles sorted
+along a Hilbert and a Z-order curve.
+
+Usage:
+python benchmarks/bench_tile_order.py [<zoom>] [<workers>] [<cache>] [<block>]
+"""
+
+import math
+import sys
+from collections import OrderedDict
+from shapely.geometry import Polygon
+
+from mapchete._batch import MAX_CHUNKSIZE
+from mapchete.tile import BufferedTilePyramid, tile_ids_from_geom, curve_index
+
+TILE_SIZE = 256
+PIXELBUFFER = 16
+
+
+def country_polygon(x=13.3, y=47.6, radius=3., vertices=500):
+    """Return an irregular country sized polygon (in degrees)."""
+    return Polygon([
+        (
+            x + radius * (1 + .3 * math.sin(7 * a)) * math.cos(a),
+            y + radius * .6 * (1 + .2 * math.cos(11 * a)) * math.sin(a)
+        )
+        for a in (2 * math.pi * i / vertices for i in range(vertices))
+    ]).buffer(0)
+
+
+def tile_blocks(row, col, block_size):
+    """Return input blocks covered by a buffered process tile."""
+    top = row * TILE_SIZE - PIXELBUFFER
+    left = col * TILE_SIZE - PIXELBUFFER
+    bottom = (row + 1) * TILE_SIZE + PIXELBUFFER - 1
+    right = (col + 1) * TILE_SIZE + PIXELBUFFER - 1
+    return [
+        (block_row, block_col)
+        for block_row in range(top // block_size, bottom // block_size + 1)
+        for block_col in range(left // block_size, right // block_size + 1)
+    ]
+
+
+def simulate(
+    tile_ids, workers, cache_blocks, block_size, chunksize=MAX_CHUNKSIZE
+):
+    """Return number of blocks read from disk by all workers."""
+    caches = [OrderedDict() for _ in range(workers)]
+    reads = 0
+    for i in range(0, len(tile_ids), chunksize):
+        cache = caches[(i // chunksize) % workers]
+        for _, row, col in tile_ids[i:i + chunksize]:
+            for block in tile_blocks(row, col, block_size):
+                if block in cache:
+                    cache[block] = cache.pop(block)
+                    continue
+                reads += 1
+                cache[block] = True
+                if len(cache) > cache_blocks:
+                    cache.popitem(last=False)
+    return reads
+
+
+def main(args=None):
+    """Run benchmark and print I/O volume per tile order."""
+    args = sys.argv[1:] if args is None else args
+    zoom = int(args[0]) if len(args) > 0 else 12
+    workers = int(args[1]) if len(args) > 1 else 8
+    cache_blocks = int(args[2]) if len(args) > 2 else 64
+    block_size = int(args[3]) if len(args) > 3 else 256
+    # one band uint16
+    block_bytes = block_size * block_size * 2
+    pyramid = BufferedTilePyramid(
+        "geodetic", tile_size=TILE_SIZE, pixelbuffer=PIXELBUFFER)
+    tile_ids = list(tile_ids_from_geom(pyramid, country_polygon(), zoom))
+    print("%s tiles, %s workers, %s cached %spx blocks per worker" % (
+        len(tile_ids), workers, cache_blocks, block_size))
+    print("%-8s %12s %12s %10s" % ("order", "blocks read", "MB read", "ratio"))
+    baseline = None
+    for order in [None, "hilbert", "zorder"]:
+        if order:
+            positions = curve_index(
+                [t[1] for t in tile_ids], [t[2] for t in tile_ids], order)
+            ordered = [
+                tile_ids[i] for i in positions.argsort(kind="mergesort")]
+        else:
+            ordered = tile_ids
+        reads = simulate(ordered, workers, cache_blocks, block_size)
+        baseline = baseline or reads
+        print("%-8s %12s %12.1f %10.2f" % (
+            order or "rowcol", reads, reads * block_bytes / 1024. / 1024.,
+            float(reads) / baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Synthetic raster and vector data for benchmarks.
+
+All data is derived from a seeded random generator, so files generated with
+the same parameters are identical and benchmark runs stay comparable.
+
+Usage: python benchmarks/synthetic.py <output_dir>
+"""
+
+import fiona
+import math
+import numpy as np
+import os
+import rasterio
+import sys
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_bounds
+from shapely.geometry import LineString, Point, Polygon, mapping
+
+from mapchete.io.vector import reproject_geometry
+
+# area covered by default, roughly the Alps (left, bottom, right, top) in
+# EPSG:4326
+DEFAULT_BOUNDS = (5., 44., 17., 49.)
+
+# overview factors built by create_raster()
+OVERVIEW_FACTORS = [2, 4, 8, 16]
+
+
+def create_raster(
+    path, width=4096, height=2048, dtype="uint16", count=1,
+    crs="EPSG:4326", bounds=DEFAULT_BOUNDS, nodata=0, overviews=True,
+    blocksize=256, compress="deflate", seed=0
+):
+    """
+    Write a tiled GeoTIFF containing smooth terrain like values.
+
+    Parameters
+    ----------
+    path : string
+        output file
+    width, height : int
+        raster size in pixels
+    dtype : string
+        numpy data type of bands
+    count : int
+        number of bands
+    crs : string
+        CRS of raster; bounds are given in EPSG:4326 and transformed
+    bounds : tuple
+        left, bottom, right, top in EPSG:4326
+    nodata : int or float
+        nodata value; a border of nodata pixels is left around the data
+    overviews : bool
+        build internal overviews (default: True)
+    blocksize : int
+        internal tile size
+    compress : string
+        GeoTIFF compression
+    seed : int
+        seed of random generator
+
+    Returns
+    -------
+    path : string
+    """
+    rng = np.random.RandomState(seed)
+    dst_bounds = transform_bounds(CRS.from_string("EPSG:4326"), crs, *bounds)
+    profile = dict(
+        driver="GTiff", width=width, height=height, count=count,
+        dtype=dtype, crs=crs, nodata=nodata, tiled=True,
+        blockxsize=blocksize, blockysize=blocksize, compress=compress,
+        transform=from_bounds(*dst_bounds, width=width, height=height)
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        for band in range(1, count + 1):
+            dst.write(_terrain(width, height, dtype, nodata, rng), band)
+        if overviews:
+            dst.build_overviews(OVERVIEW_FACTORS, Resampling.average)
+    return path
+
+
+def _terrain(width, height, dtype, nodata, rng):
+    """Return sum of random waves scaled to the value range of dtype."""
+    y, x = np.mgrid[0:height, 0:width].astype("float32")
+    values = np.zeros((height, width), dtype="float32")
+    for _ in range(8):
+        fx, fy = rng.uniform(1, 20, 2) * 2 * math.pi
+        phase = rng.uniform(0, 2 * math.pi)
+        values += np.sin(x / width * fx + phase) * np.cos(y / height * fy)
+    values += rng.normal(0, .1, values.shape).astype("float32")
+    values = (values - values.min()) / (values.max() - values.min())
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        info = np.iinfo(dtype)
+        values = values * (min([info.max, 10000]) - 1) + 1
+    data = values.astype(dtype)
+    # nodata border of 2% of the raster size
+    border_y, border_x = max([height // 50, 1]), max([width // 50, 1])
+    data[:border_y] = nodata
+    data[-border_y:] = nodata
+    data[:, :border_x] = nodata
+    data[:, -border_x:] = nodata
+    return data
+
+
+def create_vector(
+    path, geometry_type="Polygon", features=1000, crs="EPSG:4326",
+    bounds=DEFAULT_BOUNDS, vertices=16, seed=0
+):
+    """
+    Write a GeoJSON file of randomly placed features.
+
+    Parameters
+    ----------
+    path : string
+        output file
+    geometry_type : string
+        ``Point``, ``LineString`` or ``Polygon``
+    features : int
+        number of features; controls the density within bounds
+    crs : string
+        CRS of file; bounds are given in EPSG:4326 and transformed
+    bounds : tuple
+        left, bottom, right, top in EPSG:4326
+    vertices : int
+        number of vertices of lines and polygons
+    seed : int
+        seed of random generator
+
+    Returns
+    -------
+    path : string
+    """
+    rng = np.random.RandomState(seed)
+    left, bottom, right, top = bounds
+    # features have a size of about one percent of the area
+    size = min([right - left, top - bottom]) / 100.
+    schema = dict(geometry=geometry_type, properties=dict(id="int"))
+    if os.path.exists(path):
+        os.remove(path)
+    with fiona.open(
+        path, "w", driver="GeoJSON", schema=schema,
+        crs=CRS.from_string(crs).to_dict()
+    ) as dst:
+        for i in range(features):
+            x, y = rng.uniform(left, right), rng.uniform(bottom, top)
+            geometry = _geometry(geometry_type, x, y, size, vertices, rng)
+            if crs != "EPSG:4326":
+                geometry = reproject_geometry(
+                    geometry, src_crs=CRS.from_string("EPSG:4326"),
+                    dst_crs=CRS.from_string(crs))
+            dst.write(dict(geometry=mapping(geometry), properties=dict(id=i)))
+    return path
+
+
+def _geometry(geometry_type, x, y, size, vertices, rng):
+    if geometry_type == "Point":
+        return Point(x, y)
+    elif geometry_type == "LineString":
+        steps = rng.normal(0, size / vertices, (vertices, 2)).cumsum(axis=0)
+        return LineString(steps + (x, y))
+    elif geometry_type == "Polygon":
+        angles = np.sort(rng.uniform(0, 2 * math.pi, vertices))
+        radii = rng.uniform(.5, 1., vertices) * size
+        return Polygon(list(zip(
+            x + radii * np.cos(angles), y + radii * np.sin(angles))))
+    raise ValueError("invalid geometry type: %s" % geometry_type)
+
+
+def main(args=None):
+    """Write a set of synthetic files into a directory."""
+    args = sys.argv[1:] if args is None else args
+    out_dir = args[0] if args else "synthetic"
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    for dtype in ["uint8", "uint16", "float32"]:
+        for crs in ["EPSG:4326", "EPSG:3857"]:
+            print(create_raster(os.path.join(out_dir, "%s_%s.tif" % (
+                dtype, crs.split(":")[1])), dtype=dtype, crs=crs))
+    for geometry_type in ["Point", "LineString", "Polygon"]:
+        for features in [100, 10000]:
+            print(create_vector(os.path.join(out_dir, "%s_%s.geojson" % (
+                geometry_type.lower(), features)), geometry_type, features))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,16 +13,20 @@ import numpy as np
 import numpy.ma as ma
 from traceback import format_exc
 from multiprocessing import cpu_count
-from cachetools import LRUCache
 from shapely.geometry import shape
 from itertools import chain
 
-from mapchete._batch import batch_process
+from mapchete._batch import (
+    batch_process, batch_output, DEFAULT_BASELEVEL_STORE_SIZE)
+from mapchete._cache import (
+    ProcessTileCache, DiskSpillCache, cache_namespace, DEFAULT_CACHE_SIZE,
+    DEFAULT_SPILL_SIZE)
+from mapchete._prefetch import DEFAULT_PREFETCH_SIZE
 from mapchete.commons import clip as commons_clip
 from mapchete.commons import contours as commons_contours
 from mapchete.commons import hillshade as commons_hillshade
 from mapchete.config import MapcheteConfig
-from mapchete.tile import BufferedTile
+from mapchete.tile import BufferedTile, tile_ids_from_geom
 from mapchete.io import raster
 from mapchete.errors import (
     MapcheteProcessImportError, MapcheteProcessException,
@@ -37,10 +41,19 @@ logging.getLogger("rasterio").setLevel(logging.ERROR)
 
 __version__ = "0.19"
 
+# loaded user process entry points per process file, shared by all Mapchete
+# objects of a worker
+_PROCESS_CACHE = {}
+_PROCESS_CACHE_LOCK = threading.Lock()
+
+# inspect.getargspec() is deprecated in Python 3
+_getargspec = getattr(inspect, "getfullargspec", None) or inspect.getargspec
+
 
 def open(
     config, mode="continue", zoom=None, bounds=None, single_input_file=None,
-    with_cache=False, debug=False
+    with_cache=False, debug=False, cache_size=DEFAULT_CACHE_SIZE,
+    spill_dir=None, spill_size=DEFAULT_SPILL_SIZE
 ):
     """
     Open a Mapchete process.
@@ -63,6 +76,13 @@ def open(
         single input file if supported by process
     with_cache : bool
         process output data cached in memory
+    cache_size : integer
+        memory budget of process output cache in bytes (default: 512 MB)
+    spill_dir : string
+        directory where process output evicted from cache is stored
+        (default: None)
+    spill_size : integer
+        size limit of spill_dir in bytes (default: 4 GB)
 
     Returns
     -------
@@ -73,7 +93,8 @@ def open(
         MapcheteConfig(
             config, mode=mode, zoom=zoom, bounds=bounds,
             single_input_file=single_input_file, debug=debug),
-        with_cache=with_cache
+        with_cache=with_cache, cache_size=cache_size, spill_dir=spill_dir,
+        spill_size=spill_size
     )
 
 
@@ -89,6 +110,13 @@ class Mapchete(object):
         Mapchete process configuration
     with_cache : bool
         cache processed output data in memory (default: False)
+    cache_size : integer
+        memory budget of process output cache in bytes (default: 512 MB)
+    spill_dir : string
+        directory where process output evicted from cache is stored
+        (default: None)
+    spill_size : integer
+        size limit of spill_dir in bytes (default: 4 GB)
 
     Attributes
     ----------
@@ -96,9 +124,17 @@ class Mapchete(object):
         Mapchete process configuration
     with_cache : bool
         process output data cached in memory
+    process_tile_cache : ProcessTileCache
+        cached process output if with_cache is active
+    baselevel_store : SharedTileStore
+        written output of tiles other zoom levels are interpolated from, set
+        by batch_process() (default: None)
     """
 
-    def __init__(self, config, with_cache=False):
+    def __init__(
+        self, config, with_cache=False, cache_size=DEFAULT_CACHE_SIZE,
+        spill_dir=None, spill_size=DEFAULT_SPILL_SIZE
+    ):
         """
         Initialize Mapchete processing endpoint.
 
@@ -108,6 +144,13 @@ class Mapchete(object):
             Mapchete process configuration
         with_cache : bool
             cache processed output data in memory (default: False)
+        cache_size : integer
+            memory budget of process output cache in bytes (default: 512 MB)
+        spill_dir : string
+            directory where process output evicted from cache is stored
+            (default: None)
+        spill_size : integer
+            size limit of spill_dir in bytes (default: 4 GB)
         """
         LOGGER.info("preparing process ...")
         if not isinstance(config, MapcheteConfig):
@@ -120,9 +163,15 @@ class Mapchete(object):
         else:
             self.with_cache = with_cache
         if self.with_cache:
-            self.process_tile_cache = LRUCache(maxsize=512)
-            self.current_processes = {}
-            self.process_lock = threading.Lock()
+            self.process_tile_cache = ProcessTileCache(
+                max_bytes=cache_size,
+                spill=DiskSpillCache(
+                    spill_dir, max_bytes=spill_size,
+                    namespace=cache_namespace(
+                        self.config.process_file, self.config._raw)
+                ) if spill_dir else None
+            )
+        self.baselevel_store = None
 
     def get_process_tiles(self, zoom=None):
         """
@@ -143,20 +192,23 @@ class Mapchete(object):
         BufferedTile objects
         """
         if zoom or zoom == 0:
-            for tile in self.config.process_pyramid.tiles_from_geom(
-                self.config.area_at_zoom(zoom), zoom
-            ):
-                yield tile
+            zoom_levels = [zoom]
         else:
-            for zoom in reversed(self.config.zoom_levels):
-                for tile in self.config.process_pyramid.tiles_from_geom(
-                    self.config.area_at_zoom(zoom), zoom
-                ):
-                    yield tile
+            zoom_levels = reversed(self.config.zoom_levels)
+        for zoom in zoom_levels:
+            for tile_id in tile_ids_from_geom(
+                self.config.process_pyramid, self.config.area_at_zoom(zoom),
+                zoom
+            ):
+                yield self.config.process_pyramid.tile(*tile_id)
 
     def batch_process(
         self, zoom=None, tile=None, multi=cpu_count(), quiet=False,
-        debug=False, logfile=None
+        debug=False, logfile=None, order=None, journal=True, timeout=None,
+        retries=0, retry_delay=1., max_tasks_per_worker=None,
+        skip_failed=False, concurrency="processes", threads=None,
+        writers=0, prefetch=0, prefetch_size=DEFAULT_PREFETCH_SIZE,
+        baselevel_store_size=DEFAULT_BASELEVEL_STORE_SIZE
     ):
         """
         Process a large batch of tiles.
@@ -178,8 +230,86 @@ class Mapchete(object):
         debug : bool
             set log level to "debug" and disable progress bar (cannot be used
             with quiet)
+        order : string
+            process tiles along a space filling curve (``hilbert`` or
+            ``zorder``) instead of row by row (default: None)
+        journal : bool
+            record the status of each processed tile in a journal in the
+            output directory and use it to resume in continue mode
+            (default: True)
+        timeout : float
+            seconds a tile may take before its worker is killed and replaced
+            (default: None)
+        retries : int
+            number of times a failed or timed out tile is processed again
+            (default: 0)
+        retry_delay : float
+            seconds to wait before retrying a tile the first time, doubled for
+            every further retry (default: 1)
+        max_tasks_per_worker : int
+            number of chunks of tiles a worker processes before it is replaced
+            by a fresh one (default: None)
+        skip_failed : bool
+            collect failed tiles and continue instead of raising their
+            exception (default: False)
+        concurrency : string
+            run workers as ``processes``, as ``threads`` of the current
+            process or as processes running multiple threads each
+            (``hybrid``) (default: ``processes``)
+        threads : int
+            number of threads per worker process if concurrency is
+            ``hybrid`` (default: 4)
+        writers : int
+            number of threads per worker process writing outputs in the
+            background while the next tile is processed (default: 0)
+        prefetch : int
+            number of upcoming tiles whose inputs a worker process reads in
+            the background while processing the current tile (default: 0)
+        prefetch_size : float
+            maximum size of prefetched input data per worker in MB
+            (default: 256)
+        baselevel_store_size : float
+            size in MB of shared memory keeping written output which other
+            zoom levels are interpolated from, 0 disables it (default: 256)
+
+        Returns
+        -------
+        failed : list
+            TileStatus of each failed tile
+        """
+        return batch_process(
+            self, zoom, tile, multi, quiet, debug, logfile, order, journal,
+            timeout, retries, retry_delay, max_tasks_per_worker, skip_failed,
+            concurrency, threads, writers, prefetch, prefetch_size,
+            baselevel_store_size)
+
+    def batch_output(
+        self, zoom=None, multi=cpu_count(), slots=None, order=None
+    ):
         """
-        batch_process(self, zoom, tile, multi, quiet, debug, logfile)
+        Process a batch of tiles and yield the process outputs.
+
+        Parameters
+        ----------
+        zoom : list or int
+            either single zoom level or list of minimum and maximum zoom level;
+            None processes all (default: None)
+        multi : int
+            number of workers (default: number of CPU cores)
+        slots : int
+            maximum number of process outputs passed on from the workers at
+            once (default: number of workers)
+        order : string
+            process tiles along a space filling curve (``hilbert`` or
+            ``zorder``) instead of row by row (default: None)
+
+        Yields
+        ------
+        status, output : tuple
+            TileStatus and process output (None if tile was skipped)
+        """
+        return batch_output(
+            self, zoom=zoom, multi=multi, slots=slots, order=order)
 
     def execute(self, process_tile):
         """
@@ -237,7 +367,7 @@ class Mapchete(object):
             raise TypeError("output_tile must be tuple or BufferedTile")
         return self.config.output.read(output_tile)
 
-    def write(self, process_tile, data):
+    def write(self, process_tile, data, _exists_checked=False):
         """
         Write data into output format.
 
@@ -259,7 +389,7 @@ class Mapchete(object):
         if data is None:
             LOGGER.debug((process_tile.id, "nothing to write"))
         else:
-            if self.config.mode == "continue" and (
+            if self.config.mode == "continue" and not _exists_checked and (
                 self.config.output.tiles_exist(process_tile)
             ):
                 LOGGER.debug((process_tile.id, "exists, not overwritten"))
@@ -268,6 +398,8 @@ class Mapchete(object):
                 self.config.output.write(process_tile=process_tile, data=data)
                 elapsed = "%ss" % (round((time.time() - starttime), 3))
                 LOGGER.debug((process_tile.id, "output written", elapsed))
+                if self.baselevel_store is not None:
+                    self._store_baselevel_output(process_tile, data)
 
     def get_raw_output(self, tile, _baselevel_readonly=False):
         """
@@ -366,44 +498,90 @@ class Mapchete(object):
             ]))
 
     def _execute_using_cache(self, process_tile):
-        # Extract Tile subset from process Tile and return.
-        try:
-            return self.process_tile_cache[process_tile.id]
-        except KeyError:
-            # Lock process for Tile or wait.
-            with self.process_lock:
-                process_event = self.current_processes.get(process_tile.id)
-                if not process_event:
-                    self.current_processes[process_tile.id] = threading.Event()
-            # Wait and return.
-            if process_event:
-                process_event.wait()
-                return self.process_tile_cache[process_tile.id]
-            else:
-                try:
-                    output = self.execute(process_tile)
-                    self.process_tile_cache[process_tile.id] = output
-                    if self.config.mode in ["continue", "overwrite"]:
-                        self.write(process_tile, output)
-                    return self.process_tile_cache[process_tile.id]
-                finally:
-                    with self.process_lock:
-                        process_event = self.current_processes.get(
-                            process_tile.id)
-                        del self.current_processes[process_tile.id]
-                        process_event.set()
+        # Process Tile only once, also if requested by concurrent threads.
+        def _execute_and_write():
+            output = self.execute(process_tile)
+            if self.config.mode in ["continue", "overwrite"]:
+                self.write(process_tile, output)
+            return output
+        return self.process_tile_cache.get(
+            process_tile.id, _execute_and_write)
+
+    def _interpolated_from(self, zoom):
+        """Return which baselevel interpolations read tiles of zoom level."""
+        if not self.config.baselevels:
+            return []
+        zooms = self.config.baselevels["zooms"]
+        return [
+            baselevel for baselevel, dependent in [
+                ("lower", zoom - 1), ("higher", zoom + 1)
+            ]
+            if dependent in self.config.zoom_levels and (
+                dependent < min(zooms) if baselevel == "lower"
+                else dependent > max(zooms)
+            )
+        ]
+
+    def _store_baselevel_output(self, process_tile, data):
+        """Keep written output of tiles other zoom levels depend on."""
+        if not self._interpolated_from(process_tile.zoom):
+            return
+        nodata = self.config.output.nodata
+        prepared = raster.prepare_array(
+            data, masked=True, nodata=nodata,
+            dtype=self.config.output.output_params["dtype"])
+        if prepared.mask.all():
+            return
+        tile = self.config.baselevels["tile_pyramid"].tile(*process_tile.id)
+        written = ma.getdata(raster.extract_from_array(
+            in_raster=prepared, in_affine=process_tile.affine, out_tile=tile
+        )).copy()
+        # output tiles without valid pixels are not written at all
+        for output_tile in self.config.output_pyramid.intersecting(tile):
+            window = raster.extract_from_array(
+                in_raster=prepared, in_affine=process_tile.affine,
+                out_tile=output_tile)
+            if window.mask.all():
+                raster.extract_from_array(
+                    in_raster=written, in_affine=tile.affine,
+                    out_tile=output_tile
+                )[:] = nodata
+        # reading written output masks nodata values only
+        self.baselevel_store.put(
+            tile.id, ma.masked_array(
+                written, mask=np.isnan(written) if np.isnan(nodata)
+                else written == nodata))
+
+    def _read_baselevel_output(self, tile):
+        """Read output from baselevel store or from written output."""
+        if self.baselevel_store is not None:
+            data = self.baselevel_store.get(
+                tile.id,
+                # tiles only read by their parent are not needed any more
+                pop=self._interpolated_from(tile.zoom) == ["lower"])
+            if data is not None:
+                return ma.masked_array(
+                    data, fill_value=self.config.output.nodata)
+        return self.get_raw_output(tile, _baselevel_readonly=True)
 
     def _extract(self, in_tile=None, in_data=None, out_tile=None):
         """Extract data from tile."""
         if self.config.output.METADATA["data_type"] == "raster":
-            return raster.extract_from_array(
-                in_raster=raster.prepare_array(
-                    in_data, nodata=self.config.output.nodata,
-                    dtype=self.config.output.output_params["dtype"]
-                ),
-                in_affine=in_tile.affine,
+            prepared = raster.prepare_array(
+                in_data, nodata=self.config.output.nodata,
+                dtype=self.config.output.output_params["dtype"]
+            )
+            extracted = raster.extract_from_array(
+                in_raster=prepared, in_affine=in_tile.affine,
                 out_tile=out_tile
             )
+            # prepare_array() does not copy prepared data, so copy the window
+            # instead of returning a view of the (possibly cached) input data
+            if isinstance(in_data, np.ndarray) and np.may_share_memory(
+                ma.getdata(prepared), ma.getdata(in_data)
+            ):
+                return extracted.copy()
+            return extracted
         elif self.config.output.METADATA["data_type"] == "vector":
             return [
                 feature
@@ -427,45 +605,32 @@ class Mapchete(object):
                         process_tile, "higher"
                     )
                 )
-        # Otherwise, load process source and execute.
+        # Otherwise, get (cached) process source and execute.
         try:
-            user_process_py = imp.load_source(
-                self.process_name + "process_file", self.config.process_file
+            process_is_function, user_process = _load_user_process(
+                self.config.process_file, self.process_name + "process_file"
             )
-            if hasattr(user_process_py, "execute"):
-                process_is_function = True
-                tile_process = MapcheteProcess(
-                    config=self.config, tile=process_tile,
-                    params=self.config.params_at_zoom(process_tile.zoom)
-                )
-                user_execute = user_process_py.execute
-                if len(inspect.getargspec(user_execute).args) != 1:
-                    raise ImportError(
-                        "execute() function has to accept exactly one argument"
-                    )
-            elif hasattr(user_process_py, "Process"):
-                warnings.warn(
-                    """instanciating MapcheteProcess will be deprecated, """
-                    """provide execute() function instead"""
-                )
-                process_is_function = False
-                tile_process = user_process_py.Process(
-                    config=self.config, tile=process_tile,
-                    params=self.config.params_at_zoom(process_tile.zoom)
-                )
-            else:
-                raise ImportError(
-                    "No execute() function or Process object found in %s" % (
-                        self.config.process_file
-                    )
-                )
         except ImportError as e:
             raise MapcheteProcessImportError(e)
+        if process_is_function:
+            tile_process = MapcheteProcess(
+                config=self.config, tile=process_tile,
+                params=self.config.params_at_zoom(process_tile.zoom)
+            )
+        else:
+            warnings.warn(
+                """instanciating MapcheteProcess will be deprecated, """
+                """provide execute() function instead"""
+            )
+            tile_process = user_process(
+                config=self.config, tile=process_tile,
+                params=self.config.params_at_zoom(process_tile.zoom)
+            )
         try:
             starttime = time.time()
             # Actually run process.
             if process_is_function:
-                process_data = user_execute(tile_process)
+                process_data = user_process(tile_process)
             else:
                 process_data = tile_process.execute()
         except Exception as e:
@@ -505,9 +670,7 @@ class Mapchete(object):
         if baselevel == "higher":
             parent_tile = tile.get_parent()
             process_data = raster.resample_from_array(
-                in_raster=self.get_raw_output(
-                    parent_tile, _baselevel_readonly=True
-                ),
+                in_raster=self._read_baselevel_output(parent_tile),
                 in_affine=parent_tile.affine,
                 out_tile=tile,
                 resampling=self.config.baselevels["higher"],
@@ -516,10 +679,7 @@ class Mapchete(object):
         # resample from children tiles
         elif baselevel == "lower":
             mosaic, mosaic_affine = raster.create_mosaic([
-                (
-                    child_tile,
-                    self.get_raw_output(child_tile, _baselevel_readonly=True)
-                )
+                (child_tile, self._read_baselevel_output(child_tile))
                 for child_tile in self.config.baselevels["tile_pyramid"].tile(
                     *tile.id
                 ).get_children()
@@ -544,10 +704,62 @@ class Mapchete(object):
         for ip in self.config.input.values():
             if ip is not None:
                 ip.cleanup()
+        raster.DATASET_POOL.clear()
         if self.with_cache:
+            LOGGER.debug(
+                "process tile cache: %s hits, %s misses, %s evictions",
+                self.process_tile_cache.hits, self.process_tile_cache.misses,
+                self.process_tile_cache.evictions)
             self.process_tile_cache = None
-            self.current_processes = None
-            self.process_lock = None
+
+
+def _load_user_process(process_file, module_name):
+    """
+    Return user process entry point and load process file only if necessary.
+
+    The loaded and validated entry point is cached per process file and worker
+    and reused as long as the file's modification time and size do not change.
+    Changes to the process file (e.g. while using ``mapchete serve``) therefore
+    trigger a reload.
+
+    Parameters
+    ----------
+    process_file : string
+        absolute path to process file
+    module_name : string
+        name the process module is loaded as
+
+    Returns
+    -------
+    process_is_function, entry point : tuple
+        either True and the ``execute()`` function or False and the
+        ``Process`` class
+    """
+    stat = os.stat(process_file)
+    fingerprint = (stat.st_mtime, stat.st_size)
+    with _PROCESS_CACHE_LOCK:
+        cached = _PROCESS_CACHE.get(process_file)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        LOGGER.debug("load process file %s", process_file)
+        user_process_py = imp.load_source(module_name, process_file)
+        if hasattr(user_process_py, "execute"):
+            user_execute = user_process_py.execute
+            if len(_getargspec(user_execute).args) != 1:
+                raise ImportError(
+                    "execute() function has to accept exactly one argument"
+                )
+            entry_point = (True, user_execute)
+        elif hasattr(user_process_py, "Process"):
+            entry_point = (False, user_process_py.Process)
+        else:
+            raise ImportError(
+                "No execute() function or Process object found in %s" % (
+                    process_file
+                )
+            )
+        _PROCESS_CACHE[process_file] = (fingerprint, entry_point)
+        return entry_point
 
 
 class MapcheteProcess(object):
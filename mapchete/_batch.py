@@ -1,13 +1,33 @@
 """Processing of larger batches."""
 
+import functools
+import heapq
+import itertools
 import logging
+import numpy as np
+import numpy.ma as ma
+import os
+import rasterio
+import signal
+import threading
 import tqdm
 import time
-from functools import partial
-from itertools import product
-from multiprocessing import cpu_count
-from multiprocessing.pool import Pool
-from tilematrix import TilePyramid
+from collections import deque, namedtuple
+from multiprocessing import cpu_count, Queue
+from multiprocessing.pool import Pool, ThreadPool
+from multiprocessing.sharedctypes import RawArray
+from six.moves import queue
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from mapchete._cache import SharedTileStore
+from mapchete._journal import open_journal
+from mapchete._prefetch import InputPrefetcher, DEFAULT_PREFETCH_SIZE
+from mapchete.errors import MapcheteProcessException, MapcheteProcessTimeout
+from mapchete.tile import (
+    count_tiles_from_geom, curve_index, tile_ids_from_geom, TILE_ORDERS)
 
 
 LOGGER = logging.getLogger(__name__)
@@ -15,14 +35,84 @@ LOGGER = logging.getLogger(__name__)
 # maximum number of process tiles to be queued at each worker
 MAX_CHUNKSIZE = 16
 
+# available worker types: processes, threads of the main process or processes
+# running multiple threads each
+CONCURRENCY = ("processes", "threads", "hybrid")
+
+# threads per worker process if concurrency is "hybrid"
+DEFAULT_THREADS = 4
+
+# default size of shared memory keeping baselevel tiles in MB
+DEFAULT_BASELEVEL_STORE_SIZE = 256
+
+# seconds between checks for timed out tiles
+_POLL_INTERVAL = .1
+
+# signal used to stop a worker processing a timed out tile
+_KILL_SIGNAL = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+# process object, GDAL environment, output channel, tile event queue, thread
+# pool, output writer and input prefetcher of a pool worker set by
+# _worker_init()
+_WORKER_PROCESS = None
+_WORKER_ENV = None
+_WORKER_CHANNEL = None
+_WORKER_EVENTS = None
+_WORKER_THREADS = None
+_WORKER_WRITER = None
+_WORKER_PREFETCHER = None
+
+# GDAL environment of a worker thread set by _thread_init()
+_THREAD_ENV = threading.local()
+
+# Status record returned by the workers instead of the process output. status
+# is one of "skipped" (output exists in continue mode), "empty" (nothing to
+# write), "written" or "failed"; nbytes is the size of the written output
+# array and error describes why a tile failed.
+TileStatus = namedtuple(
+    "TileStatus",
+    ("tile_id", "status", "process_time", "write_time", "nbytes", "error")
+)
+TileStatus.__new__.__defaults__ = (None, )
+
+# how failing tiles are handled: per tile timeout in seconds, number of
+# retries, seconds to wait before the first retry (doubled for every further
+# retry) and whether failed tiles are collected instead of raising
+_FailurePolicy = namedtuple(
+    "_FailurePolicy", ("timeout", "retries", "retry_delay", "skip_failed")
+)
+_DEFAULT_POLICY = _FailurePolicy(None, 0, 1., False)
+
+# reference to a process output array stored in a _SharedArrayChannel slot
+_SharedArray = namedtuple(
+    "_SharedArray", ("slot", "dtype", "shape", "masked", "fill_value")
+)
+
+# returned by a worker instead of a result if a tile failed
+_TileFailure = namedtuple("_TileFailure", ("tile_id", "exception"))
+
+# TileStatus of a tile whose output is still being written by a _WriteBehind
+# writer and the AsyncResult of the write returning the write time
+_PendingWrite = namedtuple("_PendingWrite", ("status", "write"))
+
 
 def batch_process(
     process, zoom=None, tile=None, multi=cpu_count(), quiet=False, debug=False,
-    logfile=None
+    logfile=None, order=None, journal=True, timeout=None, retries=0,
+    retry_delay=1., max_tasks_per_worker=None, skip_failed=False,
+    concurrency="processes", threads=None, writers=0, prefetch=0,
+    prefetch_size=DEFAULT_PREFETCH_SIZE,
+    baselevel_store_size=DEFAULT_BASELEVEL_STORE_SIZE
 ):
     """
     Process a large batch of tiles.
 
+    Workers are either separate processes, threads of the current process or
+    processes running multiple threads each. Threads share the process object
+    including its initialized inputs and caches and suit processes spending
+    most of their time in GDAL reading and writing, as GDAL releases the
+    Python GIL.
+
     Parameters
     ----------
     process : MapcheteProcess
@@ -39,11 +129,91 @@ def batch_process(
     debug : bool
         set log level to "debug" and disable progress bar (cannot be used with
         quiet)
+    order : string
+        process tiles of a zoom level along a space filling curve (``hilbert``
+        or ``zorder``) instead of row by row, so chunks sent to a worker
+        contain neighboring tiles (default: None)
+    concurrency : string
+        ``processes`` runs multi worker processes, ``threads`` multi threads
+        in the current process and ``hybrid`` multi worker processes with
+        threads threads each (default: ``processes``)
+    threads : int
+        number of threads per worker process if concurrency is ``hybrid``
+        (default: 4)
+    writers : int
+        number of writer threads per worker process; a worker then continues
+        with the next tile while outputs are written in the background, tiles
+        are always processed in worker processes and concurrency cannot be
+        ``threads``; tiles are only reported as written once their output is
+        written (default: 0)
+    prefetch : int
+        number of upcoming tiles of a chunk whose inputs a worker reads in
+        the background while processing the current tile; tiles are then
+        always processed in worker processes and concurrency must be
+        ``processes`` (default: 0)
+    prefetch_size : float
+        maximum size of prefetched input data per worker in MB (default: 256)
+    baselevel_store_size : float
+        size in MB of the shared memory all workers keep written output of
+        tiles in, which other zoom levels are interpolated from; interpolated
+        tiles read their parent or child tiles from there and only read the
+        written output files if the tiles are not stored (anymore); only used
+        with baselevels, unbuffered GeoTIFF output and without timeout, 0
+        disables the store (default: 256)
+    journal : bool
+        record the status of each processed tile in a journal in the output
+        directory; in continue mode, tiles recorded as written or empty are
+        skipped without checking the output and failed tiles are processed
+        again (default: True)
+    timeout : float
+        seconds a tile may take before its worker is killed and replaced; tiles
+        are then always processed in worker processes and concurrency cannot
+        be ``threads``; workers report their tiles through a queue shared with
+        the main process, and killing a worker while another of its threads
+        writes to it can corrupt the queue, therefore neither ``hybrid``
+        concurrency with more than one thread nor writers can be used
+        (default: None)
+    retries : int
+        number of times a failed or timed out tile is processed again
+        (default: 0)
+    retry_delay : float
+        seconds to wait before retrying a tile the first time, doubled for
+        every further retry (default: 1)
+    max_tasks_per_worker : int
+        number of chunks of tiles a worker processes before it is replaced by
+        a fresh one; tiles are then always processed in worker processes and
+        concurrency cannot be ``threads`` (default: None)
+    skip_failed : bool
+        collect tiles still failing after all retries and continue instead of
+        raising their exception; tiles depending on a failed tile fail as well
+        (default: False)
+
+    Returns
+    -------
+    failed : list
+        TileStatus of each failed tile
     """
     if zoom and tile:
         raise ValueError("use either zoom or tile")
     if quiet and debug:
         raise ValueError("use either quiet or debug")
+    if concurrency not in CONCURRENCY:
+        raise ValueError("concurrency must be one of %s" % (CONCURRENCY, ))
+    if concurrency == "threads" and (timeout or max_tasks_per_worker):
+        raise ValueError(
+            "threads cannot be stopped, use processes with timeout or "
+            "max_tasks_per_worker")
+    if timeout and (writers or (
+        concurrency == "hybrid" and (threads or DEFAULT_THREADS) > 1
+    )):
+        raise ValueError(
+            "timeout requires single threaded worker processes without "
+            "writers")
+    if concurrency == "threads" and writers:
+        raise ValueError("writers can only be used with worker processes")
+    if concurrency != "processes" and prefetch:
+        raise ValueError(
+            "prefetch can only be used with concurrency processes")
     if quiet:
         LOGGER.setLevel(logging.ERROR)
     if debug:
@@ -59,7 +229,7 @@ def batch_process(
     # process single tile
     if tile:
         _run_on_single_tile(process, tile)
-        return
+        return []
 
     # prepare batch
     zoom_levels = list(_get_zoom_level(zoom, process))
@@ -76,78 +246,726 @@ def batch_process(
             init_zoom=0
         )
 
-    # run using multiprocessing
-    if multi > 1:
-        _run_with_multiprocessing(
-            process, total_tiles, zoom_levels, multi, quiet, debug)
+    policy = _FailurePolicy(timeout, retries, retry_delay, skip_failed)
+    tile_journal = open_journal(process, zoom_levels) if journal else None
+    # workers receive the store along with the process object
+    process.baselevel_store = _baselevel_store(
+        process, zoom_levels, int(baselevel_store_size * 1024 * 1024),
+        timeout=timeout)
+    try:
+        # run using multiprocessing; a worker can only be stopped or replaced
+        # if it is a separate process
+        if (
+            multi > 1 or timeout or max_tasks_per_worker or writers or
+            prefetch or concurrency == "hybrid"
+        ):
+            failed = _run_with_multiprocessing(
+                process, total_tiles, zoom_levels, multi, quiet, debug, order,
+                tile_journal, policy, max_tasks_per_worker, concurrency,
+                threads or DEFAULT_THREADS, writers, prefetch,
+                int(prefetch_size * 1024 * 1024))
+
+        # run without multiprocessing
+        else:
+            failed = _run_without_multiprocessing(
+                process, total_tiles, zoom_levels, quiet, debug, order,
+                tile_journal, policy)
+    finally:
+        if tile_journal is not None:
+            tile_journal.close()
+        if process.baselevel_store is not None:
+            LOGGER.debug(
+                "baselevel store: %s hits, %s misses",
+                process.baselevel_store.hits, process.baselevel_store.misses)
+            process.baselevel_store = None
+    if failed:
+        LOGGER.error("%s tile(s) failed", len(failed))
+        for status in failed:
+            LOGGER.error("%s: %s", status.tile_id, status.error)
+    return failed
+
+
+def batch_output(
+    process, zoom=None, multi=cpu_count(), slots=None, slot_size=None,
+    order=None
+):
+    """
+    Process a batch of tiles and yield the process outputs.
+
+    Like batch_process() but for consumers which need the process output
+    data. Raster outputs are passed from the workers to the main process
+    through a limited number of shared memory slots. A worker waits until a
+    slot is free, so workers cannot get ahead of a slow consumer further than
+    the number of slots. Arrays not fitting into a slot and vector outputs are
+    passed on pickled.
 
-    # run without multiprocessing
+    Parameters
+    ----------
+    process : MapcheteProcess
+        process to be run
+    zoom : list or int
+        either single zoom level or list of minimum and maximum zoom level;
+        None processes all (default: None)
+    multi : int
+        number of workers (default: number of CPU cores)
+    slots : int
+        number of shared memory slots (default: number of workers)
+    slot_size : int
+        size of one slot in bytes (default: size of a process tile array in
+        output band number and data type including its mask)
+    order : string
+        process tiles of a zoom level along a space filling curve (``hilbert``
+        or ``zorder``) instead of row by row (default: None)
+
+    Yields
+    ------
+    status, output : tuple
+        TileStatus and process output (None if tile was skipped)
+    """
+    dag = _TileDAG(process, list(_get_zoom_level(zoom, process)), order)
     if multi == 1:
-        _run_without_multiprocessing(
-            process, total_tiles, zoom_levels, quiet, debug)
+        with rasterio.Env():
+            while not dag.finished:
+                for tile_id in dag.next_chunk(1):
+                    status, output = _process_worker(
+                        process,
+                        process.config.process_pyramid.tile(*tile_id),
+                        exists_checked=dag.exists_checked(tile_id))
+                    dag.done(tile_id)
+                    yield status, output
+                for status in _unprocessed_statuses(dag):
+                    yield status, None
+        return
+    slot_size = slot_size or _default_slot_size(process)
+    channel = _SharedArrayChannel(slots or multi, slot_size) if (
+        slot_size
+    ) else None
+    pool = Pool(multi, initializer=_worker_init, initargs=(process, channel))
+    try:
+        # send tiles one by one, as a worker holding more than one slot at
+        # once could block all other workers
+        for status, output in _run_dag_on_pool(
+            pool, dag, chunksize=1, max_queued=multi * 2, with_output=True
+        ):
+            if isinstance(output, _SharedArray):
+                output = channel.get(output)
+            yield status, output
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _default_slot_size(process):
+    """Return size of a process tile array in bytes or None if not raster."""
+    output = process.config.output
+    if output.METADATA["data_type"] != "raster":
+        return None
+    pyramid = process.config.process_pyramid
+    profile = output.profile()
+    side = pyramid.tile_size * pyramid.metatiling + 2 * pyramid.pixelbuffer
+    # data and one byte per value for the mask
+    return side * side * profile.get("count", 1) * (
+        np.dtype(profile["dtype"]).itemsize + 1
+    )
+
+
+def _baselevel_store(process, zoom_levels, max_bytes, timeout=None):
+    """
+    Return SharedTileStore for baselevel interpolation or None.
+
+    Stored tiles are read instead of the written GeoTIFF files, therefore the
+    output tiles must not be buffered as their buffers would contain pixels
+    of neighbor tiles.
+
+    With a timeout, workers can be killed while holding the store lock or
+    while writing into a slot, so no store is used.
+    """
+    config = process.config
+    if (
+        not config.baselevels or
+        not max_bytes or
+        timeout or
+        config.mode not in ("continue", "overwrite") or
+        config.output.METADATA.get("driver_name") != "GTiff" or
+        config.output_pyramid.pixelbuffer
+    ):
+        return None
+    minbase = min(config.baselevels["zooms"])
+    maxbase = max(config.baselevels["zooms"])
+    if not any(
+        (zoom < minbase and zoom + 1 in zoom_levels) or
+        (zoom > maxbase and zoom - 1 in zoom_levels)
+        for zoom in zoom_levels
+    ):
+        return None
+    pyramid = config.process_pyramid
+    profile = config.output.profile()
+    side = pyramid.tile_size * pyramid.metatiling
+    # data and one byte per value for the mask
+    slot_size = side * side * profile.get("count", 1) * (
+        np.dtype(profile["dtype"]).itemsize + 1
+    )
+    slots = max_bytes // slot_size
+    if not slots:
+        return None
+    LOGGER.debug("keep up to %s baselevel tiles in shared memory", slots)
+    return SharedTileStore(slots, slot_size, profile["dtype"])
 
 
 def _run_on_single_tile(process, tile):
     LOGGER.debug("run on single tile")
-    tile, output = _process_worker(
+    status, output = _process_worker(
         process, process.config.process_pyramid.tile(*tuple(tile))
     )
     LOGGER.info("1 tile iterated")
 
 
 def _run_with_multiprocessing(
-    process, total_tiles, zoom_levels, multi, quiet, debug
+    process, total_tiles, zoom_levels, multi, quiet, debug, order=None,
+    journal=None, policy=_DEFAULT_POLICY, max_tasks_per_worker=None,
+    concurrency="processes", threads=DEFAULT_THREADS, writers=0,
+    prefetch=0, prefetch_bytes=None
 ):
     LOGGER.debug("run with multiprocessing")
     num_processed = 0
-    LOGGER.info("run process using %s workers", multi)
-    f = partial(_process_worker, process)
+    failed = []
+    # workers report which tile they are processing only if they can time out
+    events = Queue() if policy.timeout else None
     with tqdm.tqdm(
         total=total_tiles, unit="tiles", disable=(quiet or debug)
     ) as pbar:
-        for zoom in zoom_levels:
-            process_tiles = process.get_process_tiles(zoom)
-            pool = Pool(multi)
-            try:
-                for tile, output in pool.imap_unordered(
-                    f, process_tiles,
-                    # set chunksize to between 1 and MAX_CHUNKSIZE
-                    chunksize=min([
-                        max([total_tiles // multi, 1]), MAX_CHUNKSIZE
-                    ])
-                ):
-                    pbar.update()
-                    num_processed += 1
-            except KeyboardInterrupt:
+        if concurrency == "threads":
+            LOGGER.info("run process using %s threads", multi)
+            # threads share the process object, which is therefore passed
+            # along with each chunk
+            pool = ThreadPool(multi, initializer=_thread_init)
+            chunksize = _chunksize(total_tiles, multi, order)
+            worker_process = process
+        else:
+            # one pool for all zoom levels; the process object is handed over
+            # to each worker only once and from then on just tile indexes are
+            # passed
+            if concurrency == "hybrid":
                 LOGGER.info(
-                    "Caught KeyboardInterrupt, terminating workers")
-                pool.terminate()
-                break
-            except Exception:
+                    "run process using %s workers with %s threads each",
+                    multi, threads)
+                # a chunk is shared between the threads of a worker
+                chunksize = threads * _chunksize(
+                    total_tiles, multi * threads, order)
+            else:
+                LOGGER.info("run process using %s workers", multi)
+                threads = None
+                chunksize = _chunksize(total_tiles, multi, order)
+            pool = Pool(
+                multi, initializer=_worker_init,
+                initargs=(
+                    process, None, events, policy.timeout, threads, writers,
+                    prefetch, prefetch_bytes),
+                maxtasksperchild=max_tasks_per_worker
+            )
+            worker_process = None
+        try:
+            for status in _run_dag_on_pool(
+                pool, _TileDAG(process, zoom_levels, order, journal),
+                chunksize=chunksize,
+                # keep workers busy while results are being collected
+                max_queued=multi * 2, policy=policy, events=events,
+                process=worker_process
+            ):
+                if journal is not None:
+                    journal.record(status)
+                if status.status == "failed":
+                    failed.append(status)
+                pbar.update()
+                num_processed += 1
+        except KeyboardInterrupt:
+            LOGGER.info("Caught KeyboardInterrupt, terminating workers")
+            pool.terminate()
+        except Exception:
+            pool.terminate()
+            raise
+        finally:
+            if events is not None:
+                # tasks of killed workers never finish and would block join()
                 pool.terminate()
-                raise
-            finally:
-                pool.close()
-                pool.join()
-                process_tiles = None
+            pool.close()
+            pool.join()
     LOGGER.info("%s tile(s) iterated", (str(num_processed)))
+    return failed
 
 
 def _run_without_multiprocessing(
-    process, total_tiles, zoom_levels, quiet, debug
+    process, total_tiles, zoom_levels, quiet, debug, order=None, journal=None,
+    policy=_DEFAULT_POLICY
 ):
     LOGGER.debug("run without multiprocessing")
     num_processed = 0
+    failed = []
     LOGGER.info("run process using 1 worker")
+    dag = _TileDAG(process, zoom_levels, order, journal)
     with tqdm.tqdm(
         total=total_tiles, unit="tiles", disable=(quiet or debug)
     ) as pbar:
-        for zoom in zoom_levels:
-            for process_tile in process.get_process_tiles(zoom):
-                tile, output = _process_worker(process, process_tile)
-                pbar.update()
-                num_processed += 1
+        with rasterio.Env():
+            while not dag.finished:
+                for tile_id in dag.next_chunk(1):
+                    status = _process_with_retries(
+                        process, tile_id, policy, journal,
+                        dag.exists_checked(tile_id))
+                    if journal is not None:
+                        journal.record(status)
+                    if status.status == "failed":
+                        failed.append(status)
+                        dag.fail(tile_id)
+                    else:
+                        dag.done(tile_id)
+                    pbar.update()
+                    num_processed += 1
+                for status in _unprocessed_statuses(dag):
+                    if journal is not None:
+                        journal.record(status)
+                    if status.status == "failed":
+                        failed.append(status)
+                    pbar.update()
+                    num_processed += 1
     LOGGER.info("%s tile(s) iterated", (str(num_processed)))
+    return failed
+
+
+def _process_with_retries(
+    process, tile_id, policy, journal=None, exists_checked=False
+):
+    """Process tile in current process and retry if it fails."""
+    for attempt in itertools.count(1):
+        try:
+            status, _ = _process_worker(
+                process, process.config.process_pyramid.tile(*tile_id),
+                exists_checked=exists_checked)
+            return status
+        except Exception as e:
+            if attempt <= policy.retries:
+                _log_retry(tile_id, e, attempt, policy)
+                time.sleep(_retry_delay(attempt, policy))
+                continue
+            status = _failed_status(tile_id, e)
+            if policy.skip_failed:
+                return status
+            if journal is not None:
+                journal.record(status)
+            raise
+
+
+def _log_retry(tile_id, exception, attempt, policy):
+    LOGGER.warning(
+        "tile %s failed (%s), retry %s of %s", tile_id,
+        _describe(exception), attempt, policy.retries)
+
+
+def _retry_delay(attempt, policy):
+    """Return seconds to wait before retry (exponential backoff)."""
+    return policy.retry_delay * 2 ** (attempt - 1)
+
+
+def _failed_status(tile_id, exception):
+    return TileStatus(tile_id, "failed", 0., 0., 0, _describe(exception))
+
+
+def _describe(exception):
+    return "%s: %s" % (exception.__class__.__name__, exception)
+
+
+def _chunksize(total_tiles, multi, order=None):
+    """Return number of tiles sent to a worker at once."""
+    if order and not total_tiles:
+        # tiles are not counted but chunks of curve ordered tiles are
+        # spatially compact
+        return MAX_CHUNKSIZE
+    # between 1 and MAX_CHUNKSIZE
+    return min([max([total_tiles // multi, 1]), MAX_CHUNKSIZE])
+
+
+def _run_dag_on_pool(
+    pool, dag, chunksize=1, max_queued=1, with_output=False,
+    policy=_DEFAULT_POLICY, events=None, process=None
+):
+    """
+    Run ready tiles of a _TileDAG on a pool and yield results.
+
+    Chunks of ready tiles are sent to the workers as soon as all of their
+    dependencies are processed, so the pool does not have to drain between
+    zoom levels. Yields TileStatus objects or tuples of TileStatus and output
+    if with_output is set.
+
+    Failed tiles are sent again after a delay as long as the policy allows
+    retries. A tile still failing is yielded as "failed" TileStatus and its
+    exception is raised once the results of its chunk are yielded, unless the
+    policy skips failed tiles.
+
+    If the policy has a timeout, workers report the tiles they start and
+    finish through the events queue. A worker exceeding the timeout is killed
+    and replaced by the pool, its tile counts as failed and the other tiles of
+    its chunk are sent again.
+
+    The process object is sent along with each chunk if given, which is only
+    sensible for thread pools.
+    """
+    results = queue.Queue()
+    # chunk key --> tile ids of chunks sent to the pool
+    pending = {}
+    # worker pid and thread --> chunk key, tile id and start time of its
+    # current tile
+    running = {}
+    # heap of send time and id of tiles to be sent again
+    delayed = []
+    # tile id --> number of failed attempts
+    attempts = {}
+    keys = itertools.count()
+
+    def submit(chunk):
+        key = next(keys)
+        pending[key] = chunk
+        pool.apply_async(
+            _process_chunk, (
+                chunk, with_output, key, process,
+                all(dag.exists_checked(tile_id) for tile_id in chunk)),
+            callback=lambda result, key=key: results.put((key, result))
+        )
+
+    def fail(tile_id, exception):
+        # return "failed" TileStatus or None if tile will be retried
+        attempt = attempts.get(tile_id, 0) + 1
+        if attempt <= policy.retries:
+            attempts[tile_id] = attempt
+            _log_retry(tile_id, exception, attempt, policy)
+            heapq.heappush(
+                delayed, (time.time() + _retry_delay(attempt, policy), tile_id)
+            )
+            return None
+        attempts.pop(tile_id, None)
+        if policy.skip_failed:
+            dag.fail(tile_id)
+        return _failed_status(tile_id, exception)
+
+    while True:
+        while (
+            delayed and delayed[0][0] <= time.time() and
+            len(pending) < max_queued
+        ):
+            submit([heapq.heappop(delayed)[1]])
+        while len(pending) < max_queued:
+            chunk = dag.next_chunk(chunksize)
+            if not chunk:
+                break
+            submit(chunk)
+        # tiles skipped or failed by the scheduler are not sent to the workers
+        for status in _unprocessed_statuses(dag):
+            yield (status, None) if with_output else status
+        if not pending:
+            if delayed:
+                time.sleep(max([delayed[0][0] - time.time(), 0]))
+                continue
+            if dag.finished:
+                return
+            if not (dag.skipped or dag.failed):
+                raise RuntimeError(
+                    "no process tiles ready but none are running")
+            continue
+        try:
+            key, chunk_results = results.get(
+                timeout=_POLL_INTERVAL if (
+                    events is not None or delayed) else None)
+        except queue.Empty:
+            key, chunk_results = None, []
+        # results of chunks whose worker was killed are ignored
+        if pending.pop(key, None) is None:
+            chunk_results = []
+        error = None
+        for result in chunk_results:
+            if isinstance(result, _TileFailure):
+                status = fail(result.tile_id, result.exception)
+                if status is not None:
+                    yield (status, None) if with_output else status
+                    error = error or result.exception
+                continue
+            tile_id = result[0].tile_id if with_output else result.tile_id
+            attempts.pop(tile_id, None)
+            dag.done(tile_id)
+            yield result
+        if events is not None:
+            for killed, tile_id in _kill_timed_out(
+                events, running, pending, policy.timeout
+            ):
+                for other in pending.pop(killed):
+                    if other != tile_id:
+                        heapq.heappush(delayed, (0., other))
+                exception = MapcheteProcessTimeout(
+                    "tile %s exceeded timeout of %ss" % (
+                        tile_id, policy.timeout))
+                status = fail(tile_id, exception)
+                if status is not None:
+                    yield (status, None) if with_output else status
+                    error = error or exception
+        if error is not None and not policy.skip_failed:
+            raise error
+
+
+def _kill_timed_out(events, running, pending, timeout):
+    """
+    Kill workers exceeding the timeout.
+
+    Workers run a single thread which reports to the events queue, so no
+    other thread can hold the queue lock while the worker is killed. Only the
+    timed out tile is reported.
+
+    Returns
+    -------
+    killed : list
+        chunk keys and tile ids processed by killed workers
+    """
+    while True:
+        try:
+            worker, key, tile_id, start = events.get_nowait()
+        except queue.Empty:
+            break
+        if tile_id is None:
+            running.pop(worker, None)
+        else:
+            running[worker] = (key, tile_id, start)
+    killed = []
+    now = time.time()
+    for worker, (key, tile_id, start) in list(running.items()):
+        if worker not in running:
+            # thread of a worker killed already
+            continue
+        if key not in pending:
+            # events of a chunk whose results arrived already
+            del running[worker]
+        elif now - start > timeout:
+            pid = worker[0]
+            LOGGER.error(
+                "tile %s exceeded timeout of %ss, killing worker %s",
+                tile_id, timeout, pid)
+            try:
+                os.kill(pid, _KILL_SIGNAL)
+            except OSError:
+                pass
+            for other in [other for other in running if other[0] == pid]:
+                del running[other]
+            killed.append((key, tile_id))
+    return killed
+
+
+def _unprocessed_statuses(dag):
+    """Yield statuses of tiles skipped or failed by the scheduler."""
+    while dag.skipped:
+        yield TileStatus(dag.skipped.popleft(), "skipped", 0., 0., 0)
+    while dag.failed:
+        yield TileStatus(
+            dag.failed.popleft(), "failed", 0., 0., 0, "dependency failed")
+
+
+class _TileDAG(object):
+    """
+    Process tiles of a batch and their dependencies.
+
+    Without baselevels, all process tiles are independent from each other and
+    are released zoom level after zoom level without waiting for the previous
+    zoom level to finish. With baselevels, a tile below the baselevels is
+    released once all of its child tiles are processed and a tile above the
+    baselevels once its parent tile is processed.
+
+    Process tiles are enumerated lazily. Tiles of a dependent zoom level are
+    enumerated only after all tiles of the zoom level they depend on were
+    enumerated, so all dependencies are known when a tile gets enumerated.
+
+    In continue mode, existing output tiles are looked up once per zoom level
+    using the output existence index. Tiles with existing output are not
+    released for processing but are collected in skipped. Workers do not have
+    to check released tiles again if exists_checked() is True.
+
+    If order is set, the tiles of a zoom level are sorted along this space
+    filling curve (see ``mapchete.tile.curve_index()``) before being released.
+
+    If a journal is given, tiles recorded as written or empty are skipped like
+    existing tiles and tiles recorded as failed are always released.
+
+    Tiles depending on a failed tile are not released but collected in failed
+    once all of their dependencies are finished.
+    """
+
+    def __init__(self, process, zoom_levels, order=None, journal=None):
+        """Initialize."""
+        if order is not None and order not in TILE_ORDERS:
+            raise ValueError("order must be one of %s" % (TILE_ORDERS, ))
+        self.process = process
+        self.order = order
+        self.journal = journal
+        # zoom levels whose tiles were looked up in the existence index
+        self._checked_zooms = set()
+        zoom_levels = list(zoom_levels)
+        baselevels = process.config.baselevels
+        if baselevels:
+            minbase = min(baselevels["zooms"])
+            maxbase = max(baselevels["zooms"])
+            # zoom levels interpolated from the next higher zoom level
+            self._lower = set(
+                z for z in zoom_levels if z < minbase and z + 1 in zoom_levels
+            )
+            # zoom levels interpolated from the next lower zoom level
+            self._higher = set(
+                z for z in zoom_levels if z > maxbase and z - 1 in zoom_levels
+            )
+        else:
+            self._lower, self._higher = set(), set()
+        self._tiles = self._enumerate([
+            z for z in zoom_levels
+            if z not in self._lower and z not in self._higher
+        ] + sorted(self._lower, reverse=True) + sorted(self._higher))
+        self._exhausted = False
+        # tile id --> number of unfinished tiles it depends on
+        self._waiting = {}
+        # tile id --> ids of tiles depending on it
+        self._dependents = {}
+        # enumerated tiles which still wait for dependencies
+        self._blocked = set()
+        self._ready = deque()
+        # ids of tiles with existing output in continue mode
+        self.skipped = deque()
+        # ids of tiles depending on failed tiles
+        self.failed = deque()
+        self._poisoned = set()
+
+    def exists_checked(self, tile_id):
+        """Return whether released tile was checked for existing output."""
+        return tile_id[0] in self._checked_zooms
+
+    @property
+    def finished(self):
+        """Return whether all tiles were released."""
+        self._fill(1)
+        return (
+            self._exhausted and not self._ready and not self._blocked and
+            not self.skipped and not self.failed
+        )
+
+    def next_chunk(self, size):
+        """
+        Return up to size tile ids which are ready to be processed.
+
+        Returns
+        -------
+        tile ids : list
+            an empty list if no tiles are currently ready
+        """
+        self._fill(size)
+        return [
+            self._ready.popleft() for _ in range(min(size, len(self._ready)))
+        ]
+
+    def done(self, tile_id):
+        """Mark tile as processed and release tiles depending on it."""
+        self._finish(tile_id)
+
+    def fail(self, tile_id):
+        """Mark tile as failed and let tiles depending on it fail as well."""
+        self._finish(tile_id, failed=True)
+
+    def _finish(self, tile_id, failed=False):
+        for dependent in self._dependents.pop(tile_id, ()):
+            if failed:
+                self._poisoned.add(dependent)
+            self._waiting[dependent] -= 1
+            if self._waiting[dependent] == 0:
+                del self._waiting[dependent]
+                if dependent in self._blocked:
+                    self._blocked.remove(dependent)
+                    self._release(dependent)
+
+    def _release(self, tile_id):
+        if tile_id in self._poisoned:
+            self._poisoned.remove(tile_id)
+            self.failed.append(tile_id)
+            self._finish(tile_id, failed=True)
+        else:
+            self._ready.append(tile_id)
+
+    def _fill(self, size):
+        while not self._exhausted and len(self._ready) < size:
+            try:
+                tile, exists = next(self._tiles)
+            except StopIteration:
+                self._exhausted = True
+                break
+            self._add(tile, exists)
+
+    def _add(self, tile, exists=False):
+        dependents = []
+        if tile.zoom - 1 in self._lower:
+            dependents.append(tile.get_parent().id)
+        if tile.zoom + 1 in self._higher:
+            dependents.extend(child.id for child in tile.get_children())
+        if dependents:
+            self._dependents[tile.id] = dependents
+            for dependent in dependents:
+                self._waiting[dependent] = self._waiting.get(dependent, 0) + 1
+        if exists:
+            # output can be read from existing tiles by dependent tiles
+            self._poisoned.discard(tile.id)
+            self.skipped.append(tile.id)
+            self.done(tile.id)
+        elif self._waiting.get(tile.id):
+            self._blocked.add(tile.id)
+        else:
+            self._release(tile.id)
+
+    def _enumerate(self, zoom_levels):
+        output = self.process.config.output
+        for zoom in zoom_levels:
+            existing = self._existing_tiles(zoom)
+            if existing is not None:
+                self._checked_zooms.add(zoom)
+            if self.journal is not None:
+                finished = self.journal.finished(zoom)
+                failed = self.journal.failed(zoom)
+            else:
+                finished, failed = set(), set()
+            for tile in self._process_tiles(zoom):
+                if (tile.row, tile.col) in failed:
+                    yield tile, False
+                elif (tile.row, tile.col) in finished:
+                    yield tile, True
+                else:
+                    yield tile, bool(existing) and any(
+                        (output_tile.row, output_tile.col) in existing
+                        for output_tile in output.pyramid.intersecting(tile)
+                    )
+
+    def _process_tiles(self, zoom):
+        if not self.order:
+            return self.process.get_process_tiles(zoom)
+        # only rows and columns are sorted, tiles are created when released
+        config = self.process.config
+        pyramid = config.process_pyramid
+        rowcols = np.fromiter(itertools.chain.from_iterable(
+            tile_id[1:] for tile_id in tile_ids_from_geom(
+                pyramid, config.area_at_zoom(zoom), zoom)
+        ), dtype="int64").reshape(-1, 2)
+        positions = curve_index(rowcols[:, 0], rowcols[:, 1], self.order)
+        return (
+            pyramid.tile(zoom, int(row), int(col))
+            for row, col in rowcols[np.argsort(positions, kind="mergesort")]
+        )
+
+    def _existing_tiles(self, zoom):
+        if self.process.config.mode != "continue":
+            return None
+        try:
+            return self.process.config.output.existing_tiles(zoom)
+        except NotImplementedError:
+            return None
 
 
 def _get_zoom_level(zoom, process):
@@ -162,36 +980,362 @@ def _get_zoom_level(zoom, process):
         return zoom
 
 
-def _process_worker(process, process_tile):
-    """Worker function running the process."""
+def _worker_init(
+    process, channel=None, events=None, timeout=None, threads=None,
+    writers=None, prefetch=None, prefetch_bytes=None
+):
+    """
+    Initialize worker once when pool is started.
+
+    The process object (including its configuration and initialized inputs) is
+    kept for the lifetime of the worker and a GDAL environment is opened which
+    gets reused by all subsequent reads and writes. If a tile timeout is set,
+    GDAL network requests time out as well. If threads is set, the worker
+    processes the tiles of a chunk using a pool of this many threads. If
+    writers is set, outputs are written by this many background threads. If
+    prefetch is set, inputs of this many upcoming tiles are read ahead.
+    """
+    global _WORKER_PROCESS, _WORKER_ENV, _WORKER_CHANNEL, _WORKER_EVENTS
+    global _WORKER_THREADS, _WORKER_WRITER, _WORKER_PREFETCHER
+    _WORKER_PROCESS = process
+    _WORKER_CHANNEL = channel
+    _WORKER_EVENTS = events
+    _WORKER_ENV = _gdal_env(timeout)
+    _WORKER_ENV.__enter__()
+    _WORKER_THREADS = ThreadPool(
+        threads, initializer=_thread_init, initargs=(timeout, )
+    ) if threads else None
+    _WORKER_WRITER = _WriteBehind(
+        process, writers, timeout=timeout) if writers else None
+    _WORKER_PREFETCHER = InputPrefetcher(
+        process, prefetch, max_bytes=prefetch_bytes or (
+            DEFAULT_PREFETCH_SIZE * 1024 * 1024),
+        initializer=_thread_init, initargs=(timeout, )
+    ) if prefetch else None
+
+
+def _thread_init(timeout=None):
+    """
+    Initialize worker thread.
+
+    GDAL environments and their options are bound to the thread which opened
+    them, so each thread opens its own environment.
+    """
+    _THREAD_ENV.env = _gdal_env(timeout)
+    _THREAD_ENV.env.__enter__()
+
+
+def _gdal_env(timeout=None):
+    """Return GDAL environment for a worker."""
+    return rasterio.Env(
+        GDAL_HTTP_TIMEOUT=max([int(timeout), 1])
+    ) if timeout else rasterio.Env()
+
+
+def _process_worker_from_id(
+    tile_id, with_output=False, process=None, key=None, exists_checked=False
+):
+    """
+    Worker function running the process using only the tile index.
+
+    The process object of the worker is used unless a process is given. Only
+    the TileStatus is returned unless with_output is set. Then a tuple of
+    TileStatus and the process output is returned and raster outputs are
+    stored in the shared memory channel if available.
+
+    If the worker has a writer and uses its own process object, the output is
+    handed over to the writer and a _PendingWrite is returned instead of the
+    TileStatus.
+    """
+    writer = _WORKER_WRITER if process is None and not with_output else None
+    if process is None:
+        process = _WORKER_PROCESS
+    status, output = _process_worker(
+        process, process.config.process_pyramid.tile(*tile_id), writer, key,
+        exists_checked
+    )
+    if not with_output:
+        return status
+    if _WORKER_CHANNEL is not None and isinstance(output, np.ndarray):
+        output = _WORKER_CHANNEL.put(output) or output
+    return status, output
+
+
+def _process_chunk(
+    tile_ids, with_output=False, key=None, process=None, exists_checked=False
+):
+    """
+    Worker function processing a chunk of tiles.
+
+    The tiles are processed by the thread pool of the worker if it has one.
+    Otherwise they are processed one after another and the worker's
+    prefetcher reads the inputs of the next tiles in the meantime. A failing
+    tile does not stop the chunk but is returned as _TileFailure.
+
+    Results are returned once all outputs of the chunk are written, so the
+    main process never sees a tile as written before its output exists.
+
+    If exists_checked is set, the scheduler already skipped tiles with
+    existing output and the tiles are not checked again.
+    """
+    if _WORKER_THREADS is not None and process is None:
+        results = _WORKER_THREADS.map(
+            functools.partial(
+                _process_tile_id, with_output=with_output, key=key,
+                exists_checked=exists_checked),
+            tile_ids, chunksize=1)
+    else:
+        prefetcher = _WORKER_PREFETCHER if process is None else None
+        results = []
+        for i, tile_id in enumerate(tile_ids):
+            if prefetcher is not None:
+                prefetcher.prefetch(tile_ids[i:i + 1 + prefetcher.depth])
+            results.append(_process_tile_id(
+                tile_id, with_output, key, process, exists_checked))
+        if prefetcher is not None:
+            # the next chunk is not known yet
+            prefetcher.prefetch([])
+    return [_wait_written(result) for result in results]
+
+
+def _process_tile_id(
+    tile_id, with_output=False, key=None, process=None, exists_checked=False
+):
+    """Process tile and return result or _TileFailure."""
+    _report(key, tile_id)
+    try:
+        return _process_worker_from_id(
+            tile_id, with_output, process, key, exists_checked)
+    except Exception as e:
+        # apply_async() does not provide an error callback on all Python
+        # versions, therefore the exception is returned and raised by the
+        # main process
+        LOGGER.exception(e)
+        return _TileFailure(tile_id, _picklable(e))
+    finally:
+        _report(key)
+
+
+def _wait_written(result):
+    """Return TileStatus including write time or _TileFailure."""
+    if not isinstance(result, _PendingWrite):
+        return result
+    try:
+        return result.status._replace(write_time=result.write.get())
+    except Exception as e:
+        LOGGER.exception(e)
+        return _TileFailure(result.status.tile_id, _picklable(e))
+
+
+def _report(key, tile_id=None):
+    """Send start or, without tile_id, end of a tile to main process."""
+    if _WORKER_EVENTS is not None:
+        _WORKER_EVENTS.put((
+            (os.getpid(), threading.current_thread().ident), key, tile_id,
+            time.time()
+        ))
+
+
+def _picklable(exception):
+    """Return exception or MapcheteProcessException if it cannot be pickled."""
+    try:
+        pickle.loads(pickle.dumps(exception, pickle.HIGHEST_PROTOCOL))
+        return exception
+    except Exception:
+        return MapcheteProcessException(_describe(exception))
+
+
+def _process_worker(
+    process, process_tile, writer=None, key=None, exists_checked=False
+):
+    """
+    Worker function running the process.
+
+    If a _WriteBehind writer is given, the output is queued there and the
+    returned status is a _PendingWrite. In continue mode, tiles with existing
+    output are skipped unless exists_checked is set because the scheduler
+    already did this.
+
+    Returns
+    -------
+    status, output : tuple
+        TileStatus and process output (None if tile was skipped)
+    """
     # Skip execution if overwrite is disabled and tile exists
-    if process.config.mode == "continue" and (
+    if process.config.mode == "continue" and not exists_checked and (
         process.config.output.tiles_exist(process_tile)
     ):
         LOGGER.debug((process_tile.id, "tile exists, skipping"))
-        return process_tile, None
-    else:
-        start = time.time()
-        output = process.execute(process_tile)
-        LOGGER.debug((
-            process_tile.id, "processed in %ss" % (
-                round(time.time() - start, 3))))
-        _write_worker(process, process_tile, output)
-        return process_tile, output
+        return TileStatus(process_tile.id, "skipped", 0., 0., 0), None
+    start = time.time()
+    output = process.execute(process_tile)
+    process_time = time.time() - start
+    LOGGER.debug((
+        process_tile.id, "processed in %ss" % round(process_time, 3)))
+    if _is_empty(output):
+        LOGGER.debug("%s nothing written, tile data empty", process_tile.id)
+        return TileStatus(
+            process_tile.id, "empty", process_time, 0., 0
+        ), output
+    nbytes = output.nbytes if isinstance(output, np.ndarray) else 0
+    if writer is not None:
+        return _PendingWrite(
+            TileStatus(process_tile.id, "written", process_time, 0., nbytes),
+            writer.write(process_tile, output, key)
+        ), output
+    write_time = _write_worker(process, process_tile, output)
+    return TileStatus(
+        process_tile.id, "written", process_time, write_time, nbytes
+    ), output
 
 
 def _write_worker(process, process_tile, data):
-    """Worker function writing process outputs."""
+    """Worker function writing process outputs and returning write time."""
+    start = time.time()
+    # _process_worker() or the scheduler already checked for existing output
+    process.write(process_tile, data, _exists_checked=True)
+    elapsed = time.time() - start
+    LOGGER.debug((
+        process_tile.id, "output written in %ss" % round(elapsed, 3)))
+    return elapsed
+
+
+def _is_empty(data):
+    """Return whether process output contains nothing to be written."""
     if data is None:
-        LOGGER.debug("%s nothing written, tile data empty", process_tile.id)
-    else:
-        start = time.time()
-        process.write(process_tile, data)
-        LOGGER.debug((
-            process_tile.id, "output written in %ss" % (
-                round(time.time() - start, 3)
-            )
-        ))
+        return True
+    elif isinstance(data, ma.MaskedArray):
+        return bool(ma.getmaskarray(data).all())
+    elif isinstance(data, np.ndarray):
+        return data.size == 0
+    elif isinstance(data, list):
+        return len(data) == 0
+    return False
+
+
+class _WriteBehind(object):
+    """
+    Write process outputs of a worker in background threads.
+
+    write() returns as soon as the output is queued, so compression and
+    storage latency overlap with processing the next tile. It blocks while
+    the maximum number of outputs is queued or being written, which limits
+    the memory held by unwritten outputs.
+
+    Parameters
+    ----------
+    process : Mapchete
+        process writing the outputs
+    threads : int
+        number of writer threads
+    queue_size : int
+        maximum number of outputs queued or being written (default: twice the
+        number of threads)
+    timeout : float
+        tile timeout used for GDAL network requests (default: None)
+    """
+
+    def __init__(self, process, threads, queue_size=None, timeout=None):
+        """Initialize."""
+        self.process = process
+        self._pool = ThreadPool(
+            threads, initializer=_thread_init, initargs=(timeout, ))
+        self._slots = threading.Semaphore(queue_size or threads * 2)
+
+    def write(self, process_tile, data, key=None):
+        """
+        Queue output to be written.
+
+        Returns
+        -------
+        write : AsyncResult
+            get() returns the write time or raises the write exception
+        """
+        self._slots.acquire()
+        try:
+            return self._pool.apply_async(
+                self._write, (process_tile, data, key))
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _write(self, process_tile, data, key):
+        _report(key, process_tile.id)
+        try:
+            return _write_worker(self.process, process_tile, data)
+        finally:
+            _report(key)
+            self._slots.release()
+
+
+class _SharedArrayChannel(object):
+    """
+    Pass process output arrays from pool workers to the main process.
+
+    Arrays are copied into a fixed number of shared memory slots instead of
+    being pickled through the pool result pipe. put() blocks until a slot is
+    free and get() copies the array out of its slot and frees the slot again.
+
+    Parameters
+    ----------
+    slots : int
+        number of slots
+    slot_size : int
+        size of one slot in bytes
+    """
+
+    def __init__(self, slots, slot_size):
+        """Initialize."""
+        self.slot_size = slot_size
+        self._slots = [RawArray("B", slot_size) for _ in range(slots)]
+        self._free = Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+
+    def put(self, array):
+        """
+        Store array in next free slot.
+
+        Returns
+        -------
+        reference : _SharedArray
+            None if array does not fit into a slot
+        """
+        masked = isinstance(array, ma.MaskedArray)
+        if array.dtype.hasobject or array.nbytes + (
+            array.size if masked else 0
+        ) > self.slot_size:
+            return None
+        slot = self._free.get()
+        buf = np.frombuffer(self._slots[slot], dtype="uint8")
+        data = np.ascontiguousarray(ma.getdata(array)).view("uint8").ravel()
+        buf[:data.size] = data
+        if masked:
+            buf[data.size:data.size + array.size] = ma.getmaskarray(
+                array).view("uint8").ravel()
+        return _SharedArray(
+            slot, array.dtype.str, array.shape, masked,
+            array.fill_value if masked else None
+        )
+
+    def get(self, reference):
+        """Return a copy of the referenced array and free its slot."""
+        try:
+            dtype = np.dtype(reference.dtype)
+            size = int(np.prod(reference.shape))
+            buf = np.frombuffer(self._slots[reference.slot], dtype="uint8")
+            nbytes = size * dtype.itemsize
+            data = buf[:nbytes].view(dtype).reshape(reference.shape).copy()
+            if reference.masked:
+                return ma.masked_array(
+                    data,
+                    mask=buf[nbytes:nbytes + size].view(bool).reshape(
+                        reference.shape).copy(),
+                    fill_value=reference.fill_value
+                )
+            return data
+        finally:
+            self._free.put(reference.slot)
 
 
 def count_tiles(geometry, pyramid, minzoom, maxzoom, init_zoom=0):
@@ -212,48 +1356,7 @@ def count_tiles(geometry, pyramid, minzoom, maxzoom, init_zoom=0):
     """
     if not 0 <= init_zoom <= minzoom <= maxzoom:
         raise ValueError("invalid zoom levels given")
-    # tile buffers are not being taken into account
-    unbuffered_pyramid = TilePyramid(
-        pyramid.grid, tile_size=pyramid.tile_size,
-        metatiling=pyramid.metatiling
+    return sum(
+        count_tiles_from_geom(pyramid, geometry, zoom)
+        for zoom in range(minzoom, maxzoom + 1)
     )
-    # make sure no rounding errors occur
-    geometry = geometry.buffer(-0.000000001)
-    return _count_tiles(
-        [
-            unbuffered_pyramid.tile(*tile_id)
-            for tile_id in product(
-                [init_zoom],
-                range(pyramid.matrix_height(init_zoom)),
-                range(pyramid.matrix_width(init_zoom))
-            )
-        ], geometry, minzoom, maxzoom
-    )
-
-
-def _count_tiles(tiles, geometry, minzoom, maxzoom):
-    count = 0
-    for tile in tiles:
-        # determine data covered by tile
-        tile_intersection = tile.bbox().intersection(geometry)
-        # skip if there is no data
-        if tile_intersection.is_empty:
-            continue
-        # increase counter as tile contains data
-        elif tile.zoom >= minzoom:
-            count += 1
-        # if there are further zoom levels, analyze descendants
-        if tile.zoom < maxzoom:
-            # if tile is full, all of its descendants will be full as well
-            if tile.zoom >= minzoom and tile_intersection.equals(tile.bbox()):
-                # sum up tiles for each remaining zoom level
-                count += sum([
-                     4**z_diff
-                     for z_diff in range(1, (maxzoom - tile.zoom) + 1)
-                ])
-            # if tile is half full, analyze each descendant
-            else:
-                count += _count_tiles(
-                    tile.get_children(), tile_intersection, minzoom, maxzoom
-                )
-    return count
@@ -0,0 +1,690 @@
+"""Memory bounded and thread-safe cache for process output."""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import uuid
+import numpy as np
+import numpy.ma as ma
+import yaml
+from cachetools import LRUCache
+from collections import OrderedDict
+from multiprocessing.sharedctypes import RawArray, RawValue
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+LOGGER = logging.getLogger(__name__)
+
+# default cache budgets in bytes
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+DEFAULT_CACHE_SHARDS = 16
+DEFAULT_SPILL_SIZE = 4 * 1024 * 1024 * 1024
+
+_SPILL_EXTENSIONS = (".npy", ".mask.npy", ".pkl")
+
+
+class ProcessTileCache(object):
+    """
+    Cache process output limited by its estimated memory size.
+
+    Entries are distributed over a number of shards, each of them being a LRU
+    cache with its own lock. All shards share one memory budget: if it is
+    exceeded, least recently used entries of the largest other shards are
+    evicted first. If multiple threads request the same missing tile, the
+    output is computed only once and the other threads wait for the result.
+
+    Parameters
+    ----------
+    max_bytes : integer
+        memory budget in bytes (default: 512 MB)
+    shards : integer
+        number of independently locked cache partitions (default: 16)
+    spill : DiskSpillCache
+        optional second tier receiving evicted entries and entries too large
+        for the memory budget (default: None)
+
+    Attributes
+    ----------
+    max_bytes : integer
+        memory budget in bytes
+    spill : DiskSpillCache or None
+        second cache tier
+    """
+
+    def __init__(
+        self, max_bytes=DEFAULT_CACHE_SIZE, shards=DEFAULT_CACHE_SHARDS,
+        spill=None
+    ):
+        """Initialize empty cache."""
+        if max_bytes < 0:
+            raise ValueError("max_bytes must not be negative")
+        if shards < 1:
+            raise ValueError("at least one shard is required")
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self._shards = [_CacheShard(max_bytes) for _ in range(shards)]
+        self._trim_lock = threading.Lock()
+
+    def get(self, key, func):
+        """
+        Return cached value or compute and cache it.
+
+        Parameters
+        ----------
+        key : hashable
+            cache key, e.g. a tile ID
+        func : callable
+            function without arguments returning the value if it is not cached
+
+        Returns
+        -------
+        value
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            try:
+                value = shard.cache[key]
+                shard.hits += 1
+                return value
+            except KeyError:
+                pass
+            flight = shard.in_flight.get(key)
+            if flight is None:
+                flight = shard.in_flight[key] = _Flight()
+                shard.misses += 1
+                owner = True
+            else:
+                shard.hits += 1
+                owner = False
+        if not owner:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = self._get_spilled(key, func)
+            with shard.lock:
+                evicted = shard.put(key, flight.value)
+            self._spill(evicted)
+            self._spill(self._trim(shard))
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with shard.lock:
+                del shard.in_flight[key]
+            flight.event.set()
+
+    def __getstate__(self):
+        """Pickle settings only, e.g. when passed on to a worker process."""
+        return dict(
+            max_bytes=self.max_bytes, shards=len(self._shards),
+            spill=self.spill)
+
+    def __setstate__(self, state):
+        """Initialize empty cache from pickled settings."""
+        self.__init__(**state)
+
+    def __contains__(self, key):
+        """Return whether key is cached."""
+        shard = self._shard(key)
+        with shard.lock:
+            return key in shard.cache
+
+    def __len__(self):
+        """Return number of cached entries."""
+        return sum(self._collect(lambda s: len(s.cache)))
+
+    def clear(self):
+        """Remove all cached entries."""
+        for shard in self._shards:
+            with shard.lock:
+                shard.cache.clear()
+
+    @property
+    def currsize(self):
+        """Estimated size of cached entries in bytes."""
+        return sum(self._collect(lambda s: s.cache.currsize))
+
+    @property
+    def hits(self):
+        """Number of requests served without computing the value."""
+        return sum(self._collect(lambda s: s.hits))
+
+    @property
+    def misses(self):
+        """Number of requests which had to compute the value."""
+        return sum(self._collect(lambda s: s.misses))
+
+    @property
+    def evictions(self):
+        """Number of entries removed to stay within the memory budget."""
+        return sum(self._collect(lambda s: s.cache.evictions))
+
+    def _get_spilled(self, key, func):
+        if self.spill is not None:
+            try:
+                return self.spill.get(key)
+            except KeyError:
+                pass
+        return func()
+
+    def _spill(self, items):
+        if self.spill is not None:
+            for key, value in items:
+                self.spill.put(key, value)
+
+    def _trim(self, current):
+        """Evict entries from all shards until the budget is met."""
+        evicted = []
+        with self._trim_lock:
+            while True:
+                sizes = list(self._collect(lambda s: s.cache.currsize))
+                if sum(sizes) <= self.max_bytes:
+                    return evicted
+                # prefer evicting from other shards than the one just filled
+                _, _, i = max(
+                    (shard is not current, size, i)
+                    for i, (shard, size) in enumerate(zip(self._shards, sizes))
+                    if size)
+                shard = self._shards[i]
+                with shard.lock:
+                    if shard.cache:
+                        evicted.extend(shard.evict())
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _collect(self, func):
+        for shard in self._shards:
+            with shard.lock:
+                yield func(shard)
+
+
+class _CacheShard(object):
+    """LRU cache partition with its own lock and counters."""
+
+    def __init__(self, max_bytes):
+        self.cache = _CountingLRUCache(maxsize=max_bytes, getsizeof=sizeof)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, key, value):
+        """Add entry and return evicted and rejected entries."""
+        try:
+            self.cache[key] = value
+        except ValueError:
+            LOGGER.debug("%s too large to be cached", key)
+            return [(key, value)]
+        evicted, self.cache.evicted = self.cache.evicted, []
+        return evicted
+
+    def evict(self):
+        """Remove least recently used entry and return evicted entries."""
+        self.cache.popitem()
+        evicted, self.cache.evicted = self.cache.evicted, []
+        return evicted
+
+
+class _CountingLRUCache(LRUCache):
+    """LRU cache counting and collecting evicted entries."""
+
+    def __init__(self, *args, **kwargs):
+        super(_CountingLRUCache, self).__init__(*args, **kwargs)
+        self.evictions = 0
+        self.evicted = []
+
+    def popitem(self):
+        item = super(_CountingLRUCache, self).popitem()
+        self.evictions += 1
+        self.evicted.append(item)
+        return item
+
+
+class DiskSpillCache(object):
+    """
+    Cache process output as files in a local directory.
+
+    Arrays are stored as ``.npy`` files (masks in a separate ``.mask.npy``
+    file) and are mapped back into memory instead of being read, all other
+    output (e.g. feature lists) is pickled. Files are named after a hash of
+    the namespace and the key, therefore entries of other process files or
+    configurations are never returned. If the directory exceeds its size
+    limit, the least recently used entries are removed. Existing entries are
+    reused if a cache is initialized on a directory which is not empty.
+
+    Parameters
+    ----------
+    path : string
+        cache directory, will be created if necessary
+    max_bytes : integer
+        size limit in bytes (default: 4 GB)
+    namespace : string
+        identifies the process which created the entries (see
+        ``cache_namespace()``)
+
+    Attributes
+    ----------
+    path : string
+        cache directory
+    max_bytes : integer
+        size limit in bytes
+    currsize : integer
+        current size of cached files in bytes
+    hits, misses, evictions : integer
+        counters
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_SPILL_SIZE, namespace=""):
+        """Initialize cache and index existing entries."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # entry name and size in bytes, least recently used first
+        self._index = OrderedDict()
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+        self._scan()
+
+    def get(self, key):
+        """
+        Return cached value.
+
+        Parameters
+        ----------
+        key : hashable
+
+        Returns
+        -------
+        value
+
+        Raises
+        ------
+        KeyError if entry is not cached
+        """
+        name = self._name(key)
+        with self._lock:
+            if name not in self._index:
+                self.misses += 1
+                raise KeyError(key)
+            self._index[name] = self._index.pop(name)
+        try:
+            value = self._load(name)
+            os.utime(self._base(name) + self._primary(name), None)
+        except (IOError, OSError, ValueError, EOFError):
+            LOGGER.debug("cannot load %s from %s", key, self.path)
+            with self._lock:
+                self._drop(name)
+                self.misses += 1
+            raise KeyError(key)
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Write value to cache directory.
+
+        Parameters
+        ----------
+        key : hashable
+        value : process output
+        """
+        name = self._name(key)
+        with self._lock:
+            if name in self._index:
+                self._index[name] = self._index.pop(name)
+                return
+        try:
+            size = self._dump(name, value)
+        except (IOError, OSError, pickle.PicklingError):
+            LOGGER.warning("cannot spill %s to %s", key, self.path)
+            return
+        with self._lock:
+            if name not in self._index:
+                self._index[name] = size
+                self.currsize += size
+            self._evict()
+
+    def __getstate__(self):
+        """Pickle settings only, e.g. when passed on to a worker process."""
+        return dict(
+            path=self.path, max_bytes=self.max_bytes, namespace=self.namespace)
+
+    def __setstate__(self, state):
+        """Initialize cache from pickled settings and index entries."""
+        self.__init__(**state)
+
+    def __contains__(self, key):
+        """Return whether key is cached."""
+        with self._lock:
+            return self._name(key) in self._index
+
+    def __len__(self):
+        """Return number of cached entries."""
+        return len(self._index)
+
+    def _name(self, key):
+        return hashlib.sha1(
+            ("%s %r" % (self.namespace, key)).encode("utf-8")).hexdigest()
+
+    def _base(self, name):
+        return os.path.join(self.path, name)
+
+    def _primary(self, name):
+        if os.path.exists(self._base(name) + ".pkl"):
+            return ".pkl"
+        return ".npy"
+
+    def _dump(self, name, value):
+        base = self._base(name)
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            if isinstance(value, ma.MaskedArray):
+                _write_file(base + ".mask.npy", np.save, ma.getmask(value))
+                data = value.data
+            else:
+                data = value
+            # data file is written last as it marks a complete entry
+            _write_file(base + ".npy", np.save, data)
+        else:
+            _write_file(
+                base + ".pkl", lambda f, v: pickle.dump(
+                    v, f, protocol=pickle.HIGHEST_PROTOCOL),
+                value)
+        return sum(
+            os.path.getsize(base + ext) for ext in _SPILL_EXTENSIONS
+            if os.path.exists(base + ext))
+
+    def _load(self, name):
+        base = self._base(name)
+        if os.path.exists(base + ".pkl"):
+            with open(base + ".pkl", "rb") as src:
+                return pickle.load(src)
+        # copy on write mappings do not change cached files
+        data = np.load(base + ".npy", mmap_mode="c")
+        if not os.path.exists(base + ".mask.npy"):
+            return data
+        mask = np.load(base + ".mask.npy", mmap_mode="c")
+        return ma.masked_array(
+            data, mask=mask if mask.ndim else ma.nomask, copy=False)
+
+    def _drop(self, name):
+        self.currsize -= self._index.pop(name, 0)
+        for ext in _SPILL_EXTENSIONS:
+            try:
+                os.remove(self._base(name) + ext)
+            except OSError:
+                pass
+
+    def _evict(self):
+        while self.currsize > self.max_bytes and self._index:
+            name = next(iter(self._index))
+            self._drop(name)
+            self.evictions += 1
+
+    def _scan(self):
+        entries = {}
+        for filename in os.listdir(self.path):
+            path = os.path.join(self.path, filename)
+            name, ext = filename.split(".", 1) if "." in filename else (
+                filename, "")
+            if ext.endswith(".tmp"):
+                # leftover from an interrupted write
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            elif "." + ext not in _SPILL_EXTENSIONS:
+                continue
+            stat = os.stat(path)
+            size, mtime = entries.get(name, (0, 0))
+            entries[name] = (size + stat.st_size, max(mtime, stat.st_mtime))
+        for name, (size, _) in sorted(
+            entries.items(), key=lambda entry: entry[1][1]
+        ):
+            self._index[name] = size
+            self.currsize += size
+        self._evict()
+
+
+class SharedTileStore(object):
+    """
+    Keep raster tiles in shared memory for other worker processes.
+
+    The store consists of a fixed number of equally sized slots allocated
+    when it is created, so it can be handed over to pool workers on startup
+    and used by all their processes and threads. A tile occupies one slot
+    including its mask. If all slots are occupied, the least recently used
+    tile is replaced. Tiles are copied into and out of the store, so stored
+    tiles are never changed by their readers.
+
+    Parameters
+    ----------
+    slots : integer
+        number of tiles the store can hold
+    slot_size : integer
+        size of one slot in bytes
+    dtype : string
+        data type of stored arrays
+
+    Attributes
+    ----------
+    slot_size : integer
+        size of one slot in bytes
+    dtype : ``numpy.dtype``
+        data type of stored arrays
+    hits, misses : integer
+        counters of the current process
+    """
+
+    # zoom, row, col, bands, height and width of each slot
+    _FIELDS = 6
+
+    def __init__(self, slots, slot_size, dtype):
+        """Allocate empty store."""
+        if slots < 1:
+            raise ValueError("at least one slot is required")
+        self.slot_size = slot_size
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self._buffer = RawArray("B", slots * slot_size)
+        self._index = RawArray("q", [-1] * slots * self._FIELDS)
+        # last access of each slot, used to replace the least recently used
+        self._used = RawArray("q", slots)
+        self._clock = RawValue("q", 0)
+        self._lock = multiprocessing.Lock()
+
+    def put(self, tile_id, array):
+        """
+        Store a copy of a 3D array.
+
+        Arrays not fitting into a slot are not stored.
+
+        Parameters
+        ----------
+        tile_id : tuple
+            zoom, row and column of tile
+        array : ``numpy.ma.MaskedArray``
+        """
+        bands, height, width = array.shape
+        size = array.size
+        if size * (self.dtype.itemsize + 1) > self.slot_size:
+            LOGGER.debug("%s too large to be stored", tile_id)
+            return
+        with self._lock:
+            slot = self._find(tile_id)
+            if slot is None:
+                slot = int(np.argmin(self._used_array()))
+            index = self._index_array()
+            index[slot] = tuple(tile_id) + (bands, height, width)
+            data, mask = self._views(slot, array.shape)
+            data[:] = ma.getdata(array)
+            mask[:] = ma.getmaskarray(array)
+            self._touch(slot)
+
+    def get(self, tile_id, pop=False):
+        """
+        Return a copy of a stored array.
+
+        Parameters
+        ----------
+        tile_id : tuple
+            zoom, row and column of tile
+        pop : bool
+            remove tile from store (default: False)
+
+        Returns
+        -------
+        array : ``numpy.ma.MaskedArray`` or None
+            None if tile is not stored
+        """
+        with self._lock:
+            slot = self._find(tile_id)
+            if slot is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            data, mask = self._views(
+                slot, tuple(self._index_array()[slot, 3:]))
+            array = ma.masked_array(data.copy(), mask=mask.copy())
+            if pop:
+                self._index_array()[slot] = -1
+                self._used_array()[slot] = 0
+            else:
+                self._touch(slot)
+            return array
+
+    def __contains__(self, tile_id):
+        """Return whether tile is stored."""
+        with self._lock:
+            return self._find(tile_id) is not None
+
+    def __len__(self):
+        """Return number of stored tiles."""
+        with self._lock:
+            return int((self._index_array()[:, 0] >= 0).sum())
+
+    def _find(self, tile_id):
+        slots = np.flatnonzero(
+            (self._index_array()[:, :3] == tuple(tile_id)).all(axis=1))
+        return int(slots[0]) if len(slots) else None
+
+    def _touch(self, slot):
+        self._clock.value += 1
+        self._used_array()[slot] = self._clock.value
+
+    def _index_array(self):
+        return np.frombuffer(self._index, dtype="int64").reshape(
+            -1, self._FIELDS)
+
+    def _used_array(self):
+        return np.frombuffer(self._used, dtype="int64")
+
+    def _views(self, slot, shape):
+        size = int(np.prod(shape))
+        nbytes = size * self.dtype.itemsize
+        buf = np.frombuffer(
+            self._buffer, dtype="uint8", count=self.slot_size,
+            offset=slot * self.slot_size)
+        return (
+            buf[:nbytes].view(self.dtype).reshape(shape),
+            buf[nbytes:nbytes + size].view(bool).reshape(shape)
+        )
+
+
+def cache_namespace(process_file, params):
+    """
+    Return hash identifying a process file and its parameters.
+
+    Parameters
+    ----------
+    process_file : string
+        path to process file
+    params : dict
+        process configuration
+
+    Returns
+    -------
+    hex digest : string
+    """
+    hasher = hashlib.sha1()
+    with open(process_file, "rb") as src:
+        hasher.update(src.read())
+    dumped = yaml.dump(params, default_flow_style=False)
+    hasher.update(
+        dumped if isinstance(dumped, bytes) else dumped.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _write_file(path, writer, value):
+    """Write to temporary file first and rename when done."""
+    tmp_path = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+    try:
+        with open(tmp_path, "wb") as dst:
+            writer(dst, value)
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _Flight(object):
+    """Computation of a value other threads can wait for."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def sizeof(value):
+    """
+    Estimate memory size of process output.
+
+    Arrays are measured by their buffers including masks, feature lists by
+    the size of their geometries and properties.
+
+    Parameters
+    ----------
+    value : process output
+        array, tuple of arrays, list of features or any other object
+
+    Returns
+    -------
+    size in bytes : integer
+    """
+    if isinstance(value, ma.MaskedArray):
+        mask = ma.getmask(value)
+        return value.data.nbytes + (
+            0 if mask is ma.nomask else mask.nbytes)
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(i) for i in value)
+    elif isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sizeof(v) for v in value.values())
+    elif hasattr(value, "wkb"):
+        # shapely geometry
+        return sys.getsizeof(value) + len(value.wkb)
+    else:
+        return sys.getsizeof(value)
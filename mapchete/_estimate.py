@@ -0,0 +1,265 @@
+"""Estimate runtime and output size of a process from a sample of tiles."""
+
+import logging
+import math
+import numpy as np
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from copy import deepcopy
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+import mapchete
+from mapchete._batch import _is_empty
+from mapchete.config import _config_to_dict
+from mapchete.tile import count_tiles_from_geom, tile_ids_from_geom
+
+LOGGER = logging.getLogger(__name__)
+
+# normal quantile of the 95% confidence intervals
+_Z_95 = 1.96
+
+# Extrapolated process totals. Times are in hours of one worker, intervals are
+# (lower, upper) bounds of the 95% confidence interval (None if it cannot be
+# estimated because a zoom level has only one sample out of multiple tiles),
+# peak_memory is the peak resident memory in bytes of the process running the
+# samples (None if not available) and zooms maps each zoom level to its number
+# of tiles and samples.
+Estimate = namedtuple(
+    "Estimate", (
+        "tiles", "samples", "read_hours", "process_hours", "write_hours",
+        "cpu_hours", "cpu_hours_interval", "output_bytes",
+        "output_bytes_interval", "peak_memory", "zooms"
+    )
+)
+
+
+def estimate(
+    config, zoom=None, bounds=None, samples=10, seed=None,
+    single_input_file=None
+):
+    """
+    Estimate runtime and output size of a process.
+
+    A stratified random sample of process tiles is run per zoom level: the
+    tiles of a zoom level are divided into as many consecutive strata as there
+    are samples and one tile is drawn from every stratum. Reading inputs,
+    running the process and writing the output are timed separately. Output
+    is written into a temporary directory which is removed afterwards.
+
+    The totals are extrapolated using the number of tiles per zoom level. Tiles
+    interpolated from baselevels only read the sampled output and will be
+    underestimated.
+
+    Parameters
+    ----------
+    config : string or dict
+        path to Mapchete file or configuration dictionary
+    zoom : list or int
+        either single zoom level or minimum and maximum zoom level
+    bounds : tuple
+        left, bottom, right, top process boundaries in output pyramid
+    samples : int
+        number of sample tiles per zoom level (default: 10)
+    seed : int
+        seed of random sample (default: None)
+    single_input_file : string
+        single input file if supported by process
+
+    Returns
+    -------
+    estimate : Estimate
+    """
+    raw = _config_to_dict(
+        deepcopy(config) if isinstance(config, dict) else config)
+    out_dir = tempfile.mkdtemp()
+    raw["output"] = dict(raw["output"], path=out_dir)
+    rng = random.Random(seed)
+    try:
+        with mapchete.open(
+            raw, mode="overwrite", zoom=zoom, bounds=bounds,
+            single_input_file=single_input_file
+        ) as mp:
+            timer = _ReadTimer()
+            for key, reader in list(mp.config.input.items()):
+                mp.config.input[key] = _TimedInput(reader, timer)
+            zooms = {}
+            totals = []
+            for process_zoom in reversed(mp.config.init_zoom_levels):
+                pyramid = mp.config.process_pyramid
+                area = mp.config.area_at_zoom(process_zoom)
+                tiles = count_tiles_from_geom(pyramid, area, process_zoom)
+                sample = _stratified_sample(
+                    tile_ids_from_geom(pyramid, area, process_zoom), tiles,
+                    samples, rng)
+                zooms[process_zoom] = (tiles, len(sample))
+                measured = np.array([
+                    _measure(mp, tile_id, timer, out_dir)
+                    for tile_id in sample
+                ]).reshape(-1, 4)
+                LOGGER.debug(
+                    "zoom %s: %s tiles, %s samples", process_zoom, tiles,
+                    len(sample))
+                # read, process, write, total time and output bytes per tile
+                totals.append(_extrapolate(np.column_stack([
+                    measured[:, :3], measured[:, :3].sum(axis=1),
+                    measured[:, 3]
+                ]), tiles))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    # zoom levels are sampled independently, so their variances add up
+    total = sum(zoom_total for zoom_total, _ in totals)
+    variance = sum(zoom_variance for _, zoom_variance in totals)
+    time_margin = _Z_95 * math.sqrt(variance[3])
+    bytes_margin = _Z_95 * math.sqrt(variance[4])
+    bounded = not np.isinf(variance).any()
+    return Estimate(
+        tiles=sum(tiles for tiles, _ in zooms.values()),
+        samples=sum(sampled for _, sampled in zooms.values()),
+        read_hours=total[0] / 3600.,
+        process_hours=total[1] / 3600.,
+        write_hours=total[2] / 3600.,
+        cpu_hours=total[3] / 3600.,
+        cpu_hours_interval=(
+            max([total[3] - time_margin, 0.]) / 3600.,
+            (total[3] + time_margin) / 3600.
+        ) if bounded else None,
+        output_bytes=int(total[4]),
+        output_bytes_interval=(
+            int(max([total[4] - bytes_margin, 0.])),
+            int(total[4] + bytes_margin)
+        ) if bounded else None,
+        peak_memory=_peak_memory(),
+        zooms=zooms
+    )
+
+
+def _stratified_sample(tile_ids, tiles, samples, rng):
+    """Draw one tile id from each of samples equally sized strata."""
+    samples = min([samples, tiles])
+    chosen = set(
+        rng.randrange(
+            stratum * tiles // samples, (stratum + 1) * tiles // samples)
+        for stratum in range(samples)
+    )
+    return [
+        tile_id for i, tile_id in enumerate(tile_ids) if i in chosen
+    ]
+
+
+def _extrapolate(values, tiles):
+    """
+    Return estimated totals and their variances from per tile values.
+
+    Uses the variance of the sample mean with finite population correction.
+    Variances cannot be estimated from a single sample and are set to
+    infinity unless all tiles were sampled.
+    """
+    sampled = len(values)
+    if not sampled:
+        return np.zeros(values.shape[1]), np.zeros(values.shape[1])
+    totals = values.mean(axis=0) * tiles
+    if sampled == tiles:
+        variances = np.zeros(values.shape[1])
+    elif sampled == 1:
+        variances = np.full(values.shape[1], np.inf)
+    else:
+        variances = (
+            tiles ** 2 * (1. - float(sampled) / tiles) *
+            values.var(axis=0, ddof=1) / sampled
+        )
+    return totals, variances
+
+
+def _measure(mp, tile_id, timer, out_dir):
+    """Return read, process and write time and written bytes of a tile."""
+    tile = mp.config.process_pyramid.tile(*tile_id)
+    timer.elapsed = 0.
+    start = time.time()
+    output = mp.execute(tile)
+    read_time = timer.elapsed
+    process_time = time.time() - start - read_time
+    if _is_empty(output):
+        return read_time, process_time, 0., 0
+    size = _dir_size(out_dir)
+    start = time.time()
+    mp.write(tile, output)
+    write_time = time.time() - start
+    return read_time, process_time, write_time, _dir_size(out_dir) - size
+
+
+def _dir_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, filename))
+        for root, _, filenames in os.walk(path)
+        for filename in filenames
+    )
+
+
+def _peak_memory():
+    """Return peak resident memory of this process in bytes."""
+    if resource is None:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if os.uname()[0] == "Darwin" else peak * 1024
+
+
+class _ReadTimer(object):
+    """Accumulate time spent reading inputs."""
+
+    def __init__(self):
+        self.elapsed = 0.
+
+    def timed(self, func, *args, **kwargs):
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.elapsed += time.time() - start
+
+
+class _TimedInput(object):
+    """InputData wrapper timing reads of its input tiles."""
+
+    def __init__(self, input_data, timer):
+        self._input_data = input_data
+        self._timer = timer
+
+    def open(self, tile, **kwargs):
+        return _TimedInputTile(
+            self._timer.timed(self._input_data.open, tile, **kwargs),
+            self._timer)
+
+    def __getattr__(self, name):
+        return getattr(self._input_data, name)
+
+
+class _TimedInputTile(object):
+    """InputTile wrapper timing read() and is_empty()."""
+
+    def __init__(self, input_tile, timer):
+        self._input_tile = input_tile
+        self._timer = timer
+
+    def read(self, *args, **kwargs):
+        return self._timer.timed(self._input_tile.read, *args, **kwargs)
+
+    def is_empty(self, *args, **kwargs):
+        return self._timer.timed(self._input_tile.is_empty, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._input_tile, name)
+
+    def __enter__(self):
+        self._input_tile.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._input_tile.__exit__(*args)
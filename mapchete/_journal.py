@@ -0,0 +1,227 @@
+"""Journal of processed tiles used to resume interrupted batch runs."""
+
+import logging
+import os
+import sqlite3
+import time
+
+from mapchete._cache import cache_namespace
+from mapchete.io import path_is_remote
+from mapchete.tile import tile_ids_from_geom
+
+LOGGER = logging.getLogger(__name__)
+
+# file name of journal stored in output directory
+JOURNAL_FILE = "mapchete.journal"
+# tiles with these states do not have to be processed again
+FINISHED_STATES = ("written", "empty")
+# maximum number of seconds records are kept uncommitted
+COMMIT_INTERVAL = 1.
+# configuration keys only selecting which tiles are processed
+_AREA_PARAMETERS = ("zoom_levels", "bounds", "init_zoom_levels", "init_bounds")
+
+
+class TileJournal(object):
+    """
+    Record the status of processed tiles in a SQLite database.
+
+    Each tile returned by a worker is recorded as "written", "empty" or
+    "failed". Records are committed at least every COMMIT_INTERVAL seconds and
+    when the journal is closed, so a killed run loses at most the records of
+    the last interval and these tiles are processed again on resume.
+
+    The journal is bound to the process file and configuration it was written
+    for (see ``journal_namespace()``). If either of them changed, existing
+    records are discarded.
+
+    Parameters
+    ----------
+    path : string
+        path to SQLite database
+    namespace : string
+        hash identifying process file and configuration (default: "")
+    reset : bool
+        discard existing records (default: False)
+    """
+
+    def __init__(self, path, namespace="", reset=False):
+        """Initialize."""
+        self.path = path
+        self.namespace = namespace
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta "
+            "(key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tiles ("
+            "zoom INTEGER, row INTEGER, col INTEGER, status TEXT, "
+            "PRIMARY KEY (zoom, row, col))"
+        )
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'namespace'").fetchone()
+        if row is not None and row[0] != namespace and not reset:
+            LOGGER.info(
+                "process changed since journal was written, discarding it")
+            reset = True
+        if reset:
+            self._conn.execute("DELETE FROM tiles")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('namespace', ?)",
+            (namespace, ))
+        self._conn.commit()
+        self._last_commit = time.time()
+
+    def record(self, status):
+        """
+        Record status of a processed tile.
+
+        Parameters
+        ----------
+        status : TileStatus
+            status returned by worker; skipped tiles are not recorded
+        """
+        if status.status == "skipped":
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+            tuple(status.tile_id) + (status.status, ))
+        if time.time() - self._last_commit > COMMIT_INTERVAL:
+            self.commit()
+
+    def finished(self, zoom):
+        """
+        Return tiles of zoom level which were written or empty.
+
+        Returns
+        -------
+        tiles : set
+            set of (row, col) tuples
+        """
+        return self._tiles(zoom, FINISHED_STATES)
+
+    def failed(self, zoom):
+        """
+        Return tiles of zoom level which failed.
+
+        Returns
+        -------
+        tiles : set
+            set of (row, col) tuples
+        """
+        return self._tiles(zoom, ("failed", ))
+
+    def counts(self, zoom=None):
+        """Return number of recorded tiles per status."""
+        if zoom is None:
+            return dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM tiles GROUP BY status"))
+        return dict(self._conn.execute(
+            "SELECT status, COUNT(*) FROM tiles WHERE zoom = ? "
+            "GROUP BY status", (zoom, )))
+
+    def discard(self, tile_ids):
+        """
+        Remove records of tiles, e.g. because they are overwritten.
+
+        Parameters
+        ----------
+        tile_ids : iterable
+            zoom, row and column tuples
+        """
+        self._conn.executemany(
+            "DELETE FROM tiles WHERE zoom = ? AND row = ? AND col = ?",
+            tile_ids)
+        self.commit()
+
+    def commit(self):
+        """Commit records."""
+        self._conn.commit()
+        self._last_commit = time.time()
+
+    def close(self):
+        """Commit records and close database."""
+        self.commit()
+        self._conn.close()
+
+    def _tiles(self, zoom, states):
+        return set(self._conn.execute(
+            "SELECT row, col FROM tiles WHERE zoom = ? AND status IN (%s)" % (
+                ", ".join("?" * len(states))),
+            (zoom, ) + tuple(states)
+        ))
+
+    def __enter__(self):
+        """Enable context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        """Close database."""
+        self.close()
+
+
+def journal_namespace(config):
+    """
+    Return hash identifying process file and parameters of a journal.
+
+    Zoom levels and bounds are left out, so a run can be resumed for another
+    area or other zoom levels.
+
+    Parameters
+    ----------
+    config : MapcheteConfig
+
+    Returns
+    -------
+    hex digest : string
+    """
+    return cache_namespace(config.process_file, {
+        k: v for k, v in config._raw.items() if k not in _AREA_PARAMETERS})
+
+
+def open_journal(process, zoom_levels):
+    """
+    Open journal in output directory of a process.
+
+    The journal is replayed in "continue" mode. In "overwrite" mode, the
+    records of all tiles to be processed are removed.
+
+    Parameters
+    ----------
+    process : Mapchete
+        process to be run
+    zoom_levels : list
+        zoom levels to be processed
+
+    Returns
+    -------
+    journal : TileJournal or None
+        None if process mode is neither "continue" nor "overwrite" or output
+        is not a local directory
+    """
+    config = process.config
+    path = getattr(config.output, "path", None)
+    if (
+        config.mode not in ("continue", "overwrite") or
+        path is None or
+        path_is_remote(path)
+    ):
+        return None
+    if not os.path.exists(path):
+        os.makedirs(path)
+    journal = TileJournal(
+        os.path.join(path, JOURNAL_FILE), namespace=journal_namespace(config))
+    if config.mode == "overwrite":
+        for zoom in zoom_levels:
+            if journal.counts(zoom):
+                journal.discard(tile_ids_from_geom(
+                    config.process_pyramid, config.area_at_zoom(zoom), zoom))
+    else:
+        counts = journal.counts()
+        if counts:
+            LOGGER.info("resuming from journal: %s", ", ".join(
+                "%s %s" % (n, status) for status, n in sorted(counts.items())
+            ))
+    return journal
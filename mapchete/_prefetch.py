@@ -0,0 +1,218 @@
+"""Read inputs of upcoming process tiles in the background."""
+
+import logging
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from mapchete._cache import sizeof
+from mapchete.config import _flatten_tree
+
+LOGGER = logging.getLogger(__name__)
+
+# default maximum size of prefetched input data per worker in MB
+DEFAULT_PREFETCH_SIZE = 256
+
+
+class InputPrefetcher(object):
+    """
+    Read inputs of upcoming process tiles while the current tile is processed.
+
+    The inputs of the process are wrapped, so InputTile.read() returns the
+    prefetched data if it was read ahead. A read still in progress is waited
+    for instead of being started again. Other reads and failed prefetches
+    fall back to reading the input directly.
+
+    Inputs are read ahead the way the process opened and read them before,
+    i.e. using the same open() and read() arguments. Inputs the process did
+    not read yet are not prefetched.
+
+    Prefetched data is dropped once its tile is no longer within the
+    lookahead window. A read is only started if the prefetched data and the
+    expected size of all reads in progress, including the new one, stay
+    within max_bytes. The expected size of a read is the size of the last
+    read of the same input with the same arguments.
+
+    Parameters
+    ----------
+    process : Mapchete
+        process whose inputs are prefetched
+    depth : int
+        number of upcoming tiles whose inputs are read ahead (default: 1)
+    max_bytes : int
+        maximum size of prefetched data (default: 256 MB)
+    initializer : callable
+        function run by each reading thread on start (default: None)
+    initargs : tuple
+        arguments passed on to initializer
+    """
+
+    def __init__(
+        self, process, depth=1, max_bytes=DEFAULT_PREFETCH_SIZE * 1024 * 1024,
+        initializer=None, initargs=()
+    ):
+        """Initialize."""
+        self.process = process
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._pool = ThreadPool(
+            depth, initializer=initializer, initargs=initargs)
+        # read key --> AsyncResult of prefetched read
+        self._reads = OrderedDict()
+        # input key --> open and read arguments used by the process
+        self._signatures = {}
+        # input key and arguments --> size of last read in bytes
+        self._sizes = {}
+        inputs = process.config.input
+        for key, input_data in list(inputs.items()):
+            inputs[key] = _PrefetchedInput(input_data, key, self)
+
+    def prefetch(self, tile_ids):
+        """
+        Set lookahead window and read inputs of its tiles.
+
+        Parameters
+        ----------
+        tile_ids : list
+            ids of current and upcoming tiles in processing order; data of
+            all other tiles is dropped
+        """
+        window = set(tile_ids)
+        for key in [key for key in self._reads if key[1] not in window]:
+            del self._reads[key]
+        pyramid = self.process.config.process_pyramid
+        for tile_id in tile_ids:
+            tile = pyramid.tile(*tile_id)
+            for input_data in self._inputs_at_zoom(tile.zoom):
+                for signature in self._signatures.get(
+                    input_data.key, {}
+                ).values():
+                    key = _read_key(input_data.key, tile, *signature)
+                    if key in self._reads:
+                        continue
+                    if (
+                        self._prefetched_bytes() + self._expected_bytes(key) >
+                        self.max_bytes
+                    ):
+                        return
+                    self._reads[key] = self._pool.apply_async(
+                        _read, (input_data.input_data, tile) + signature)
+
+    def read(self, input_key, tile, open_kwargs, args, kwargs, read):
+        """
+        Return prefetched data or call read().
+
+        Parameters
+        ----------
+        input_key : string
+            key of input in process configuration
+        tile : ``BufferedTile``
+            tile the input was opened with
+        open_kwargs : dict
+            arguments the input was opened with
+        args, kwargs : tuple, dict
+            arguments of InputTile.read()
+        read : callable
+            reads the input directly
+        """
+        key = _read_key(input_key, tile, open_kwargs, args, kwargs)
+        self._signatures.setdefault(input_key, {})[key[2:]] = (
+            open_kwargs, args, kwargs)
+        result = self._reads.pop(key, None)
+        if result is not None:
+            try:
+                data = result.get()
+                self.hits += 1
+                self._sizes[_size_key(key)] = sizeof(data)
+                return data
+            except Exception as e:
+                LOGGER.debug("prefetching %s failed: %s", key, e)
+        self.misses += 1
+        data = read()
+        self._sizes[_size_key(key)] = sizeof(data)
+        return data
+
+    def close(self):
+        """Drop prefetched data and stop reading threads."""
+        self._reads.clear()
+        self._pool.terminate()
+
+    def _prefetched_bytes(self):
+        """Return size of prefetched data and expected size of reads."""
+        total = 0
+        for key, result in self._reads.items():
+            if not result.ready():
+                total += self._expected_bytes(key)
+            elif result.successful():
+                total += sizeof(result.get())
+        return total
+
+    def _expected_bytes(self, key):
+        return self._sizes.get(_size_key(key), 0)
+
+    def _inputs_at_zoom(self, zoom):
+        return [
+            input_data for _, input_data in _flatten_tree(
+                self.process.config.params_at_zoom(zoom)["input"])
+            if isinstance(input_data, _PrefetchedInput)
+        ]
+
+
+def _read(input_data, tile, open_kwargs, args, kwargs):
+    with input_data.open(tile, **open_kwargs) as input_tile:
+        return input_tile.read(*args, **kwargs)
+
+
+def _read_key(input_key, tile, open_kwargs, args, kwargs):
+    """Return key identifying the result of an InputTile.read() call."""
+    return (
+        input_key, tile.id, repr(sorted(open_kwargs.items())), repr(args),
+        repr(sorted(kwargs.items()))
+    )
+
+
+def _size_key(read_key):
+    """Return read key without tile, i.e. input and read arguments."""
+    return read_key[:1] + read_key[2:]
+
+
+class _PrefetchedInput(object):
+    """InputData wrapper returning prefetched input tiles."""
+
+    def __init__(self, input_data, key, prefetcher):
+        self.input_data = input_data
+        self.key = key
+        self.prefetcher = prefetcher
+
+    def open(self, tile, **kwargs):
+        return _PrefetchedInputTile(
+            self.input_data.open(tile, **kwargs), self, tile, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.input_data, name)
+
+
+class _PrefetchedInputTile(object):
+    """InputTile wrapper returning prefetched data on read()."""
+
+    def __init__(self, input_tile, input_data, tile, open_kwargs):
+        self._input_tile = input_tile
+        self._input_data = input_data
+        self._tile = tile
+        self._open_kwargs = open_kwargs
+
+    def read(self, *args, **kwargs):
+        return self._input_data.prefetcher.read(
+            self._input_data.key, self._tile, self._open_kwargs, args, kwargs,
+            lambda: self._input_tile.read(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._input_tile, name)
+
+    def __enter__(self):
+        self._input_tile.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._input_tile.__exit__(*args)
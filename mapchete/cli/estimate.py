@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Command line utility to estimate runtime and output size of a process."""
+
+from __future__ import print_function
+import logging
+from multiprocessing import cpu_count
+
+from mapchete._estimate import estimate
+
+LOGGER = logging.getLogger(__name__)
+
+
+def main(args=None):
+    """Estimate a Mapchete process and print the results."""
+    parsed = args
+    multi = parsed.multi if parsed.multi else cpu_count()
+    result = estimate(
+        parsed.mapchete_file, zoom=parsed.zoom, bounds=parsed.bounds,
+        samples=parsed.samples, seed=parsed.seed,
+        single_input_file=parsed.input_file)
+    print("%4s %12s %8s" % ("zoom", "tiles", "samples"))
+    for zoom, (tiles, samples) in sorted(result.zooms.items()):
+        print("%4s %12s %8s" % (zoom, tiles, samples))
+    print("read:       %10.2f CPU hours" % result.read_hours)
+    print("process:    %10.2f CPU hours" % result.process_hours)
+    print("write:      %10.2f CPU hours" % result.write_hours)
+    print("total:      %10.2f CPU hours (95%% CI %s)" % (
+        result.cpu_hours, _interval(result.cpu_hours_interval)))
+    print("runtime:    %10.2f hours using %s workers" % (
+        result.cpu_hours / multi, multi))
+    print("output:     %10.2f MB (95%% CI %s)" % (
+        _to_mb(result.output_bytes),
+        _interval(result.output_bytes_interval, _to_mb)))
+    if result.peak_memory is not None:
+        print("peak memory:%10.2f MB per worker" % _to_mb(
+            result.peak_memory))
+
+
+def _to_mb(size):
+    return float(size) / 1024 / 1024
+
+
+def _interval(interval, func=float):
+    """Format confidence interval, which is None if it is unbounded."""
+    if interval is None:
+        return "n/a"
+    return "%.2f - %.2f" % tuple(func(value) for value in interval)
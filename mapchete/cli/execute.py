@@ -48,6 +48,16 @@ def main(args=None):
             parsed.mapchete_file, bounds=parsed.bounds, zoom=parsed.zoom,
             mode=mode, single_input_file=parsed.input_file, debug=parsed.debug
         ) as mp:
-            mp.batch_process(
+            failed = mp.batch_process(
                 multi=multi, quiet=parsed.quiet, debug=parsed.debug,
-                zoom=parsed.zoom, logfile=parsed.logfile)
+                zoom=parsed.zoom, logfile=parsed.logfile, order=parsed.order,
+                timeout=parsed.timeout, retries=parsed.retries,
+                max_tasks_per_worker=parsed.max_tasks_per_worker,
+                skip_failed=parsed.skip_failed,
+                concurrency=parsed.concurrency, threads=parsed.threads,
+                writers=parsed.writers, prefetch=parsed.prefetch,
+                prefetch_size=parsed.prefetch_size,
+                baselevel_store_size=parsed.baselevel_store_size)
+        # failed tiles were logged already
+        if failed:
+            raise SystemExit("%s tile(s) failed" % len(failed))
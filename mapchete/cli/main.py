@@ -12,6 +12,7 @@ import tilematrix
 
 import mapchete
 from mapchete.cli.execute import main as execute
+from mapchete.cli.estimate import main as estimate
 from mapchete.cli.serve import main as serve
 from mapchete.cli.pyramid import main as pyramid
 from mapchete.cli.create import create_empty_process
@@ -46,6 +47,8 @@ class MapcheteCLI(object):
                 """\n  """
                 """execute        Execute a process."""
                 """\n  """
+                """estimate       Estimate runtime and output size."""
+                """\n  """
                 """pyramid        Create a tile pyramid from an input raster."""
                 """\n  """
                 """formats        List available input and/or output formats."""
@@ -109,10 +112,22 @@ class MapcheteCLI(object):
         parser.add_argument(
             "--port", "-p", type=int, help="port process is hosted on",
             metavar="<int>", default=5000)
+        parser.add_argument(
+            "--cache_size", type=int,
+            help="memory budget of process tile cache in MB",
+            metavar="<int>", default=512)
         parser.add_argument(
             "--internal_cache", "-c", type=int,
-            help="number of web tiles to be cached in RAM",
-            metavar="<int>", default=1024)
+            help="deprecated and ignored, use --cache_size instead",
+            metavar="<int>")
+        parser.add_argument(
+            "--spill_dir", type=str,
+            help="directory where tiles evicted from cache are stored",
+            metavar="<path>")
+        parser.add_argument(
+            "--spill_size", type=int,
+            help="size limit of spill directory in MB",
+            metavar="<int>", default=4096)
         parser.add_argument(
             "--zoom", "-z", type=int, nargs='*',
             help="either minimum and maximum zoom level or just one zoom level",
@@ -177,10 +192,80 @@ class MapcheteCLI(object):
         parser.add_argument(
             "--logfile", "-l", type=str, metavar="<path>",
             help="write debug log infos into file")
+        parser.add_argument(
+            "--order", type=str, choices=["hilbert", "zorder"],
+            help="process tiles along a space filling curve")
+        parser.add_argument(
+            "--timeout", type=float, metavar="<float>",
+            help="kill and replace worker if a tile takes longer (seconds)")
+        parser.add_argument(
+            "--retries", type=int, metavar="<int>", default=0,
+            help="number of times a failed tile is processed again")
+        parser.add_argument(
+            "--max_tasks_per_worker", type=int, metavar="<int>",
+            help="replace worker after processing this number of tile chunks")
+        parser.add_argument(
+            "--skip_failed", action="store_true",
+            help="continue if tiles fail and report them at the end")
+        parser.add_argument(
+            "--concurrency", type=str, default="processes",
+            choices=["processes", "threads", "hybrid"],
+            help="run workers as processes, threads or processes with threads")
+        parser.add_argument(
+            "--threads", type=int, metavar="<int>",
+            help="number of threads per worker process using hybrid")
+        parser.add_argument(
+            "--writers", type=int, metavar="<int>", default=0,
+            help="number of threads per worker writing output in background")
+        parser.add_argument(
+            "--prefetch", type=int, metavar="<int>", default=0,
+            help="number of upcoming tiles whose inputs are read ahead")
+        parser.add_argument(
+            "--prefetch_size", type=int, metavar="<int>", default=256,
+            help="maximum size of prefetched input data per worker in MB")
+        parser.add_argument(
+            "--baselevel_store_size", type=int, metavar="<int>", default=256,
+            help="size of shared memory keeping baselevel tiles in MB")
 
         args = parser.parse_args(self.args[2:])
         execute(args)
 
+    def estimate(self):
+        """Parse params and run estimate command."""
+        parser = argparse.ArgumentParser(
+            description=(
+                "Estimates runtime and output size of a process from a "
+                "sample of tiles"),
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            usage="mapchete estimate <mapchete_file>")
+        parser.add_argument("mapchete_file", type=str, help="Mapchete file")
+        parser.add_argument(
+            "--zoom", "-z", type=int, nargs='*',
+            help=(
+                "either minimum and maximum zoom level or just one zoom "
+                "level"),
+            metavar="<int>")
+        parser.add_argument(
+            "--bounds", "-b", type=float, nargs=4,
+            help="left, bottom, right, top bounds in tile pyramid CRS",
+            metavar="<float>")
+        parser.add_argument(
+            "--samples", "-s", type=int, default=10, metavar="<int>",
+            help="number of sample tiles per zoom level")
+        parser.add_argument(
+            "--seed", type=int, metavar="<int>",
+            help="seed of random sample")
+        parser.add_argument(
+            "--multi", "-m", type=int, metavar="<int>",
+            help="number of workers the runtime is estimated for")
+        parser.add_argument(
+            "--input_file", "-i", type=str,
+            help="specify an input file via command line (in Mapchete file, \
+                set 'input_file' parameter to 'from_command_line')",
+            metavar="<path>")
+        args = parser.parse_args(self.args[2:])
+        estimate(args)
+
     def pyramid(self):
         """Parse params and run pyramid command."""
         parser = argparse.ArgumentParser(
@@ -7,10 +7,12 @@ import os
 import pkgutil
 from rasterio.io import MemoryFile
 import six
+import warnings
 from flask import (
     Flask, send_file, make_response, render_template_string, abort, jsonify)
 
 import mapchete
+from mapchete._cache import DEFAULT_CACHE_SIZE, DEFAULT_SPILL_SIZE
 from mapchete.tile import BufferedTilePyramid
 
 logging.basicConfig(level=logging.INFO)
@@ -24,10 +26,16 @@ def main(args=None, _test=False):
     Creates the Mapchete host and serves both web page with OpenLayers and the
     WMTS simple REST endpoint.
     """
+    if args.internal_cache is not None:
+        warnings.warn(
+            "--internal_cache is deprecated and ignored, use --cache_size to "
+            "set the memory budget in MB")
     app = create_app(
         mapchete_files=[args.mapchete_file], zoom=args.zoom,
         bounds=args.bounds, single_input_file=args.input_file,
-        mode=_get_mode(args), debug=args.debug)
+        mode=_get_mode(args), debug=args.debug,
+        cache_size=args.cache_size * 1024 * 1024,
+        spill_dir=args.spill_dir, spill_size=args.spill_size * 1024 * 1024)
     if not _test:
         app.run(
             threaded=True, debug=True, port=args.port, host='0.0.0.0',
@@ -36,7 +44,8 @@ def main(args=None, _test=False):
 
 def create_app(
     mapchete_files=None, zoom=None, bounds=None, single_input_file=None,
-    mode="continue", debug=None
+    mode="continue", debug=None, cache_size=DEFAULT_CACHE_SIZE,
+    spill_dir=None, spill_size=DEFAULT_SPILL_SIZE
 ):
     """Configure and create Flask app."""
     if debug:
@@ -48,7 +57,11 @@ def create_app(
         os.path.splitext(os.path.basename(mapchete_file))[0]: mapchete.open(
             mapchete_file, zoom=zoom, bounds=bounds,
             single_input_file=single_input_file, mode=mode, with_cache=True,
-            debug=debug)
+            debug=debug, cache_size=cache_size,
+            spill_dir=(
+                os.path.join(spill_dir, os.path.basename(mapchete_file))
+                if spill_dir else None),
+            spill_size=spill_size)
         for mapchete_file in mapchete_files
     }
 
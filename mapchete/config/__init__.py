@@ -53,6 +53,7 @@ _RESERVED_PARAMETERS = [
     "process_bounds",   # process boundaries (deprecated)
     "metatiling",       # process metatile size (deprecated)
     "pixelbuffer",      # buffer around each tile in pixels (deprecated)
+    "input_cache",      # memory for cached unbuffered input tiles in MB
 ]
 
 
@@ -175,6 +176,14 @@ class MapcheteConfig(object):
             LOGGER.exception(e)
             raise MapcheteConfigError(e)
 
+        # (3b) memory for cached unbuffered input tiles
+        input_cache = self._raw.get("input_cache")
+        if input_cache is not None and (
+            not isinstance(input_cache, (int, float)) or input_cache < 0
+        ):
+            raise MapcheteConfigError(
+                "input_cache must be a positive number of MB")
+
         # (4) set mode
         if mode not in ["memory", "continue", "readonly", "overwrite"]:
             raise MapcheteConfigError("unknown mode %s" % mode)
@@ -300,7 +309,8 @@ class MapcheteConfig(object):
                         dict(
                             path=deepcopy(path), pyramid=self.process_pyramid,
                             pixelbuffer=self.process_pyramid.pixelbuffer,
-                            delimiters=delimiters
+                            delimiters=delimiters,
+                            input_cache=self._raw.get("input_cache")
                         ), self.mode == "readonly")
                 except Exception as e:
                     LOGGER.exception(e)
@@ -316,7 +326,8 @@ class MapcheteConfig(object):
                         dict(
                             abstract=deepcopy(v), pyramid=self.process_pyramid,
                             pixelbuffer=self.process_pyramid.pixelbuffer,
-                            delimiters=delimiters, conf_dir=self.config_dir
+                            delimiters=delimiters, conf_dir=self.config_dir,
+                            input_cache=self._raw.get("input_cache")
                         ), self.mode == "readonly")
                 except Exception as e:
                     LOGGER.exception(e)
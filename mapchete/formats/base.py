@@ -7,6 +7,8 @@ respective interfaces.
 
 from tilematrix import TilePyramid
 
+from mapchete._cache import ProcessTileCache
+
 
 class InputData(object):
     """
@@ -27,6 +29,8 @@ class InputData(object):
         object describing the process coordinate reference system
     srid : string
         spatial reference ID of CRS (e.g. "{'init': 'epsg:4326'}")
+    core_tile_cache : ``ProcessTileCache`` or None
+        cache for unbuffered tiles if ``input_cache`` is configured
     """
 
     METADATA = {
@@ -41,6 +45,10 @@ class InputData(object):
         self.pixelbuffer = input_params["pixelbuffer"]
         self.crs = self.pyramid.crs
         self.srid = self.pyramid.srid
+        input_cache = input_params.get("input_cache")
+        self.core_tile_cache = ProcessTileCache(
+            max_bytes=int(input_cache * 1024 * 1024)
+        ) if input_cache else None
 
     def open(self, tile, **kwargs):
         """
@@ -208,6 +216,22 @@ class OutputData(object):
         """
         raise NotImplementedError
 
+    def existing_tiles(self, zoom):
+        """
+        Return all existing output tiles of a zoom level at once.
+
+        Parameters
+        ----------
+        zoom : integer
+            zoom level
+
+        Returns
+        -------
+        tiles : set
+            rows and columns of existing output tiles
+        """
+        raise NotImplementedError
+
     def is_valid_with_config(self, config):
         """
         Check if output format is valid with other process parameters.
@@ -29,6 +29,7 @@ import six
 import types
 
 from mapchete.tile import BufferedTile
+from mapchete.io import tile_directory_index
 from mapchete.formats import base
 from mapchete.io.vector import write_vector_window
 from mapchete.config import validate_values
@@ -144,6 +145,22 @@ class OutputData(base.OutputData):
             os.path.exists(self.get_path(tile))
             for tile in self.pyramid.intersecting(process_tile))
 
+    def existing_tiles(self, zoom):
+        """
+        Return all existing output tiles of a zoom level at once.
+
+        Parameters
+        ----------
+        zoom : integer
+            zoom level
+
+        Returns
+        -------
+        tiles : set
+            rows and columns of existing output tiles
+        """
+        return tile_directory_index(self.path, zoom, self.file_extension)
+
     def is_valid_with_config(self, config):
         """
         Check if output format is valid with other process parameters.
@@ -197,12 +214,11 @@ class OutputData(base.OutputData):
         tile : ``BufferedTile``
             must be member of output ``TilePyramid``
         """
-        zoomdir = os.path.join(self.path, str(tile.zoom))
-        if not os.path.exists(zoomdir):
-            os.makedirs(zoomdir)
-        rowdir = os.path.join(zoomdir, str(tile.row))
-        if not os.path.exists(rowdir):
-            os.makedirs(rowdir)
+        try:
+            os.makedirs(
+                os.path.join(self.path, str(tile.zoom), str(tile.row)))
+        except OSError:
+            pass
 
     def empty(self, process_tile=None):
         """
@@ -34,12 +34,13 @@ import os
 import six
 import numpy as np
 import numpy.ma as ma
-import rasterio
 import warnings
 
 from mapchete.formats import base
 from mapchete.tile import BufferedTile
-from mapchete.io.raster import write_raster_window, prepare_array, memory_file
+from mapchete.io import tile_directory_index
+from mapchete.io.raster import (
+    write_raster_window, prepare_array, memory_file, DATASET_POOL)
 from mapchete.config import validate_values
 
 
@@ -108,7 +109,8 @@ class OutputData(base.OutputData):
         """
         path = self.get_path(output_tile)
         if os.path.isfile(path):
-            with rasterio.open(path, "r") as src:
+            # output files may be rewritten in overwrite mode
+            with DATASET_POOL.checkout(path, validate=True) as src:
                 return src.read(masked=True)
         else:
             return self.empty(output_tile)
@@ -155,6 +157,22 @@ class OutputData(base.OutputData):
             for tile in self.pyramid.intersecting(process_tile)
         )
 
+    def existing_tiles(self, zoom):
+        """
+        Return all existing output tiles of a zoom level at once.
+
+        Parameters
+        ----------
+        zoom : integer
+            zoom level
+
+        Returns
+        -------
+        tiles : set
+            rows and columns of existing output tiles
+        """
+        return tile_directory_index(self.path, zoom, self.file_extension)
+
     def is_valid_with_config(self, config):
         """
         Check if output format is valid with other process parameters.
@@ -29,6 +29,7 @@ import numpy.ma as ma
 
 from mapchete.formats import base
 from mapchete.tile import BufferedTile
+from mapchete.io import tile_directory_index
 from mapchete.io.raster import write_raster_window, prepare_array, memory_file
 from mapchete.config import validate_values
 
@@ -149,6 +150,22 @@ class OutputData(base.OutputData):
             os.path.exists(self.get_path(tile))
             for tile in self.pyramid.intersecting(process_tile))
 
+    def existing_tiles(self, zoom):
+        """
+        Return all existing output tiles of a zoom level at once.
+
+        Parameters
+        ----------
+        zoom : integer
+            zoom level
+
+        Returns
+        -------
+        tiles : set
+            rows and columns of existing output tiles
+        """
+        return tile_directory_index(self.path, zoom, self.file_extension)
+
     def is_valid_with_config(self, config):
         """
         Check if output format is valid with other process parameters.
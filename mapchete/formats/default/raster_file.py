@@ -14,7 +14,7 @@ import warnings
 
 from mapchete.formats import base
 from mapchete.io.vector import reproject_geometry, segmentize_geometry
-from mapchete.io.raster import read_raster_window
+from mapchete.io.raster import read_raster_window, DATASET_POOL
 from mapchete import io
 
 
@@ -99,7 +99,7 @@ class InputData(base.InputData):
             Shapely geometry object
         """
         out_crs = self.pyramid.crs if out_crs is None else out_crs
-        with rasterio.open(self.path) as inp:
+        with DATASET_POOL.checkout(self.path) as inp:
             inp_crs = inp.crs
             out_bbox = bbox = box(*inp.bounds)
         # If soucre and target CRSes differ, segmentize and reproject
@@ -171,7 +171,8 @@ class InputTile(base.InputTile):
             self.tile,
             indexes=self._get_band_indexes(indexes),
             resampling=self.resampling,
-            gdal_opts=self.gdal_opts
+            gdal_opts=self.gdal_opts,
+            core_tile_cache=self.raster_file.core_tile_cache
         )
 
     def is_empty(self, indexes=None):
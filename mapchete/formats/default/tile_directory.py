@@ -20,7 +20,8 @@ from mapchete.formats import base
 from mapchete.io import path_is_remote
 from mapchete.io.vector import reproject_geometry, read_vector_window
 from mapchete.io.raster import (
-    read_raster_window, create_mosaic, resample_from_array)
+    read_raster_window, create_mosaic, resample_from_array,
+    read_from_core_tiles, covered_by_core_tiles)
 
 
 METADATA = {
@@ -104,6 +105,14 @@ class InputData(base.InputData):
                 "count": self._params["count"]}
         else:
             self._profile = None
+        # tiles can be assembled from cached directory tiles if both pyramids
+        # share the same grid
+        self._aligned = (
+            self.td_pyramid.grid == self.pyramid.grid and
+            self.td_pyramid.tile_size == self.pyramid.tile_size and
+            self.td_pyramid.metatiling == self.pyramid.metatiling and
+            self.td_pyramid.pixelbuffer == 0
+        )
 
     def open(self, tile, **kwargs):
         """
@@ -123,17 +132,22 @@ class InputData(base.InputData):
             tiles_paths=[
                 (_tile, _path)
                 for _tile, _path in [
-                    (t, os.path.join(*([
-                        self.path, str(t.zoom), str(t.row), str(t.col)
-                        ])) + "." + self._ext)
+                    (t, self._tile_path(t))
                     for t in self.td_pyramid.tiles_from_bounds(
                         tile.bounds, tile.zoom)
                 ]
                 if _path_exists(_path)],
             file_type=self._file_type,
             profile=self._profile,
+            core_tile_cache=self.core_tile_cache,
+            core_tile_path=self._tile_path if self._aligned else None,
             **kwargs)
 
+    def _tile_path(self, tile):
+        return os.path.join(*([
+            self.path, str(tile.zoom), str(tile.row), str(tile.col)
+        ])) + "." + self._ext
+
     def bbox(self, out_crs=None):
         """
         Return data bounding box.
@@ -175,6 +189,8 @@ class InputTile(base.InputTile):
         self._tiles_paths = kwargs["tiles_paths"]
         self._file_type = kwargs["file_type"]
         self._profile = kwargs["profile"]
+        self._core_tile_cache = kwargs.get("core_tile_cache")
+        self._core_tile_path = kwargs.get("core_tile_path")
 
     def read(
         self, validity_check=False, indexes=None, resampling="nearest",
@@ -220,11 +236,28 @@ class InputTile(base.InputTile):
                         dtype=self._profile["dtype"]),
                     mask=True
                 )
+            if self._core_tile_path is not None and (
+                self._core_tile_cache is not None and
+                covered_by_core_tiles(self.tile)
+            ):
+                return read_from_core_tiles(
+                    self.tile,
+                    lambda core: self._read_core_tile(
+                        core, indexes, resampling, dst_nodata, gdal_opts),
+                    self._core_tile_cache,
+                    (
+                        self._core_tile_path(self.tile),
+                        indexes if indexes is None or isinstance(indexes, int)
+                        else tuple(indexes),
+                        resampling, dst_nodata
+                    )
+                )
             tiles = [
                 (_tile, read_raster_window(
                     _path, _tile, indexes=indexes, resampling=resampling,
                     src_nodata=self._profile["nodata"], dst_nodata=dst_nodata,
-                    gdal_opts=gdal_opts))
+                    gdal_opts=gdal_opts,
+                    core_tile_cache=self._core_tile_cache))
                 for _tile, _path in self._tiles_paths
             ]
             return resample_from_array(
@@ -244,6 +277,26 @@ class InputTile(base.InputTile):
         """
         return len(self._tiles_paths) == 0
 
+    def _read_core_tile(
+        self, tile, indexes, resampling, dst_nodata, gdal_opts
+    ):
+        path = self._core_tile_path(tile)
+        if not _path_exists(path):
+            count = len(indexes) if isinstance(indexes, list) else (
+                1 if indexes else self._profile["count"])
+            return ma.masked_array(
+                data=np.full(
+                    (count, ) + tile.shape, self._profile["nodata"],
+                    dtype=self._profile["dtype"]),
+                mask=True
+            )
+        data = read_raster_window(
+            path, tile, indexes=indexes, resampling=resampling,
+            src_nodata=self._profile["nodata"], dst_nodata=dst_nodata,
+            gdal_opts=gdal_opts)
+        # directory tiles are always read as 3D arrays
+        return ma.expand_dims(data, axis=0) if data.ndim == 2 else data
+
 
 def _absolute_path(directory, path):
     """Return absolute path if local."""
@@ -1,5 +1,6 @@
 """Functions for reading and writing data."""
 
+import os
 import rasterio
 from shapely.geometry import box
 from tilematrix import TilePyramid
@@ -85,3 +86,43 @@ def path_is_remote(path):
     is_remote : bool
     """
     return path.startswith(("http://", "https://"))
+
+
+def tile_directory_index(path, zoom, file_extension):
+    """
+    Return existing tiles of a zoom level in a tile directory.
+
+    The zoom level and row directories are listed once in bulk instead of
+    checking every tile file separately.
+
+    Parameters
+    ----------
+    path : string
+        root directory of tiles stored as ``<zoom>/<row>/<col><extension>``
+    zoom : integer
+        zoom level
+    file_extension : string
+        tile file extension (e.g. ".tif")
+
+    Returns
+    -------
+    tiles : set
+        rows and columns of existing tiles
+    """
+    zoomdir = os.path.join(path, str(zoom))
+    index = set()
+    for row in _listdir(zoomdir):
+        if not row.isdigit():
+            continue
+        for filename in _listdir(os.path.join(zoomdir, row)):
+            col, ext = os.path.splitext(filename)
+            if ext == file_extension and col.isdigit():
+                index.add((int(row), int(col)))
+    return index
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
@@ -1,19 +1,21 @@
 """Wrapper functions around rasterio and useful raster functions."""
 
 import itertools
+import os
 import rasterio
 import logging
 import six
+import threading
 import numpy as np
 import numpy.ma as ma
 from affine import Affine
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
 from rasterio.enums import Resampling
 from rasterio.io import MemoryFile
 from rasterio.vrt import WarpedVRT
-from rasterio.warp import reproject
+from rasterio.warp import reproject, transform_bounds
 from rasterio.windows import from_bounds
-from shapely.ops import cascaded_union
 from tilematrix import clip_geometry_to_srs_bounds
 from types import GeneratorType
 
@@ -27,11 +29,117 @@ ReferencedRaster = namedtuple("ReferencedRaster", ("data", "affine"))
 GDAL_HTTP_OPTS = dict(
     GDAL_DISABLE_READDIR_ON_OPEN=True,
     GDAL_HTTP_TIMEOUT=30)
+# maximum number of idle datasets kept open per process
+DATASET_POOL_SIZE = 64
+# tolerated deviation of a target grid from the source pixel grid in pixels
+ALIGNMENT_TOLERANCE = 1e-6
+# resampling methods computed without GDAL for 2:1 reductions on the same grid
+NATIVE_DOWNSAMPLING = ("nearest", "average", "mode", "min", "max")
+NATIVE_UPSAMPLING = ("nearest", "bilinear")
+
+
+class DatasetPool(object):
+    """
+    Keep opened rasterio datasets for reuse.
+
+    A dataset is checked out exclusively, so it is never used by two threads
+    at once. Up to maxsize idle datasets are kept open and the least recently
+    used are closed first. Datasets inherited from a parent process are not
+    reused after a fork.
+
+    Parameters
+    ----------
+    maxsize : int
+        maximum number of idle datasets
+    """
+
+    def __init__(self, maxsize=DATASET_POOL_SIZE):
+        """Initialize."""
+        self.maxsize = maxsize
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        # key --> idle datasets, least recently used key first
+        self._idle = OrderedDict()
+        self._size = 0
+
+    @contextmanager
+    def checkout(
+        self, path, gdal_opts=None, validate=False, overview_level=None
+    ):
+        """
+        Check out an open dataset.
+
+        Parameters
+        ----------
+        path : string
+            path to a raster file readable by rasterio
+        gdal_opts : dict
+            GDAL options the dataset is opened with; datasets opened with other
+            options are not reused
+        validate : bool
+            do not reuse the dataset if the file was modified since it was
+            opened (default: False)
+        overview_level : int
+            open overview level instead of full resolution data
+
+        Yields
+        ------
+        dataset : ``rasterio.io.DatasetReader``
+        """
+        if self._pid != os.getpid():
+            self._reset()
+        key = (
+            path, tuple(sorted((gdal_opts or {}).items())), overview_level)
+        if validate:
+            stat = os.stat(path)
+            key += (stat.st_ino, stat.st_size, stat.st_mtime)
+        with self._lock:
+            idle = self._idle.pop(key, [])
+            src = idle.pop() if idle else None
+            if src is not None:
+                self._size -= 1
+            if idle:
+                self._idle[key] = idle
+        if src is None:
+            if overview_level is None:
+                src = rasterio.open(path, "r")
+            else:
+                src = rasterio.open(path, "r", OVERVIEW_LEVEL=overview_level)
+        try:
+            yield src
+        except Exception:
+            src.close()
+            raise
+        with self._lock:
+            self._idle[key] = self._idle.pop(key, []) + [src]
+            self._size += 1
+            while self._size > self.maxsize:
+                lru_key = next(iter(self._idle))
+                idle = self._idle.pop(lru_key)
+                idle.pop(0).close()
+                self._size -= 1
+                if idle:
+                    self._idle[lru_key] = idle
+
+    def clear(self):
+        """Close all idle datasets."""
+        with self._lock:
+            for idle in self._idle.values():
+                for src in idle:
+                    src.close()
+            self._idle.clear()
+            self._size = 0
+
+
+DATASET_POOL = DatasetPool()
 
 
 def read_raster_window(
     input_file, tile, indexes=None, resampling="nearest", src_nodata=None,
-    dst_nodata=None, gdal_opts=None
+    dst_nodata=None, gdal_opts=None, core_tile_cache=None
 ):
     """
     Return NumPy arrays from an input raster.
@@ -41,6 +149,11 @@ def read_raster_window(
     of the antimeridian will be read and concatenated to the numpy array
     accordingly.
 
+    If a core_tile_cache is given, the unbuffered tiles ("core tiles")
+    overlapping with tile are read, cached and stitched together instead of
+    reading the buffered tile. Neighboring buffered tiles then share their
+    overlapping pixels instead of reading them again.
+
     Parameters
     ----------
     input_file : string
@@ -57,11 +170,28 @@ def read_raster_window(
         if not set, the nodata value from the source dataset will be used
     gdal_opts : dict
         GDAL options passed on to rasterio.Env()
+    core_tile_cache : ``mapchete._cache.ProcessTileCache``
+        cache for unbuffered tiles (default: None)
 
     Returns
     -------
     raster : MaskedArray
     """
+    if core_tile_cache is not None and covered_by_core_tiles(tile):
+        return read_from_core_tiles(
+            tile,
+            lambda core: read_raster_window(
+                input_file, core, indexes=indexes, resampling=resampling,
+                src_nodata=src_nodata, dst_nodata=dst_nodata,
+                gdal_opts=gdal_opts),
+            core_tile_cache,
+            (
+                input_file,
+                indexes if indexes is None or isinstance(indexes, int)
+                else tuple(indexes),
+                resampling, src_nodata, dst_nodata
+            )
+        )
     dst_shape = tile.shape
     user_opts = {} if gdal_opts is None else dict(**gdal_opts)
     if path_is_remote(input_file):
@@ -96,6 +226,95 @@ def read_raster_window(
         )
 
 
+def read_from_core_tiles(tile, read_core, cache, cache_key=None):
+    """
+    Assemble a buffered tile from cached unbuffered tiles.
+
+    The unbuffered tiles ("core tiles") of the same pyramid overlapping with
+    tile are read only if they are not yet cached and then stitched together.
+    Check whether this is possible using ``covered_by_core_tiles()`` first.
+
+    Parameters
+    ----------
+    tile : ``BufferedTile``
+        tile to be read
+    read_core : callable
+        function returning the masked array of an unbuffered ``BufferedTile``
+    cache : ``mapchete._cache.ProcessTileCache``
+        core tile cache
+    cache_key : hashable
+        identifies input and read parameters
+
+    Returns
+    -------
+    raster : MaskedArray
+    """
+    size = tile.tile_pyramid.metatile_size
+    # buffered tile window in pixels of the whole tile matrix
+    top = tile.row * size - tile.pixelbuffer
+    left = tile.col * size - tile.pixelbuffer
+    bottom, right = top + tile.height, left + tile.width
+    stitched = None
+    for row in range(top // size, (bottom - 1) // size + 1):
+        for col in range(left // size, (right - 1) // size + 1):
+            data = cache.get(
+                (cache_key, (tile.zoom, row, col)),
+                lambda row=row, col=col: read_core(BufferedTile(
+                    tile.tile_pyramid.tile(tile.zoom, row, col)))
+            )
+            if stitched is None:
+                shape = data.shape[:-2] + tile.shape
+                stitched = ma.masked_array(
+                    data=np.empty(shape, dtype=data.dtype),
+                    mask=np.ones(shape, dtype=bool),
+                    fill_value=data.fill_value)
+            # overlapping rows and columns in tile and core tile
+            core_top, core_left = row * size, col * size
+            minrow = max(top, core_top)
+            maxrow = min(bottom, core_top + size)
+            mincol = max(left, core_left)
+            maxcol = min(right, core_left + size)
+            dst = (
+                Ellipsis, slice(minrow - top, maxrow - top),
+                slice(mincol - left, maxcol - left))
+            src = (
+                Ellipsis, slice(minrow - core_top, maxrow - core_top),
+                slice(mincol - core_left, maxcol - core_left))
+            stitched.data[dst] = data.data[src]
+            stitched.mask[dst] = ma.getmaskarray(data)[src]
+    return stitched
+
+
+def covered_by_core_tiles(tile):
+    """
+    Determine whether a tile can be assembled from unbuffered tiles.
+
+    This is not the case for buffered tiles touching the pyramid edges, as
+    these are read from both sides of the antimeridian.
+
+    Parameters
+    ----------
+    tile : ``BufferedTile``
+
+    Returns
+    -------
+    bool
+    """
+    return _within_pyramid(tile) and not (
+        tile.pixelbuffer and _is_on_edge(tile))
+
+
+def _within_pyramid(tile):
+    """Determine whether buffered tile lies within pyramid bounds."""
+    left, bottom, right, top = tile.bounds
+    return all([
+        left >= tile.tile_pyramid.left,
+        bottom >= tile.tile_pyramid.bottom,
+        right <= tile.tile_pyramid.right,
+        top <= tile.tile_pyramid.top
+    ])
+
+
 def _get_warped_edge_array(
     tile=None, input_file=None, indexes=None, dst_shape=None, resampling=None,
     src_nodata=None, dst_nodata=None, gdal_opts=None
@@ -154,33 +373,142 @@ def _get_warped_array(
 ):
     """Extract a numpy array from a raster file."""
     with rasterio.Env(**gdal_opts):
-        with rasterio.open(input_file, "r") as src:
-            if indexes is None:
-                dst_shape = (len(src.indexes), dst_shape[-2], dst_shape[-1], )
-                indexes = list(src.indexes)
-            src_nodata = src.nodata if src_nodata is None else src_nodata
-            dst_nodata = src.nodata if dst_nodata is None else dst_nodata
-            with WarpedVRT(
-                src,
-                dst_crs=dst_crs,
-                src_nodata=src_nodata,
-                dst_nodata=dst_nodata,
-                dst_width=dst_shape[-2],
-                dst_height=dst_shape[-1],
-                dst_transform=Affine(
-                    (dst_bounds[2] - dst_bounds[0]) / dst_shape[-2],
-                    0, dst_bounds[0], 0,
-                    (dst_bounds[1] - dst_bounds[3]) / dst_shape[-1],
-                    dst_bounds[3]
-                ),
-                resampling=Resampling[resampling]
-            ) as vrt:
-                return vrt.read(
-                    window=vrt.window(*dst_bounds),
-                    out_shape=dst_shape,
-                    indexes=indexes,
-                    masked=True
-                )
+        with DATASET_POOL.checkout(input_file, gdal_opts) as src:
+            overview_level = _best_overview_level(
+                src, dst_bounds, dst_shape, dst_crs)
+            if overview_level is None:
+                return _read_window(
+                    src, indexes, dst_bounds, dst_shape, dst_crs, resampling,
+                    src_nodata, dst_nodata)
+        # read only from overview matching the target resolution
+        with DATASET_POOL.checkout(
+            input_file, gdal_opts, overview_level=overview_level
+        ) as src:
+            return _read_window(
+                src, indexes, dst_bounds, dst_shape, dst_crs, resampling,
+                src_nodata, dst_nodata)
+
+
+def _read_window(
+    src, indexes, dst_bounds, dst_shape, dst_crs, resampling, src_nodata,
+    dst_nodata
+):
+    if indexes is None:
+        dst_shape = (len(src.indexes), dst_shape[-2], dst_shape[-1], )
+        indexes = list(src.indexes)
+    src_nodata = src.nodata if src_nodata is None else src_nodata
+    dst_nodata = src.nodata if dst_nodata is None else dst_nodata
+    offsets = _aligned_offsets(src, dst_bounds, dst_shape, dst_crs)
+    # source pixels can be copied without warping; other resampling methods
+    # than nearest change values next to nodata when warping
+    if offsets is not None and src_nodata is not None and (
+        resampling == "nearest"
+    ):
+        return _read_aligned(
+            src, offsets, indexes, dst_shape, src_nodata, dst_nodata)
+    with WarpedVRT(
+        src,
+        dst_crs=dst_crs,
+        src_nodata=src_nodata,
+        dst_nodata=dst_nodata,
+        dst_width=dst_shape[-2],
+        dst_height=dst_shape[-1],
+        dst_transform=Affine(
+            (dst_bounds[2] - dst_bounds[0]) / dst_shape[-2],
+            0, dst_bounds[0], 0,
+            (dst_bounds[1] - dst_bounds[3]) / dst_shape[-1],
+            dst_bounds[3]
+        ),
+        resampling=Resampling[resampling]
+    ) as vrt:
+        data = vrt.read(
+            window=vrt.window(*dst_bounds),
+            out_shape=dst_shape,
+            indexes=indexes,
+            masked=True
+        )
+    # older rasterio versions use the source nodata value as fill_value
+    if dst_nodata is not None:
+        data.set_fill_value(dst_nodata)
+    return data
+
+
+def _best_overview_level(src, dst_bounds, dst_shape, dst_crs):
+    """
+    Return coarsest overview level still at least as fine as the target.
+
+    Internal as well as external (.ovr) overviews are considered. Returns None
+    if the full resolution data has to be read.
+    """
+    factors = src.overviews(1)
+    if not factors:
+        return None
+    if src.crs == dst_crs:
+        left, bottom, right, top = dst_bounds
+    else:
+        try:
+            left, bottom, right, top = transform_bounds(
+                dst_crs, src.crs, *dst_bounds)
+        except Exception:
+            return None
+    dst_res = min(
+        (right - left) / dst_shape[-1], (top - bottom) / dst_shape[-2])
+    src_res = min(src.res)
+    best_level, best_factor = None, 1
+    for level, factor in enumerate(factors):
+        if best_factor < factor and src_res * factor <= dst_res:
+            best_level, best_factor = level, factor
+    return best_level
+
+
+def _aligned_offsets(src, dst_bounds, dst_shape, dst_crs):
+    """
+    Return row and column offsets if target grid matches source pixel grid.
+
+    Returns None if CRS or pixel size differ or if the target bounds are not
+    aligned with the source pixels.
+    """
+    transform = src.transform
+    if src.crs != dst_crs or transform.b != 0 or transform.d != 0:
+        return None
+    left, bottom, right, top = dst_bounds
+    x_size = (right - left) / dst_shape[-1]
+    y_size = (top - bottom) / dst_shape[-2]
+    if (
+        abs(transform.a - x_size) > x_size * ALIGNMENT_TOLERANCE or
+        abs(-transform.e - y_size) > y_size * ALIGNMENT_TOLERANCE
+    ):
+        return None
+    row_off = (transform.f - top) / -transform.e
+    col_off = (left - transform.c) / transform.a
+    if (
+        abs(row_off - round(row_off)) > ALIGNMENT_TOLERANCE or
+        abs(col_off - round(col_off)) > ALIGNMENT_TOLERANCE
+    ):
+        return None
+    return int(round(row_off)), int(round(col_off))
+
+
+def _read_aligned(src, offsets, indexes, dst_shape, src_nodata, dst_nodata):
+    """Read window from aligned source and pad areas outside the source."""
+    row_off, col_off = offsets
+    height, width = dst_shape[-2], dst_shape[-1]
+    data = np.full(dst_shape, src_nodata, dtype=src.dtypes[0])
+    # only read the part of the window covered by the source
+    row_start, row_end = max(row_off, 0), min(row_off + height, src.height)
+    col_start, col_end = max(col_off, 0), min(col_off + width, src.width)
+    if row_start < row_end and col_start < col_end:
+        data[
+            ..., row_start - row_off:row_end - row_off,
+            col_start - col_off:col_end - col_off
+        ] = src.read(
+            indexes, window=((row_start, row_end), (col_start, col_end)))
+    if np.isnan(src_nodata):
+        mask = np.isnan(data)
+    else:
+        mask = data == src_nodata
+    data[mask] = dst_nodata
+    return ma.masked_array(data, mask=mask, fill_value=dst_nodata)
 
 
 def _is_on_edge(tile):
@@ -230,17 +558,21 @@ def write_raster_window(
     if "affine" in out_profile:
         out_profile["transform"] = out_profile.pop("affine")
     # write if there is any band with non-masked data
-    if window_data.all() is not ma.masked:
+    if not ma.getmaskarray(window_data).all():
         if out_path == "memoryfile":
             memfile = MemoryFile()
             with memfile.open(**out_profile) as dst:
                 for band, data in enumerate(window_data):
-                    dst.write(data.astype(out_profile["dtype"]), band + 1)
+                    dst.write(
+                        data.astype(out_profile["dtype"], copy=False),
+                        band + 1)
             return memfile
         else:
             with rasterio.open(out_path, 'w', **out_profile) as dst:
                 for band, data in enumerate(window_data):
-                    dst.write(data.astype(out_profile["dtype"]), band + 1)
+                    dst.write(
+                        data.astype(out_profile["dtype"], copy=False),
+                        band + 1)
 
 
 def extract_from_array(in_raster=None, in_affine=None, out_tile=None):
@@ -287,6 +619,14 @@ def resample_from_array(
     """
     Extract and resample from array to target tile.
 
+    If the target tile has exactly twice the pixel size of the input array on
+    the same grid (e.g. when interpolating from a lower baselevel) and the
+    resampling method is one of NATIVE_DOWNSAMPLING, the 2x2 pixel blocks are
+    reduced using NumPy instead of rasterio.warp.reproject(), yielding the
+    same result. Likewise, target tiles with exactly half the pixel size (e.g.
+    when interpolating from a higher baselevel) are upsampled using NumPy if
+    the resampling method is one of NATIVE_UPSAMPLING.
+
     Parameters
     ----------
     in_raster : array
@@ -329,6 +669,16 @@ def resample_from_array(
         raise TypeError("input array must have 2 or 3 dimensions")
     if in_raster.fill_value != nodataval:
         ma.set_fill_value(in_raster, nodataval)
+    if resampling in NATIVE_DOWNSAMPLING:
+        offsets = _grid_offsets(in_affine, out_tile, 2)
+        if offsets is not None:
+            return _downsample(
+                in_raster, offsets, out_tile.shape, resampling, nodataval)
+    if resampling in NATIVE_UPSAMPLING:
+        offsets = _grid_offsets(in_affine, out_tile, .5)
+        if offsets is not None:
+            return _upsample(
+                in_raster, offsets, out_tile.shape, resampling, nodataval)
     out_shape = (in_raster.shape[0], ) + out_tile.shape
     dst_data = np.empty(out_shape, in_raster.dtype)
     in_raster = ma.masked_array(
@@ -340,10 +690,249 @@ def resample_from_array(
     return ma.MaskedArray(dst_data, mask=dst_data == nodataval)
 
 
+def _grid_offsets(in_affine, out_tile, scale):
+    """
+    Return row and column offsets of target tile relative to input array.
+
+    Offsets are given in the smaller pixel size of input array and target
+    tile. Returns None if the target pixels are not exactly scale times as
+    large as the input pixels or if they are not aligned with the pixel grid.
+    """
+    if in_affine.b != 0 or in_affine.d != 0:
+        return None
+    x_size, y_size = in_affine.a, -in_affine.e
+    if (
+        abs(out_tile.pixel_x_size - scale * x_size) >
+        x_size * ALIGNMENT_TOLERANCE or
+        abs(out_tile.pixel_y_size - scale * y_size) >
+        y_size * ALIGNMENT_TOLERANCE
+    ):
+        return None
+    if scale < 1:
+        x_size, y_size = out_tile.pixel_x_size, out_tile.pixel_y_size
+    left, _, _, top = out_tile.bounds
+    row_off = (in_affine.f - top) / y_size
+    col_off = (left - in_affine.c) / x_size
+    if (
+        abs(row_off - round(row_off)) > ALIGNMENT_TOLERANCE or
+        abs(col_off - round(col_off)) > ALIGNMENT_TOLERANCE
+    ):
+        return None
+    return int(round(row_off)), int(round(col_off))
+
+
+def _downsample(in_raster, offsets, out_shape, resampling, nodataval):
+    """
+    Reduce each 2x2 block of input pixels to one output pixel.
+
+    Follows GDAL: masked pixels and pixels with the nodata value are ignored,
+    "nearest" uses the lower right pixel of a block, "average" rounds to the
+    nearest integer for integer data types and "mode" prefers the value which
+    first reached the highest count. Valid output pixels which would equal the
+    nodata value are changed to the next value.
+    """
+    height, width = out_shape
+    data, valid = _window_with_padding(
+        in_raster, offsets, (height * 2, width * 2), nodataval)
+    # views on the four pixels of each block: upper left, upper right, lower
+    # left and lower right
+    quarters = [
+        (data[:, row::2, col::2], valid[:, row::2, col::2])
+        for row in (0, 1) for col in (0, 1)
+    ]
+    if resampling == "nearest":
+        out, found = quarters[3]
+    elif resampling == "average":
+        total = np.zeros(quarters[0][0].shape, dtype="float64")
+        found = np.zeros(total.shape, dtype="uint8")
+        for values, mask in quarters:
+            total += np.where(mask, values, 0)
+            found += mask
+        mean = total / np.maximum(found, 1)
+        if np.issubdtype(data.dtype, np.integer):
+            mean = np.floor(mean + .5)
+        out = mean.astype(data.dtype)
+    elif resampling in ("min", "max"):
+        if np.issubdtype(data.dtype, np.integer):
+            info = np.iinfo(data.dtype)
+        else:
+            info = np.finfo(data.dtype)
+        fill = info.max if resampling == "min" else info.min
+        reduce_func = np.minimum if resampling == "min" else np.maximum
+        out = np.full(quarters[0][0].shape, fill, dtype=data.dtype)
+        found = np.zeros(out.shape, dtype=bool)
+        for values, mask in quarters:
+            reduce_func(out, np.where(mask, values, fill), out=out)
+            found |= mask
+    elif resampling == "mode":
+        out, found = _block_mode(quarters)
+    else:
+        raise ValueError("invalid resampling method: %s" % resampling)
+    found = found > 0
+    out = np.where(found, _avoid_nodata(out, nodataval), nodataval).astype(
+        data.dtype, copy=False)
+    return ma.MaskedArray(out, mask=~found)
+
+
+def _upsample(in_raster, offsets, out_shape, resampling, nodataval):
+    """
+    Split each input pixel into 2x2 output pixels.
+
+    "nearest" repeats the input pixels and "bilinear" weights the two nearest
+    input pixels per axis by 3/4 and 1/4. Follows GDAL: masked pixels and
+    pixels with the nodata value are ignored and the weights of the remaining
+    ones are normalized, but an output pixel stays empty if the input pixel it
+    lies within is empty. Valid output pixels which would equal the nodata
+    value are changed to the next value.
+    """
+    row_off, col_off = offsets
+    height, width = out_shape
+    # input pixels covering the target tile and their neighbors
+    start = ((row_off - 1) // 2, (col_off - 1) // 2)
+    data, valid = _window_with_padding(
+        in_raster, start, (
+            (row_off + height) // 2 + 2 - start[0],
+            (col_off + width) // 2 + 2 - start[1]
+        ), nodataval)
+
+    # sums of 3/4 and 1/4 weighted values up to 16 bits are exact in float32
+    dtype = "float32" if data.dtype.itemsize <= 2 else "float64"
+
+    def _resample(values, bilinear=False):
+        return _upsample_axis(
+            _upsample_axis(
+                values, row_off, height, start[0], 1, bilinear, dtype),
+            col_off, width, start[1], 2, bilinear, dtype)
+
+    found = _resample(valid)
+    if resampling == "nearest":
+        out = _resample(data)
+    elif resampling == "bilinear":
+        if valid.all():
+            out = _resample(data, bilinear=True)
+        else:
+            out = _resample(np.where(valid, data, 0), bilinear=True)
+            out /= np.where(found, _resample(valid, bilinear=True), 1)
+        if np.issubdtype(data.dtype, np.integer):
+            out += .5
+            np.floor(out, out=out)
+        out = out.astype(data.dtype)
+    else:
+        raise ValueError("invalid resampling method: %s" % resampling)
+    out = np.where(found, _avoid_nodata(out, nodataval), nodataval).astype(
+        data.dtype, copy=False)
+    return ma.MaskedArray(out, mask=~found)
+
+
+def _upsample_axis(
+    values, offset, size, start, axis, bilinear=False, dtype="float64"
+):
+    """
+    Upsample array by factor two along one axis.
+
+    Output pixels are taken from the input pixel they lie within or, if
+    bilinear is set, interpolated between the two nearest input pixels as
+    dtype. The output starts at offset output pixels and the input array at
+    input pixel start.
+    """
+    shape = list(values.shape)
+    shape[axis] = size
+    out = np.empty(shape, dtype=dtype if bilinear else values.dtype)
+
+    def _index(first, count, step=1):
+        index = [slice(None)] * values.ndim
+        index[axis] = slice(first, first + count * step, step)
+        return tuple(index)
+
+    # every second output pixel has the same position relative to the input
+    # pixel centers
+    for parity in (0, 1):
+        count = (size - parity + 1) // 2
+        position = (offset + parity + .5) / 2 - .5 - start
+        lower = int(np.floor(position))
+        weight = position - lower
+        if bilinear:
+            out[_index(parity, count, 2)] = (
+                values[_index(lower, count)] * (1 - weight) +
+                values[_index(lower + 1, count)] * weight
+            )
+        else:
+            out[_index(parity, count, 2)] = values[
+                _index(lower + int(weight > .5), count)]
+    return out
+
+
+def _avoid_nodata(values, nodataval):
+    """Replace nodata values like GDAL does for valid warped pixels."""
+    dtype = values.dtype
+    if np.issubdtype(dtype, np.integer):
+        if nodataval == np.iinfo(dtype).min:
+            replacement = nodataval + 1
+        else:
+            replacement = nodataval - 1
+    else:
+        replacement = np.nextafter(
+            dtype.type(nodataval), dtype.type(np.finfo(dtype).max))
+    return np.where(values == nodataval, replacement, values)
+
+
+def _block_mode(quarters):
+    """Return most frequent valid value of each block and validity mask."""
+    keys = []
+    for i, (values, mask) in enumerate(quarters):
+        count = np.zeros(values.shape, dtype="uint8")
+        is_last = mask.copy()
+        for j, (other_values, other_mask) in enumerate(quarters):
+            equal = other_mask & (other_values == values)
+            count += equal
+            if j > i:
+                is_last &= ~equal
+        # a value reaches its count at its last occurrence; prefer higher
+        # counts and then earlier positions
+        keys.append(np.where(is_last, count * 4 + 3 - i, -1))
+    best = np.argmax(np.stack(keys), axis=0)
+    out = np.choose(best, [values for values, _ in quarters])
+    found = np.choose(best, [mask for _, mask in quarters])
+    return out, found
+
+
+def _window_with_padding(in_raster, offsets, shape, nodataval):
+    """
+    Return data and validity of an array window, padded where it is outside.
+
+    The data array is a view if the window lies within the input array.
+    """
+    row_off, col_off = offsets
+    height, width = shape
+    data, mask = in_raster.data, ma.getmaskarray(in_raster)
+    in_height, in_width = data.shape[-2:]
+    # intersection of window and input array in input pixel coordinates
+    minrow, maxrow = max([row_off, 0]), min([row_off + height, in_height])
+    mincol, maxcol = max([col_off, 0]), min([col_off + width, in_width])
+    src = (slice(None), slice(minrow, maxrow), slice(mincol, maxcol))
+    if (minrow, maxrow, mincol, maxcol) == (
+        row_off, row_off + height, col_off, col_off + width
+    ):
+        return data[src], ~mask[src] & (data[src] != nodataval)
+    out_data = np.full((data.shape[0], ) + shape, nodataval, dtype=data.dtype)
+    out_valid = np.zeros(out_data.shape, dtype=bool)
+    if minrow < maxrow and mincol < maxcol:
+        dst = (
+            slice(None), slice(minrow - row_off, maxrow - row_off),
+            slice(mincol - col_off, maxcol - col_off)
+        )
+        out_data[dst] = data[src]
+        out_valid[dst] = ~mask[src] & (data[src] != nodataval)
+    return out_data, out_valid
+
+
 def create_mosaic(tiles, nodata=0):
     """
     Create a mosaic from tiles.
 
+    Tiles are placed using their integer pixel offsets within the tile pyramid
+    grid and copied exactly once into a preallocated mosaic array.
+
     Parameters
     ----------
     tiles : iterable
@@ -359,73 +948,77 @@ def create_mosaic(tiles, nodata=0):
         tiles = list(tiles)
     elif not isinstance(tiles, list):
         raise TypeError("tiles must be either a list or generator")
-    if not all([isinstance(pair, tuple) for pair in tiles]):
-        raise TypeError("tiles items must be tuples")
-    if not all([
-        all([isinstance(tile, BufferedTile), isinstance(data, np.ndarray)])
-        for tile, data in tiles
-    ]):
-        raise TypeError("tuples must be pairs of BufferedTile and array")
     if len(tiles) == 0:
         raise ValueError("tiles list is empty")
 
+    # assert all tiles have same properties
+    pyramid, resolution, dtype = _get_tiles_properties(tiles)
+
     # quick return if there is just one tile
     if len(tiles) == 1:
         tile, data = tiles[0]
         return ReferencedRaster(data=data, affine=tile.affine)
 
-    # assert all tiles have same properties
-    pyramid, resolution, dtype = _get_tiles_properties(tiles)
+    # pixel offsets of tiles within the pyramid grid
+    offsets = grid_offsets = [
+        _pixel_offsets(tile, pyramid, resolution) for tile, _ in tiles
+    ]
     # just handle antimeridian on global pyramid types
-    shift = _shift_required(tiles)
+    if _shift_required(tiles):
+        # move tiles by half the globe and wrap the ones now outside the
+        # pyramid back to its western side
+        width_px = int(round(pyramid.x_size / resolution))
+        shift = width_px // 2
+        offsets = [
+            (
+                row_off,
+                col_off + shift - (
+                    width_px
+                    if col_off + shift + tile.pixelbuffer >= width_px
+                    else 0
+                )
+            )
+            for (tile, _), (row_off, col_off) in zip(tiles, grid_offsets)
+        ]
+    else:
+        shift = 0
     # determine mosaic shape and reference
-    m_left, m_bottom, m_right, m_top = None, None, None, None
-    for tile, data in tiles:
-        num_bands = data.shape[0] if data.ndim > 2 else 1
-        left, bottom, right, top = tile.bounds
-        if shift:
-            left += pyramid.x_size / 2
-            right += pyramid.x_size / 2
-            # if tile is now shifted outside pyramid bounds, move within
-            if right > pyramid.right:
-                right -= pyramid.x_size
-                left -= pyramid.x_size
-        m_left = min([left, m_left]) if m_left is not None else left
-        m_bottom = min([bottom, m_bottom]) if m_bottom is not None else bottom
-        m_right = max([right, m_right]) if m_right is not None else right
-        m_top = max([top, m_top]) if m_top is not None else top
-    height = int(round((m_top - m_bottom) / resolution))
-    width = int(round((m_right - m_left) / resolution))
+    m_row_off = min(row_off for row_off, _ in offsets)
+    m_col_off = min(col_off for _, col_off in offsets)
+    height = max(
+        row_off + tile.height
+        for (tile, _), (row_off, _) in zip(tiles, offsets)
+    ) - m_row_off
+    width = max(
+        col_off + tile.width
+        for (tile, _), (_, col_off) in zip(tiles, offsets)
+    ) - m_col_off
+    num_bands = tiles[0][1].shape[0] if tiles[0][1].ndim > 2 else 1
     # initialize empty mosaic
-    mosaic = ma.MaskedArray(
-        data=np.full(
-            (num_bands, height, width), dtype=dtype, fill_value=nodata),
-        mask=np.ones((num_bands, height, width))
-    )
-    # create Affine
-    affine = Affine(resolution, 0, m_left, 0, -resolution, m_top)
+    mosaic_data = np.full((num_bands, height, width), nodata, dtype=dtype)
+    mosaic_mask = np.ones((num_bands, height, width), dtype=bool)
     # fill mosaic array with tile data
-    for tile, data in tiles:
-        data = prepare_array(data, nodata=nodata, dtype=dtype)
-        t_left, t_bottom, t_right, t_top = tile.bounds
-        if shift:
-            t_left += pyramid.x_size / 2
-            t_right += pyramid.x_size / 2
-            # if tile is now shifted outside pyramid bounds, move within
-            if t_right > pyramid.right:
-                t_right -= pyramid.x_size
-                t_left -= pyramid.x_size
-        minrow, maxrow, mincol, maxcol = _bounds_to_ranges(
-            (t_left, t_bottom, t_right, t_top), affine, (height, width)
-        )
-        mosaic[:, minrow:maxrow, mincol:maxcol] = data
-        mosaic.mask[:, minrow:maxrow, mincol:maxcol] = data.mask
-    if shift:
-        # shift back output mosaic
-        affine = Affine(
-            resolution, 0, m_left - pyramid.x_size / 2, 0, -resolution, m_top
+    for (tile, data), (row_off, col_off) in zip(tiles, offsets):
+        window = (
+            slice(None),
+            slice(row_off - m_row_off, row_off - m_row_off + tile.height),
+            slice(col_off - m_col_off, col_off - m_col_off + tile.width)
         )
-    return ReferencedRaster(data=mosaic, affine=affine)
+        _copy_to_window(data, mosaic_data, mosaic_mask, window, nodata)
+    # create Affine from bounds of the westernmost and northernmost tiles,
+    # shifted back if required
+    m_left = min(
+        tile.bounds.left + (col_off - grid_col_off - shift) * resolution
+        for (tile, _), (_, col_off), (_, grid_col_off) in zip(
+            tiles, offsets, grid_offsets)
+        if col_off == m_col_off
+    )
+    m_top = max(tile.bounds.top for tile, _ in tiles)
+    affine = Affine(resolution, 0, m_left, 0, -resolution, m_top)
+    return ReferencedRaster(
+        data=ma.MaskedArray(data=mosaic_data, mask=mosaic_mask, copy=False),
+        affine=affine
+    )
 
 
 def _bounds_to_ranges(bounds, affine, shape):
@@ -437,27 +1030,60 @@ def _bounds_to_ranges(bounds, affine, shape):
     )
 
 
+def _pixel_offsets(tile, pyramid, resolution):
+    """Return row and column of upper left tile pixel in the pyramid grid."""
+    left, _, _, top = tile.bounds
+    return (
+        int(round((pyramid.top - top) / resolution)),
+        int(round((left - pyramid.left) / resolution))
+    )
+
+
+def _copy_to_window(data, out_data, out_mask, window, nodata):
+    """Copy tile data and its mask into a window of the mosaic arrays."""
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    dst_data, dst_mask = out_data[window], out_mask[window]
+    np.copyto(dst_data, ma.getdata(data), casting="unsafe")
+    mask = ma.getmask(data)
+    if mask is not ma.nomask and mask.shape == data.shape:
+        np.copyto(dst_mask, mask)
+    else:
+        # same as prepare_array(): unmasked input is masked by nodata value
+        _nodata_mask(ma.getdata(data), nodata, out=dst_mask)
+
+
 def _get_tiles_properties(tiles):
-    for tile, data in tiles:
-        if tile.zoom != tiles[0][0].zoom:
+    first_tile = None
+    for pair in tiles:
+        if not isinstance(pair, tuple):
+            raise TypeError("tiles items must be tuples")
+        tile, data = pair
+        if not isinstance(tile, BufferedTile) or not isinstance(
+            data, np.ndarray
+        ):
+            raise TypeError("tuples must be pairs of BufferedTile and array")
+        if first_tile is None:
+            first_tile, first_data = tile, data
+        elif tile.zoom != first_tile.zoom:
             raise ValueError("all tiles must be from same zoom level")
-        if tile.crs != tiles[0][0].crs:
+        elif tile.crs != first_tile.crs:
             raise ValueError("all tiles must have the same CRS")
-        if not isinstance(data, (np.ndarray, tuple)):
-            raise TypeError("tile data has to be np.ndarray or tuple")
-        if data[0].dtype != tiles[0][1][0].dtype:
+        elif data.dtype != first_data.dtype:
             raise TypeError("all tile data must have the same dtype")
-    return tile.tile_pyramid, tile.pixel_x_size, data[0].dtype
+    return first_tile.tile_pyramid, first_tile.pixel_x_size, first_data.dtype
 
 
 def _shift_required(tiles):
-    """Determine if temporary shift is required to deal with antimeridian."""
+    """
+    Determine if temporary shift is required to deal with antimeridian.
+
+    This is the case on global pyramids if the tile columns are not connected,
+    e.g. when tiles from both sides of the antimeridian are mosaicked.
+    """
     if tiles[0][0].tile_pyramid.is_global:
-        # check if tiles are all connected to each other
-        bbox = cascaded_union([tile.bbox for tile, _ in tiles])
-        connected = True if bbox.geom_type != "MultiPolygon" else False
-        # if tiles are not connected, shift by half the globe
-        return True if not connected else False
+        cols = set(tile.col for tile, _ in tiles)
+        return max(cols) - min(cols) + 1 > len(cols)
     else:
         return False
 
@@ -488,6 +1114,10 @@ def prepare_array(data, masked=True, nodata=0, dtype="int16"):
     is masked, the fill_value corresponds to the given nodata value and the
     nodata value will be burned into the data array.
 
+    Data is only copied if required: arrays which already have the given data
+    type, three dimensions and (if masked) a full mask are returned as they
+    are, so calling this function again on its output does not copy.
+
     Parameters
     ----------
     data : array or iterable
@@ -519,9 +1149,9 @@ def prepare_array(data, masked=True, nodata=0, dtype="int16"):
     # input is a NumPy array
     elif isinstance(data, np.ndarray):
         if masked:
-            return ma.masked_values(data, nodata).astype(dtype)
+            return _masked_by_nodata(data, nodata, dtype)
         else:
-            return data.astype(dtype)
+            return data.astype(dtype, copy=False)
     else:
         raise ValueError(
             "data must be array, masked array or iterable containing arrays.")
@@ -532,38 +1162,49 @@ def _prepare_iterable(data, masked, nodata, dtype):
     out_mask = ()
     for band in data:
         if isinstance(band, ma.MaskedArray):
-            try:
-                out_data += (band.data, )
-                if masked:
-                    assert band.shape == band.mask.shape
+            out_data += (band.data, )
+            if masked:
+                if band.shape == band.mask.shape:
                     out_mask += (band.mask, )
-            except AssertionError:
-                out_mask += (
-                    np.where(band.data == nodata, True, False), )
+                else:
+                    out_mask += (band.data == nodata, )
         elif isinstance(band, np.ndarray):
             out_data += (band, )
             if masked:
-                out_mask += (np.where(band == nodata, True, False), )
+                out_mask += (band == nodata, )
         else:
             raise ValueError("input data bands must be NumPy arrays")
+    out_data = np.stack(out_data).astype(dtype, copy=False)
     if masked:
         assert len(out_data) == len(out_mask)
         return ma.MaskedArray(
-            data=np.stack(out_data).astype(dtype),
-            mask=np.stack(out_mask))
+            data=out_data, mask=np.stack(out_mask), copy=False)
     else:
-        return np.stack(out_data).astype(dtype)
+        return out_data
 
 
 def _prepare_masked(data, masked, nodata, dtype):
-    try:
-        assert data.shape == data.mask.shape
-        if masked:
-            return data.astype(dtype)
-        else:
-            return ma.filled(data, nodata).astype(dtype)
-    except AssertionError:
-        if masked:
-            return ma.masked_values(data, nodata).astype(dtype)
+    if masked:
+        if data.shape == data.mask.shape:
+            return data.astype(dtype, copy=False)
         else:
-            return ma.filled(data, nodata).astype(dtype)
+            return _masked_by_nodata(data.data, nodata, dtype)
+    else:
+        return ma.filled(data, nodata).astype(dtype, copy=False)
+
+
+def _masked_by_nodata(data, nodata, dtype):
+    """Mask nodata values and convert array only if dtype differs."""
+    return ma.MaskedArray(
+        data=data.astype(dtype, copy=False), mask=_nodata_mask(data, nodata),
+        fill_value=nodata, copy=False)
+
+
+def _nodata_mask(data, nodata, out=None):
+    """Return mask of nodata values like ma.masked_values() does."""
+    if np.issubdtype(data.dtype, np.floating):
+        if out is None:
+            return np.isclose(data, nodata)
+        out[...] = np.isclose(data, nodata)
+        return out
+    return np.equal(data, nodata, out=out)
@@ -1,7 +1,17 @@
 """Mapchtete handling tiles."""
+import numpy as np
+from affine import Affine
+from rasterio.features import rasterize
+from shapely.prepared import prep
 from tilematrix import Tile, TilePyramid
 from cached_property import cached_property
 
+# maximum number of tile matrix cells rasterized at once
+MAX_STRIP_CELLS = 2 ** 22
+
+# space filling curves available for ordering tiles
+TILE_ORDERS = ("hilbert", "zorder")
+
 
 class BufferedTilePyramid(TilePyramid):
     """
@@ -230,3 +240,189 @@ class BufferedTile(Tile):
         parent : ``BufferedTile``
         """
         return BufferedTile(self._tile.get_parent(), self.pixelbuffer)
+
+
+def tile_ids_from_geom(pyramid, geometry, zoom):
+    """
+    Yield ids of all tiles intersecting with geometry.
+
+    Yields the same tiles in the same order as ``tiles_from_geom()`` but
+    rasterizes the geometry onto the tile matrix (one pixel per tile) instead
+    of intersecting every tile within the geometry bounds.
+
+    Parameters
+    ----------
+    pyramid : ``TilePyramid`` or ``BufferedTilePyramid``
+    geometry : ``shapely.geometry``
+    zoom : integer
+        zoom level
+
+    Yields
+    ------
+    tile id : tuple
+        zoom, row and column
+    """
+    for tile_id in _fallback_tile_ids(pyramid, geometry, zoom):
+        yield tile_id
+    for row_off, col_off, mask in _tile_matrix_strips(pyramid, geometry, zoom):
+        for row, col in zip(*np.nonzero(mask)):
+            yield zoom, int(row_off + row), int(col_off + col)
+
+
+def count_tiles_from_geom(pyramid, geometry, zoom):
+    """
+    Return number of tiles intersecting with geometry.
+
+    Parameters
+    ----------
+    pyramid : ``TilePyramid`` or ``BufferedTilePyramid``
+    geometry : ``shapely.geometry``
+    zoom : integer
+        zoom level
+
+    Returns
+    -------
+    number of tiles : integer
+    """
+    return sum(
+        1 for _ in _fallback_tile_ids(pyramid, geometry, zoom)
+    ) + sum(
+        int(np.count_nonzero(mask))
+        for _, _, mask in _tile_matrix_strips(pyramid, geometry, zoom)
+    )
+
+
+def curve_index(rows, cols, order="hilbert"):
+    """
+    Return position of tiles along a space filling curve.
+
+    Tiles close to each other on the curve are also close to each other on the
+    tile matrix, therefore sorting tiles by their position creates compact
+    clusters of neighboring tiles.
+
+    Parameters
+    ----------
+    rows : array-like
+        tile rows
+    cols : array-like
+        tile columns
+    order : string
+        ``hilbert`` or ``zorder`` (default: ``hilbert``)
+
+    Returns
+    -------
+    positions : ``numpy.ndarray``
+    """
+    if order not in TILE_ORDERS:
+        raise ValueError("order must be one of %s" % (TILE_ORDERS, ))
+    y = np.array(rows, dtype="int64", copy=True, ndmin=1)
+    x = np.array(cols, dtype="int64", copy=True, ndmin=1)
+    index = np.zeros(x.shape, dtype="int64")
+    if not x.size:
+        return index
+    bits = int(max(x.max(), y.max())).bit_length()
+    if order == "zorder":
+        for bit in range(bits):
+            index |= ((x >> bit) & 1) << (2 * bit)
+            index |= ((y >> bit) & 1) << (2 * bit + 1)
+        return index
+    n = 1 << bits
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        index += s * s * ((3 * rx) ^ ry)
+        # rotate quadrant
+        flip = rx & ~ry
+        x[flip] = n - 1 - x[flip]
+        y[flip] = n - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s >>= 1
+    return index
+
+
+def _can_rasterize(pyramid, geometry):
+    left, _, right, _ = geometry.bounds
+    # points are snapped to one tile and geometries crossing the antimeridian
+    # are split up by tilematrix
+    return geometry.geom_type not in ("Point", "MultiPoint") and (
+        pyramid.left <= left and right <= pyramid.right
+    )
+
+
+def _fallback_tile_ids(pyramid, geometry, zoom):
+    if geometry.is_empty or _can_rasterize(pyramid, geometry):
+        return
+    for tile in pyramid.tiles_from_geom(geometry, zoom):
+        yield tile.id
+
+
+def _tile_matrix_strips(pyramid, geometry, zoom):
+    """
+    Yield row offset, column offset and tile mask for strips of tile rows.
+
+    Tiles touched by the geometry (including their neighbors) are candidates,
+    tiles whose center lies within a polygon certainly intersect and the
+    remaining candidates are checked using the prepared geometry.
+    """
+    if geometry.is_empty or not _can_rasterize(pyramid, geometry):
+        return
+    if not geometry.is_valid:
+        raise ValueError("no valid geometry: %s" % geometry.type)
+    tp = getattr(pyramid, "tile_pyramid", pyramid)
+    left, bottom, right, top = geometry.bounds
+    # same tile matrix window as TilePyramid.tiles_from_bbox()
+    lb = tp.tile_from_xy(
+        left, max(bottom, tp.bottom), zoom, on_edge_use="rt")
+    rt = tp.tile_from_xy(right, min(top, tp.top), zoom, on_edge_use="lb")
+    height, width = lb.row - rt.row + 1, rt.col - lb.col + 1
+    prepared = prep(geometry)
+    polygonal = geometry.geom_type in ("Polygon", "MultiPolygon")
+    strip_rows = max(1, MAX_STRIP_CELLS // width)
+    for strip_start in range(rt.row, rt.row + height, strip_rows):
+        strip_end = min(strip_start + strip_rows, rt.row + height)
+        # rasterize one more row on each side for dilation
+        halo_start = max(strip_start - 1, rt.row)
+        halo_end = min(strip_end + 1, rt.row + height)
+        candidates = _dilate(_rasterize(
+            geometry, tp, zoom, halo_start, lb.col, halo_end - halo_start,
+            width, all_touched=True
+        ))[strip_start - halo_start:strip_end - halo_start]
+        if polygonal:
+            mask = _rasterize(
+                geometry, tp, zoom, strip_start, lb.col,
+                strip_end - strip_start, width, all_touched=False
+            ) & candidates
+        else:
+            # line rasterization does not follow the pixel center rule
+            mask = np.zeros_like(candidates)
+        for row, col in zip(*np.nonzero(candidates & ~mask)):
+            mask[row, col] = prepared.intersects(tp.tile(
+                zoom, strip_start + int(row), lb.col + int(col)).bbox())
+        yield strip_start, lb.col, mask
+
+
+def _rasterize(geometry, tp, zoom, row, col, height, width, all_touched):
+    tile_x_size, tile_y_size = tp.tile_x_size(zoom), tp.tile_y_size(zoom)
+    return rasterize(
+        [geometry],
+        out_shape=(height, width),
+        transform=Affine(
+            tile_x_size, 0, tp.left + col * tile_x_size,
+            0, -tile_y_size, tp.top - row * tile_y_size
+        ),
+        all_touched=all_touched,
+        dtype="uint8"
+    ).astype(bool)
+
+
+def _dilate(mask):
+    """Add all 8 neighbors to True cells."""
+    height, width = mask.shape
+    padded = np.pad(mask, 1, mode="constant")
+    out = np.zeros_like(mask)
+    for row in range(3):
+        for col in range(3):
+            out |= padded[row:row + height, col:col + width]
+    return out
@@ -81,6 +81,12 @@ def cleantopo_br_tif():
     return os.path.join(TESTDATA_DIR, "cleantopo_br.tif")
 
 
+@pytest.fixture
+def cleantopo_tl_tif():
+    """Fixture for cleantopo_tl.tif"""
+    return os.path.join(TESTDATA_DIR, "cleantopo_tl.tif")
+
+
 @pytest.fixture
 def dummy1_3857_tif():
     """Fixture for dummy1_3857.tif"""
@@ -129,6 +135,12 @@ def process_error_py():
     return os.path.join(TESTDATA_DIR, "process_error.py")
 
 
+@pytest.fixture
+def process_failing_tiles_py():
+    """Fixture for process_failing_tiles.py"""
+    return os.path.join(TESTDATA_DIR, "process_failing_tiles.py")
+
+
 @pytest.fixture
 def output_error_py():
     """Fixture for output_error.py"""
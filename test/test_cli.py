@@ -133,6 +133,22 @@ def test_formats(capfd):
     assert not err
 
 
+def test_estimate(capfd, cleantopo_br, dem_to_hillshade):
+    """Output of mapchete estimate command."""
+    MapcheteCLI([
+        None, 'estimate', cleantopo_br.path, '--zoom', '4', '5',
+        '--samples', '2', '--seed', '1', '--multi', '2'])
+    out = capfd.readouterr()[0]
+    assert "CPU hours" in out
+    assert "2 workers" in out
+    # single sample has no confidence interval
+    MapcheteCLI([
+        None, 'estimate', dem_to_hillshade.path, '--zoom', '5',
+        '--samples', '1'])
+    out = capfd.readouterr()[0]
+    assert "CI n/a" in out
+
+
 def test_pyramid_geodetic(cleantopo_br_tif, mp_tmpdir):
     """Automatic geodetic tile pyramid creation of raster files."""
     MapcheteCLI([
@@ -259,7 +275,7 @@ def test_serve_cli_params(cleantopo_br):
     for args in [
         [None, 'serve', cleantopo_br.path],
         [None, 'serve', cleantopo_br.path, "--port", "5001"],
-        [None, 'serve', cleantopo_br.path, "--internal_cache", "512"],
+        [None, 'serve', cleantopo_br.path, "--cache_size", "512"],
         [None, 'serve', cleantopo_br.path, "--zoom", "5"],
         [None, 'serve', cleantopo_br.path, "--bounds", "-1", "-1", "1", "1"],
         [None, 'serve', cleantopo_br.path, "--overwrite"],
@@ -270,6 +286,11 @@ def test_serve_cli_params(cleantopo_br):
             cleantopo_br.path],
     ]:
         MapcheteCLI(args, _test_serve=True)
+    # number of cached tiles is not used anymore
+    with pytest.warns(UserWarning):
+        MapcheteCLI(
+            [None, 'serve', cleantopo_br.path, "--internal_cache", "1024"],
+            _test_serve=True)
 
 
 def test_serve(client, mp_tmpdir):
@@ -225,6 +225,15 @@ def test_input_error(cleantopo_br_tiledir):
         MapcheteConfig(config)
 
 
+def test_invalid_input_cache(cleantopo_br):
+    """Raise MapcheteConfigError if input cache size is invalid."""
+    for input_cache in [-1, "invalid"]:
+        config = deepcopy(cleantopo_br.dict)
+        config.update(input_cache=input_cache)
+        with pytest.raises(errors.MapcheteConfigError):
+            MapcheteConfig(config)
+
+
 def test_import_error(mp_tmpdir, cleantopo_br, import_error_py):
     """Assert import error is raised."""
     config = cleantopo_br.dict
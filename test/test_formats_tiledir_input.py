@@ -1,6 +1,7 @@
 """Test Mapchete default formats."""
 
 from copy import deepcopy
+import numpy as np
 import os
 import pytest
 import six
@@ -74,6 +75,32 @@ def _run_tiledir_process_raster(conf_dict, metatiling, bounds):
             for tile in mp.get_process_tiles(4)])
 
 
+def test_read_raster_data_core_tile_cache(
+    mp_tmpdir, cleantopo_br, cleantopo_br_tiledir
+):
+    """Assemble tiles from cached directory tiles if pyramids are aligned."""
+    with mapchete.open(cleantopo_br.path) as mp:
+        bounds = mp.config.bounds_at_zoom()
+        mp.batch_process(zoom=4)
+    conf = deepcopy(cleantopo_br_tiledir.dict)
+    conf["pyramid"].update(metatiling=8)
+    with mapchete.open(conf, mode="memory", bounds=bounds) as mp:
+        tiles = list(mp.get_process_tiles(4))
+        direct = [
+            next(six.itervalues(mp.config.input)).open(tile).read()
+            for tile in tiles]
+    conf.update(input_cache=16)
+    with mapchete.open(conf, mode="memory", bounds=bounds) as mp:
+        td = next(six.itervalues(mp.config.input))
+        assert td._aligned
+        for tile, data in zip(tiles, direct):
+            cached = td.open(tile).read()
+            assert cached.shape == data.shape
+            assert np.array_equal(cached.mask, data.mask)
+            assert np.array_equal(cached.filled(0), data.filled(0))
+        assert td.core_tile_cache.misses
+
+
 def test_read_remote_raster_data(mp_tmpdir, cleantopo_remote):
     """Read raster data."""
     with mapchete.open(cleantopo_remote.path) as mp:
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Test Mapchete io module."""
 
+import os
 import pytest
 import shutil
 import rasterio
@@ -10,16 +11,20 @@ import numpy.ma as ma
 import fiona
 from shapely.geometry import shape, box, Polygon, MultiPolygon
 from shapely.ops import unary_union
-from rasterio.enums import Compression
+from rasterio.enums import Compression, Resampling
 from rasterio.crs import CRS
+from rasterio.warp import reproject
+from affine import Affine
 from itertools import product
 
+from mapchete._cache import ProcessTileCache
 from mapchete.config import MapcheteConfig
 from mapchete.tile import BufferedTilePyramid
-from mapchete.io import get_best_zoom_level
+from mapchete.io import get_best_zoom_level, tile_directory_index, raster
 from mapchete.io.raster import (
     read_raster_window, write_raster_window, extract_from_array,
-    resample_from_array, create_mosaic, ReferencedRaster, prepare_array)
+    resample_from_array, create_mosaic, ReferencedRaster, prepare_array,
+    DatasetPool, covered_by_core_tiles)
 from mapchete.io.vector import (
     read_vector_window, reproject_geometry, clean_geometry_type,
     segmentize_geometry)
@@ -31,6 +36,20 @@ def test_best_zoom_level(dummy1_tif):
     assert get_best_zoom_level(dummy1_tif, "mercator")
 
 
+def test_tile_directory_index(mp_tmpdir):
+    """Find existing tiles of a zoom level."""
+    for row, col in [(0, 0), (0, 1), (3, 2)]:
+        rowdir = os.path.join(mp_tmpdir, "5", str(row))
+        if not os.path.exists(rowdir):
+            os.makedirs(rowdir)
+        open(os.path.join(rowdir, "%s.tif" % col), "w").close()
+    open(os.path.join(mp_tmpdir, "5", "0", "2.png"), "w").close()
+    assert tile_directory_index(mp_tmpdir, 5, ".tif") == set([
+        (0, 0), (0, 1), (3, 2)])
+    assert tile_directory_index(mp_tmpdir, 5, ".png") == set([(0, 2)])
+    assert tile_directory_index(mp_tmpdir, 6, ".tif") == set()
+
+
 def test_read_raster_window(dummy1_tif, minmax_zoom):
     """Read array with read_raster_window."""
     zoom = 8
@@ -130,6 +149,117 @@ def test_read_raster_window_mask(s2_band):
     assert not np.where(data == 1, True, False).any()
 
 
+def test_read_raster_window_aligned(mp_tmpdir, monkeypatch):
+    """Read from source aligned with tile pyramid without warping."""
+    pyramid = BufferedTilePyramid("geodetic", pixelbuffer=3)
+    origin = pyramid.tile(5, 10, 20)
+    pixel_size = pyramid.pixel_x_size(5)
+    path = os.path.join(mp_tmpdir, "aligned.tif")
+    data = np.arange(2 * 300 * 400, dtype="float32").reshape(2, 300, 400)
+    data[:, 50:60, 70:90] = -1
+    with rasterio.open(
+        path, "w", driver="GTiff", width=400, height=300, count=2,
+        dtype="float32", crs="EPSG:4326", nodata=-1,
+        transform=Affine(
+            pixel_size, 0, origin.left + 3 * pixel_size,
+            0, -pixel_size, origin.top - 3 * pixel_size)
+    ) as dst:
+        dst.write(data)
+    # inside, partly overlapping and outside of source
+    for tile_id in [(5, 10, 20), (5, 9, 19), (5, 11, 22), (5, 30, 60)]:
+        tile = pyramid.tile(*tile_id)
+        with rasterio.open(path) as src:
+            assert raster._aligned_offsets(
+                src, tile.bounds, tile.shape, tile.crs) is not None
+        # source and target nodata values differ in the last case
+        for kwargs in [{}, dict(indexes=1), dict(dst_nodata=7)]:
+            aligned = read_raster_window(path, tile, **kwargs)
+            # force reading through WarpedVRT
+            with monkeypatch.context() as m:
+                m.setattr(raster, "_aligned_offsets", lambda *args: None)
+                warped = read_raster_window(path, tile, **kwargs)
+            assert aligned.shape == warped.shape
+            assert np.array_equal(aligned.mask, warped.mask)
+            assert np.array_equal(aligned.filled(0), warped.filled(0))
+            assert aligned.fill_value == kwargs.get("dst_nodata", -1)
+            assert aligned.fill_value == warped.fill_value
+            assert np.array_equal(aligned.filled(), warped.filled())
+    # not aligned
+    with rasterio.open(path) as src:
+        tile = BufferedTilePyramid("geodetic").tile(6, 20, 40)
+        assert raster._aligned_offsets(
+            src, tile.bounds, tile.shape, tile.crs) is None
+
+
+def test_read_raster_window_overviews(mp_tmpdir, cleantopo_tl_tif):
+    """Read from internal or external overview matching tile resolution."""
+    tile = BufferedTilePyramid("geodetic").tile(1, 0, 0)
+    for external in [False, True]:
+        path = os.path.join(mp_tmpdir, "overviews_%s.tif" % external)
+        shutil.copy(cleantopo_tl_tif, path)
+        with rasterio.Env(TIFF_USE_OVR=external):
+            with rasterio.open(path, "r+") as dst:
+                dst.build_overviews([2, 4, 8], Resampling.average)
+        assert os.path.isfile(path + ".ovr") == external
+        raster.DATASET_POOL.clear()
+        data = read_raster_window(path, tile)
+        assert data.shape == (1, ) + tile.shape
+        assert not data.mask.all()
+        # source pixel size is about 0.033 and tile pixel size 0.35
+        assert [key[2] for key in raster.DATASET_POOL._idle] == [None, 2]
+        # full resolution data is read for high zoom levels
+        raster.DATASET_POOL.clear()
+        read_raster_window(path, BufferedTilePyramid("geodetic").tile(5, 0, 0))
+        assert [key[2] for key in raster.DATASET_POOL._idle] == [None]
+    raster.DATASET_POOL.clear()
+
+
+def test_read_raster_window_core_tile_cache(cleantopo_tl_tif):
+    """Read buffered tiles from cached core tiles."""
+    pyramid = BufferedTilePyramid("geodetic", metatiling=2, pixelbuffer=16)
+    cache = ProcessTileCache()
+    tiles = list(pyramid.tiles_from_bounds((-180, 0, -90, 90), 4))
+    for tile in tiles:
+        for kwargs in [{}, dict(indexes=1), dict(resampling="bilinear")]:
+            direct = read_raster_window(cleantopo_tl_tif, tile, **kwargs)
+            cached = read_raster_window(
+                cleantopo_tl_tif, tile, core_tile_cache=cache, **kwargs)
+            assert cached.shape == direct.shape
+            assert np.array_equal(cached.mask, direct.mask)
+            assert np.array_equal(cached.filled(0), direct.filled(0))
+    # neighbouring tiles share their core tiles
+    assert cache.hits
+    # buffered tiles on the antimeridian are not read from core tiles
+    assert not covered_by_core_tiles(pyramid.tile(4, 5, 0))
+    assert covered_by_core_tiles(pyramid.tile(4, 5, 1))
+
+
+def test_dataset_pool(mp_tmpdir, cleantopo_br_tif, dummy1_tif):
+    """Reuse opened datasets."""
+    pool = DatasetPool(maxsize=1)
+    with pool.checkout(cleantopo_br_tif) as src:
+        # dataset is not handed out twice at the same time
+        with pool.checkout(cleantopo_br_tif) as other:
+            assert other is not src
+    with pool.checkout(cleantopo_br_tif) as reused:
+        assert reused in (src, other)
+    # least recently used dataset gets closed
+    with pool.checkout(dummy1_tif):
+        pass
+    assert reused.closed
+    # modified files are opened again
+    path = os.path.join(mp_tmpdir, "copy.tif")
+    shutil.copy(cleantopo_br_tif, path)
+    with pool.checkout(path, validate=True) as src:
+        pass
+    shutil.copy(dummy1_tif, path)
+    with pool.checkout(path, validate=True) as src2:
+        assert src2 is not src
+        assert src2.shape == rasterio.open(dummy1_tif).shape
+    pool.clear()
+    assert src2.closed
+
+
 def test_write_raster_window():
     """Basic output format writing."""
     path = tempfile.NamedTemporaryFile(delete=False).name
@@ -311,6 +441,77 @@ def test_resample_from_array():
         resample_from_array(in_data, in_tile.affine, out_tile)
 
 
+def test_resample_from_array_downsampling():
+    """Reduce 2x2 pixel blocks natively when resampling from child tiles."""
+    tile = BufferedTilePyramid("geodetic", metatiling=2).tile(5, 5, 5)
+    rng = np.random.RandomState(0)
+    mosaic = create_mosaic([
+        (child, ma.masked_array(
+            rng.randint(1, 5, (2, ) + child.shape).astype("uint8"),
+            mask=rng.rand(2, *child.shape) < .2))
+        for child in tile.get_children()
+    ])
+    height, width = tile.shape
+    blocks = mosaic.data.reshape(2, height, 2, width, 2)
+    expected = dict(
+        nearest=blocks[:, :, 1, :, 1],
+        average=ma.masked_array(
+            np.floor(blocks.mean(axis=(2, 4)).astype("float64") + .5),
+            mask=blocks.mask.all(axis=(2, 4))),
+        min=blocks.min(axis=(2, 4)),
+        max=blocks.max(axis=(2, 4))
+    )
+    for resampling, control in expected.items():
+        resampled = resample_from_array(
+            mosaic, out_tile=tile, resampling=resampling)
+        assert resampled.shape == (2, ) + tile.shape
+        assert np.array_equal(resampled.mask, ma.getmaskarray(control))
+        assert np.array_equal(resampled.compressed(), control.compressed())
+    # mode returns a value occurring most often within a block
+    resampled = resample_from_array(mosaic, out_tile=tile, resampling="mode")
+    counts = sum(
+        ma.filled(blocks[:, :, row, :, col] == resampled, False)
+        for row in (0, 1) for col in (0, 1)
+    )
+    max_counts = np.max([
+        sum(
+            ma.filled(blocks[:, :, row, :, col] == value, False)
+            for row in (0, 1) for col in (0, 1)
+        )
+        for value in range(1, 5)
+    ], axis=0)
+    assert np.array_equal(counts, max_counts)
+    # methods not available natively still use rasterio
+    resampled = resample_from_array(
+        mosaic, out_tile=tile, resampling="bilinear")
+    assert resampled.shape == (2, ) + tile.shape
+    assert not resampled.mask.all()
+
+
+def test_resample_from_array_upsampling():
+    """Split pixels natively when resampling from parent tiles."""
+    parent = BufferedTilePyramid("geodetic", pixelbuffer=3).tile(5, 5, 5)
+    rng = np.random.RandomState(0)
+    data = ma.masked_array(
+        rng.randint(1, 255, (2, ) + parent.shape).astype("uint8"),
+        mask=rng.rand(2, *parent.shape) < .2, fill_value=0)
+    for resampling in ["nearest", "bilinear"]:
+        for child in parent.get_children():
+            resampled = resample_from_array(
+                data, parent.affine, child, resampling)
+            assert resampled.shape == (2, ) + child.shape
+            # same result as GDAL for each band
+            for band in range(2):
+                control = np.empty(child.shape, dtype="uint8")
+                reproject(
+                    data[band].filled(), control, src_transform=parent.affine,
+                    src_crs=parent.crs, src_nodata=0,
+                    dst_transform=child.affine, dst_crs=child.crs,
+                    dst_nodata=0, resampling=Resampling[resampling])
+                assert np.array_equal(resampled.mask[band], control == 0)
+                assert np.array_equal(resampled.data[band], control)
+
+
 def test_create_mosaic_errors():
     """Check error handling of create_mosaic()."""
     tp_geo = BufferedTilePyramid("geodetic")
@@ -405,6 +606,30 @@ def test_create_mosaic_antimeridian():
     assert mosaic.data[0][0][-1] == 1
 
 
+def test_create_mosaic_masks():
+    """Keep masks of masked tiles and mask nodata values of arrays."""
+    tp = BufferedTilePyramid("mercator", metatiling=2, pixelbuffer=2)
+    masked_tile, array_tile = tp.tile(4, 3, 3), tp.tile(4, 3, 4)
+    masked = ma.masked_array(
+        np.ones((2, ) + masked_tile.shape, dtype="uint8"),
+        mask=np.zeros((2, ) + masked_tile.shape, dtype=bool))
+    masked.mask[:, 10, 10] = True
+    array = np.full(array_tile.shape, 2, dtype="uint8")
+    array[-10, -10] = 0
+    mosaic = create_mosaic([(masked_tile, masked), (array_tile, array)])
+    assert mosaic.data.shape == (
+        2, masked_tile.height, masked_tile.width + array_tile.width - 4)
+    # single band arrays are used for all bands
+    assert mosaic.data.mask.sum() == 4
+    assert mosaic.data.mask[:, 10, 10].all()
+    assert mosaic.data.mask[:, -10, -10].all()
+    # tiles are placed at their location within the pyramid
+    for tile, value in [(masked_tile, 1), (array_tile, 2)]:
+        col, row = ~mosaic.affine * (tile.bounds.left, tile.bounds.top)
+        assert mosaic.data[0, int(round(row)) + 20, int(round(col)) + 20] == (
+            value)
+
+
 def test_prepare_array_iterables():
     """Convert iterable data into a proper array."""
     # input is iterable
@@ -493,6 +718,39 @@ def test_prepare_array_ndarrays():
     assert output.shape == (1, 1, 1)
 
 
+def test_prepare_array_copies():
+    """Count full copies of tile data made between process and output."""
+    tracemalloc = pytest.importorskip("tracemalloc")
+    tile = BufferedTilePyramid("geodetic", metatiling=2).tile(5, 5, 5)
+    data = ma.masked_array(
+        np.ones((3, ) + tile.shape, dtype="uint16"),
+        mask=np.zeros((3, ) + tile.shape, dtype=bool))
+    profile = dict(
+        driver="GTiff", count=3, dtype="uint16", width=tile.width,
+        height=tile.height, crs=tile.crs, transform=tile.affine, nodata=0)
+
+    def copies(func):
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1] // data.data.nbytes
+        finally:
+            tracemalloc.stop()
+
+    # prepared data is returned as it is, also on repeated calls
+    assert prepare_array(data, dtype="uint16") is data
+    assert copies(lambda: prepare_array(
+        prepare_array(data, dtype="uint16"), dtype="uint16")) == 0
+    # only the mask is created for arrays
+    assert copies(lambda: prepare_array(data.data, dtype="uint16")) == 0
+    # converting the data type copies once
+    assert copies(lambda: prepare_array(data, dtype="int16")) == 1
+    # preparing and writing a tile does not copy all of its data
+    assert copies(lambda: write_raster_window(
+        in_tile=tile, in_data=prepare_array(data, dtype="uint16"),
+        out_profile=profile, out_tile=tile, out_path="memoryfile")) == 0
+
+
 def test_prepare_array_errors():
     """Convert ndarray data into a proper array."""
     # input is iterable
@@ -8,18 +8,32 @@ import rasterio
 import numpy as np
 import numpy.ma as ma
 import pkg_resources
+import random
+import threading
+import time
 try:
     from cPickle import dumps
 except ImportError:
     from pickle import dumps
 from functools import partial
-from multiprocessing import Pool
-from shapely.geometry import shape
+from multiprocessing import Pool, Process
+from shapely.geometry import shape, box, LineString, Point
 
 import mapchete
 from mapchete.io.raster import create_mosaic
-from mapchete.errors import MapcheteProcessOutputError
+from mapchete.errors import (
+    MapcheteProcessOutputError, MapcheteProcessException)
 from mapchete import _batch
+from mapchete._cache import (
+    ProcessTileCache, DiskSpillCache, SharedTileStore, cache_namespace,
+    sizeof)
+from mapchete._estimate import estimate, _stratified_sample
+from mapchete._journal import (
+    TileJournal, JOURNAL_FILE, journal_namespace, open_journal)
+from mapchete._prefetch import InputPrefetcher
+from mapchete.tile import (
+    BufferedTilePyramid, tile_ids_from_geom, count_tiles_from_geom,
+    curve_index)
 
 
 def test_empty_execute(mp_tmpdir, cleantopo_br):
@@ -341,6 +355,174 @@ def test_old_style_process_class(mp_tmpdir, cleantopo_tl, old_style_process_py):
                 shutil.rmtree(mp_tmpdir, ignore_errors=True)
 
 
+def test_process_file_cache(mp_tmpdir, cleantopo_tl):
+    """Process file is loaded once and reloaded only if it changes."""
+    process_file = os.path.join(mp_tmpdir, "cached_process.py")
+    with open(process_file, "w") as dst:
+        dst.write("def execute(mp):\n    return 'empty'\n")
+    config = cleantopo_tl.dict
+    config.update(process_file=process_file)
+    with mapchete.open(config) as mp:
+        mp.execute((5, 0, 0))
+        fingerprint, entry_point = mapchete._PROCESS_CACHE[process_file]
+        # cached entry point is reused
+        mp.execute((5, 0, 1))
+        assert mapchete._PROCESS_CACHE[process_file][1] is entry_point
+        # changed process file is reloaded
+        with open(process_file, "w") as dst:
+            dst.write("def execute(mp):\n    return 'empty'\n\n\n# changed\n")
+        os.utime(process_file, (fingerprint[0] + 10, fingerprint[0] + 10))
+        mp.execute((5, 0, 0))
+        assert mapchete._PROCESS_CACHE[process_file][1] is not entry_point
+
+
+def test_process_tile_cache():
+    """Cache is limited by bytes and computes concurrent misses only once."""
+    cache = ProcessTileCache(max_bytes=4 * 1000 * 8, shards=1)
+    arrays = {i: np.zeros(1000, dtype="float64") for i in range(6)}
+    for i in range(6):
+        assert cache.get(i, lambda: arrays[i]) is arrays[i]
+    assert cache.misses == 6
+    assert cache.evictions == 2
+    assert cache.currsize == 4 * 1000 * 8
+    assert 0 not in cache and 5 in cache
+    assert cache.get(5, lambda: None) is arrays[5]
+    assert cache.hits == 1
+    # output larger than budget is returned but not cached
+    large = np.zeros(10000, dtype="float64")
+    assert cache.get("large", lambda: large) is large
+    assert "large" not in cache
+    # shards share one budget and accept entries up to its full size
+    cache = ProcessTileCache(max_bytes=4 * 1000 * 8, shards=16)
+    for i in range(4):
+        cache.get(i, lambda: arrays[i])
+    large = np.zeros(3000, dtype="float64")
+    for _ in range(3):
+        assert cache.get("large", lambda: large) is large
+    assert cache.misses == 5
+    assert "large" in cache and len(cache) == 2
+    assert cache.currsize <= cache.max_bytes
+    # masks and features are measured too
+    assert sizeof(ma.masked_array(np.zeros(10, "uint8"), mask=False)) == 20
+    features = [dict(geometry=box(0, 0, 1, 1), properties=dict(a=1))]
+    assert sizeof(features) > len(box(0, 0, 1, 1).wkb)
+    # single flight
+    cache = ProcessTileCache()
+    calls = []
+    started = threading.Event()
+
+    def _slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "output"
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get(1, _slow)))
+        for _ in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["output"] * 4
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (3, 1)
+    # errors are raised for waiting threads and not cached
+    with pytest.raises(ZeroDivisionError):
+        cache.get(2, lambda: 1 / 0)
+    assert 2 not in cache
+
+
+def test_shared_tile_store():
+    """Tiles are kept in shared memory slots and replaced by LRU."""
+    store = SharedTileStore(2, 4 * 4 * 5, "float32")
+    array = ma.masked_array(
+        np.arange(16, dtype="float32").reshape(1, 4, 4),
+        mask=np.arange(16).reshape(1, 4, 4) % 3 == 0)
+    # tiles stored by another process are visible
+    worker = Process(target=store.put, args=((5, 0, 0), array))
+    worker.start()
+    worker.join()
+    stored = store.get((5, 0, 0))
+    assert np.array_equal(stored.data, array.data)
+    assert np.array_equal(stored.mask, array.mask)
+    # least recently used tile is replaced
+    store.put((5, 0, 1), array[:, :2])
+    store.get((5, 0, 0))
+    store.put((5, 1, 1), array)
+    assert len(store) == 2
+    assert (5, 0, 1) not in store and (5, 0, 0) in store
+    # popped tiles are removed
+    assert store.get((5, 1, 1), pop=True).shape == (1, 4, 4)
+    assert store.get((5, 1, 1)) is None
+    assert (store.hits, store.misses) == (3, 1)
+    # tiles larger than a slot are not stored
+    store.put((5, 2, 2), np.zeros((1, 8, 8), dtype="float32"))
+    assert (5, 2, 2) not in store
+
+
+def test_disk_spill_cache(mp_tmpdir):
+    """Evicted tiles are spilled to disk and mapped back."""
+    spill_dir = os.path.join(mp_tmpdir, "spill")
+    spill = DiskSpillCache(spill_dir, max_bytes=20000, namespace="a")
+    cache = ProcessTileCache(max_bytes=10000, shards=1, spill=spill)
+    masked = ma.masked_array(np.arange(1000.), mask=np.arange(1000) % 2)
+    features = [dict(geometry=box(0, 0, 1, 1), properties=dict(a=1))]
+    cache.get(1, lambda: masked)
+    cache.get(2, lambda: features)
+    cache.get(3, lambda: np.ones(1000))
+    assert 1 in spill and 2 not in spill
+    # spilled array is memory mapped and not recomputed
+    spilled = cache.get(1, lambda: None)
+    assert isinstance(spilled.data, np.memmap)
+    assert ma.allclose(spilled, masked)
+    assert (spilled.mask == masked.mask).all()
+    assert spill.hits == 1
+    assert cache.get(2, lambda: None)[0]["geometry"].equals(box(0, 0, 1, 1))
+    # directory size is limited
+    for i in range(4, 8):
+        cache.get(i, lambda: np.zeros(1000))
+    assert spill.currsize <= spill.max_bytes
+    assert spill.evictions
+    # existing entries are reused but not for other namespaces
+    assert 7 not in spill
+    spill.put(7, np.zeros(1000))
+    assert 7 in DiskSpillCache(spill_dir, max_bytes=20000, namespace="a")
+    assert 7 not in DiskSpillCache(spill_dir, max_bytes=20000)
+
+
+def test_cache_namespace(mp_tmpdir, cleantopo_tl):
+    """Namespace changes with process file and parameters."""
+    config = cleantopo_tl.dict
+    process_file = os.path.join(mp_tmpdir, "namespace_process.py")
+    with open(process_file, "w") as dst:
+        dst.write("def execute(mp):\n    return 'empty'\n")
+    namespace = cache_namespace(process_file, config)
+    assert namespace == cache_namespace(process_file, config)
+    assert namespace != cache_namespace(
+        process_file, dict(config, zoom_levels=3))
+    with open(process_file, "a") as dst:
+        dst.write("# changed\n")
+    assert namespace != cache_namespace(process_file, config)
+
+
+def test_memory_mode_cache(cleantopo_tl):
+    """Process tiles are cached in memory mode."""
+    with mapchete.open(
+        cleantopo_tl.path, mode="memory", cache_size=256 * 1024 * 1024
+    ) as mp:
+        assert mp.process_tile_cache.max_bytes == 256 * 1024 * 1024
+        tile = mp.config.process_pyramid.tile(5, 0, 0)
+        first = mp.get_raw_output(tile)
+        second = mp.get_raw_output(tile)
+        assert ma.allclose(first, second)
+        assert mp.process_tile_cache.misses == 1
+        assert mp.process_tile_cache.hits == 1
+        assert mp.process_tile_cache.currsize > 0
+
+
 def test_multiprocessing(mp_tmpdir, cleantopo_tl):
     """Test parallel tile processing."""
     with mapchete.open(cleantopo_tl.path) as mp:
@@ -416,6 +598,358 @@ def test_count_tiles(zoom_mapchete):
                 maxzoom)
 
 
+def test_tile_ids_from_geom():
+    """Rasterized tile enumeration yields the same tiles as tiles_from_geom."""
+    pyramid = BufferedTilePyramid("geodetic", metatiling=2, pixelbuffer=5)
+    for geometry in [
+        # polygon with hole
+        Point(14.5, 48.2).buffer(5).difference(Point(14.5, 48.2).buffer(2)),
+        # tile aligned box
+        box(-45, -22.5, 45, 22.5),
+        LineString([(-170, -80), (10, 3), (100, 60)]),
+        Point(1.4, 2.3),
+        # crossing the antimeridian
+        box(170, 10, 190, 20),
+    ]:
+        for zoom in range(0, 7):
+            tile_ids = [
+                tile.id for tile in pyramid.tiles_from_geom(geometry, zoom)]
+            assert list(
+                tile_ids_from_geom(pyramid, geometry, zoom)) == tile_ids
+            assert count_tiles_from_geom(
+                pyramid, geometry, zoom) == len(tile_ids)
+
+
+def test_curve_index():
+    """Tiles are ordered along space filling curves."""
+    rows, cols = np.divmod(np.arange(64 * 64), 64)
+    for order in ["hilbert", "zorder"]:
+        positions = curve_index(rows, cols, order)
+        assert sorted(positions) == list(range(64 * 64))
+    # consecutive tiles on the Hilbert curve are neighbors
+    ordered = np.argsort(curve_index(rows, cols, "hilbert"))
+    assert (
+        np.abs(np.diff(rows[ordered])) + np.abs(np.diff(cols[ordered])) == 1
+    ).all()
+    assert list(curve_index([0, 0, 1, 1], [0, 1, 0, 1], "zorder")) == [
+        0, 1, 2, 3]
+    with pytest.raises(ValueError):
+        curve_index(rows, cols, "invalid")
+
+
+def test_batch_process_order(mp_tmpdir, cleantopo_tl):
+    """Process tiles in space filling curve order."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    with mapchete.open(config) as mp:
+        tiles = [tile.id for tile in mp.get_process_tiles(5)]
+        dag = _batch._TileDAG(mp, [5], order="hilbert")
+        ordered = dag.next_chunk(len(tiles))
+        assert len(ordered) > 4 and ordered != tiles
+        assert sorted(ordered) == sorted(tiles)
+        positions = curve_index(
+            [t[1] for t in ordered], [t[2] for t in ordered], "hilbert")
+        assert list(positions) == sorted(positions)
+        with pytest.raises(ValueError):
+            _batch._TileDAG(mp, [5], order="invalid")
+        mp.batch_process(zoom=5, multi=2, order="hilbert", quiet=True)
+        assert all(mp.config.output.tiles_exist(
+            mp.config.process_pyramid.tile(*tile_id)) for tile_id in tiles)
+
+
+def test_batch_process_journal(
+    mp_tmpdir, cleantopo_tl, process_error_py, monkeypatch
+):
+    """Resume batch from journal in output directory."""
+    with mapchete.open(cleantopo_tl.path, mode="overwrite") as mp:
+        tiles = [tile.id for tile in mp.get_process_tiles(5)]
+        mp.batch_process(zoom=5, multi=2, quiet=True)
+        path = os.path.join(mp.config.output.path, JOURNAL_FILE)
+        namespace = journal_namespace(mp.config)
+    with TileJournal(path, namespace) as journal:
+        assert sum(journal.counts().values()) == len(tiles)
+        assert len(journal.finished(5)) == len(tiles)
+        journal.record(_batch.TileStatus(tiles[0], "failed", 0., 0., 0))
+    with mapchete.open(cleantopo_tl.path) as mp:
+        for output_tile in mp.config.output.pyramid.intersecting(
+            mp.config.process_pyramid.tile(*tiles[0])
+        ):
+            os.remove(mp.config.output.get_path(output_tile))
+    # only the failed tile is processed again
+    processed = []
+    process_worker = _batch._process_worker
+
+    def _process_worker(process, process_tile, *args, **kwargs):
+        processed.append(process_tile.id)
+        return process_worker(process, process_tile, *args, **kwargs)
+    monkeypatch.setattr(_batch, "_process_worker", _process_worker)
+    with mapchete.open(cleantopo_tl.path) as mp:
+        mp.batch_process(zoom=5, multi=1, quiet=True)
+    assert processed == [tiles[0]]
+    with TileJournal(path, namespace) as journal:
+        assert not journal.failed(5)
+    # records are kept when resuming with other zoom levels and overwriting
+    # only discards records of processed zoom levels
+    with mapchete.open(cleantopo_tl.path, mode="overwrite") as mp:
+        mp.batch_process(zoom=[4, 5], multi=1, quiet=True)
+    del processed[:]
+    with mapchete.open(cleantopo_tl.path, zoom=5) as mp:
+        assert journal_namespace(mp.config) == namespace
+        mp.batch_process(zoom=5, multi=1, quiet=True)
+        open_journal(mp, [5]).close()
+    assert not processed
+    with TileJournal(path, namespace) as journal:
+        assert journal.counts(4) and journal.counts(5)
+    with mapchete.open(cleantopo_tl.path, mode="overwrite", zoom=5) as mp:
+        open_journal(mp, [5]).close()
+    with TileJournal(path, namespace) as journal:
+        assert journal.counts(4) and not journal.counts(5)
+    # journal is discarded if process changes
+    with TileJournal(path, "changed") as journal:
+        assert not journal.counts()
+    # failed tiles are recorded
+    config = cleantopo_tl.dict
+    config.update(process_file=process_error_py)
+    for multi in [1, 2]:
+        with mapchete.open(config, mode="overwrite") as mp:
+            with pytest.raises(MapcheteProcessException):
+                mp.batch_process(zoom=5, multi=multi, quiet=True)
+            namespace = journal_namespace(mp.config)
+        with TileJournal(path, namespace) as journal:
+            assert journal.counts() == {"failed": 1}
+
+
+def test_batch_process_failing_tiles(
+    mp_tmpdir, cleantopo_tl, process_failing_tiles_py
+):
+    """Time out, retry and collect failing tiles."""
+    config = cleantopo_tl.dict
+    config.update(process_file=process_failing_tiles_py)
+    config["pyramid"].update(metatiling=1)
+    with mapchete.open(config, mode="overwrite") as mp:
+        start = time.time()
+        failed = mp.batch_process(
+            zoom=[4, 5], multi=2, quiet=True, timeout=2, retries=1,
+            retry_delay=0.1, max_tasks_per_worker=1, skip_failed=True)
+        assert time.time() - start < 60
+        assert sorted(
+            (status.tile_id, status.error.split(":")[0]) for status in failed
+        ) == [
+            ((5, 0, 0), "MapcheteProcessTimeout"),
+            ((5, 0, 1), "MapcheteProcessException")
+        ]
+        tiles = [tile for tile in mp.get_process_tiles(5)]
+        assert all(
+            mp.config.output.tiles_exist(tile) for tile in tiles
+            if tile.id not in [(5, 0, 0), (5, 0, 1)]
+        )
+        assert mp.config.output.tiles_exist(mp.config.process_pyramid.tile(
+            4, 0, 0))
+    # retry without worker processes and raise if tile still fails
+    os.remove(os.path.join(mp_tmpdir, "failed_once"))
+    pyramid = BufferedTilePyramid("geodetic")
+    bounds = box(*pyramid.tile(5, 0, 1).bounds).union(
+        box(*pyramid.tile(5, 0, 2).bounds)).buffer(-0.01).bounds
+    with mapchete.open(config, mode="overwrite", bounds=bounds) as mp:
+        assert [tile.id for tile in mp.get_process_tiles(5)] == [
+            (5, 0, 1), (5, 0, 2)]
+        with pytest.raises(MapcheteProcessException):
+            mp.batch_process(
+                zoom=5, multi=1, quiet=True, retries=1, retry_delay=0.1)
+        failed = mp.batch_process(
+            zoom=5, multi=1, quiet=True, retries=1, retry_delay=0.1,
+            skip_failed=True)
+        assert [status.tile_id for status in failed] == [(5, 0, 1)]
+
+
+def test_batch_process_concurrency(
+    mp_tmpdir, cleantopo_tl, process_failing_tiles_py
+):
+    """Run workers as threads or as processes with threads."""
+    with mapchete.open(cleantopo_tl.path, mode="overwrite") as mp:
+        with pytest.raises(ValueError):
+            mp.batch_process(zoom=2, concurrency="greenlets")
+        with pytest.raises(ValueError):
+            mp.batch_process(zoom=2, concurrency="threads", timeout=1)
+        for concurrency in ["threads", "hybrid"]:
+            shutil.rmtree(mp_tmpdir, ignore_errors=True)
+            mp.batch_process(
+                zoom=[1, 3], multi=2, quiet=True, concurrency=concurrency,
+                threads=2)
+            for zoom in range(1, 4):
+                for tile in mp.get_process_tiles(zoom):
+                    assert mp.config.output.tiles_exist(tile)
+    # workers with multiple threads cannot be killed safely
+    config = cleantopo_tl.dict
+    config.update(process_file=process_failing_tiles_py)
+    config["pyramid"].update(metatiling=1)
+    with mapchete.open(config, mode="overwrite") as mp:
+        for kwargs in [dict(concurrency="hybrid", threads=3), dict(writers=1)]:
+            with pytest.raises(ValueError):
+                mp.batch_process(zoom=5, timeout=2, **kwargs)
+        failed = mp.batch_process(
+            zoom=5, multi=1, quiet=True, timeout=2, retries=1,
+            retry_delay=0.1, skip_failed=True, concurrency="hybrid",
+            threads=1)
+        assert sorted(
+            (status.tile_id, status.error.split(":")[0]) for status in failed
+        ) == [
+            ((5, 0, 0), "MapcheteProcessTimeout"),
+            ((5, 0, 1), "MapcheteProcessException")
+        ]
+        assert all(
+            mp.config.output.tiles_exist(tile)
+            for tile in mp.get_process_tiles(5)
+            if tile.id not in [(5, 0, 0), (5, 0, 1)]
+        )
+
+
+def test_batch_process_writers(mp_tmpdir, cleantopo_tl):
+    """Write outputs in background threads of the workers."""
+    with mapchete.open(cleantopo_tl.path, mode="overwrite") as mp:
+        with pytest.raises(ValueError):
+            mp.batch_process(zoom=2, concurrency="threads", writers=1)
+        writer = _batch._WriteBehind(mp, 1, queue_size=1)
+        tile = mp.config.process_pyramid.tile(2, 0, 0)
+        pending = [
+            writer.write(tile, mp.execute(tile)),
+            writer.write(tile, "invalid output")
+        ]
+        assert isinstance(pending[0].get(), float)
+        assert mp.config.output.tiles_exist(tile)
+        status = _batch.TileStatus(tile.id, "written", 0., 0., 0)
+        assert isinstance(_batch._wait_written(
+            _batch._PendingWrite(status, pending[1])), _batch._TileFailure)
+        # tiles are recorded as written once their output exists
+        mp.batch_process(
+            zoom=[1, 3], multi=1, quiet=True, writers=2, order="hilbert")
+        with TileJournal(
+            os.path.join(mp_tmpdir, JOURNAL_FILE), journal_namespace(mp.config)
+        ) as journal:
+            assert journal.counts()["written"] == sum(
+                len(list(mp.get_process_tiles(zoom))) for zoom in range(1, 4)
+            )
+        for zoom in range(1, 4):
+            for tile in mp.get_process_tiles(zoom):
+                assert mp.config.output.tiles_exist(tile)
+
+
+def test_batch_process_prefetch(mp_tmpdir, cleantopo_tl):
+    """Read inputs of upcoming tiles in the background."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    with mapchete.open(config, mode="overwrite") as mp:
+        tiles = [
+            tile for tile in mp.get_process_tiles(5)
+            if not mp.config.input[list(mp.config.input)[0]].open(
+                tile).is_empty()
+        ][:4]
+        assert len(tiles) == 4
+        expected = [mp.execute(tile) for tile in tiles]
+        prefetcher = InputPrefetcher(mp, depth=2)
+        try:
+            # inputs are prefetched once the process has read them
+            for i, tile in enumerate(tiles):
+                prefetcher.prefetch([tile.id for tile in tiles[i:i + 3]])
+                assert np.array_equal(mp.execute(tile), expected[i])
+            assert (prefetcher.hits, prefetcher.misses) == (3, 1)
+            # reads with other arguments are not prefetched
+            prefetcher.prefetch([tiles[0].id])
+            with mp.config.input[list(mp.config.input)[0]].open(
+                tiles[0], resampling="bilinear"
+            ) as input_tile:
+                input_tile.read(1)
+            assert prefetcher.misses == 2
+            # memory cap
+            prefetcher.prefetch([])
+            prefetcher.max_bytes = 0
+            prefetcher.prefetch([tiles[1].id])
+            assert np.array_equal(mp.execute(tiles[1]), expected[1])
+            assert prefetcher.misses == 3
+            # reads in progress count against the memory cap
+            prefetcher.max_bytes = int(max(prefetcher._sizes.values()) * 1.5)
+            prefetcher.prefetch([tiles[2].id, tiles[3].id])
+            for result in list(prefetcher._reads.values()):
+                result.wait()
+            assert 0 < len(prefetcher._reads) < 4
+            assert prefetcher._prefetched_bytes() <= prefetcher.max_bytes
+        finally:
+            prefetcher.close()
+        with pytest.raises(ValueError):
+            mp.batch_process(zoom=5, concurrency="threads", prefetch=1)
+    with mapchete.open(config, mode="overwrite") as mp:
+        mp.batch_process(zoom=5, multi=1, quiet=True, prefetch=2)
+        for tile in mp.get_process_tiles(5):
+            assert mp.config.output.tiles_exist(tile)
+
+
+def test_batch_process_failing_dependencies(
+    mp_tmpdir, cleantopo_tl, process_failing_tiles_py
+):
+    """Tiles interpolated from failed tiles fail as well."""
+    config = cleantopo_tl.dict
+    config.update(
+        process_file=process_failing_tiles_py,
+        baselevels=dict(min=5, max=5))
+    config["pyramid"].update(metatiling=1)
+    with mapchete.open(config, mode="overwrite") as mp:
+        dag = _batch._TileDAG(mp, [5, 4, 3])
+        ready = dag.next_chunk(100)
+        assert len(ready) == 9
+        for tile_id in ready:
+            if tile_id == (5, 0, 1):
+                dag.fail(tile_id)
+            else:
+                dag.done(tile_id)
+        # (3, 0, 0) fails once the remaining tiles of zoom 4 are processed
+        ready = dag.next_chunk(100)
+        assert sorted(ready) == [(4, 0, 1), (4, 1, 0), (4, 1, 1)]
+        assert list(dag.failed) == [(4, 0, 0)]
+        for tile_id in ready:
+            dag.done(tile_id)
+        assert dag.next_chunk(100) == []
+        assert list(dag.failed) == [(4, 0, 0), (3, 0, 0)]
+        assert dag.finished is False
+        assert [
+            status.tile_id for status in _batch._unprocessed_statuses(dag)
+        ] == [(4, 0, 0), (3, 0, 0)]
+        assert dag.finished
+
+
+def test_estimate(mp_tmpdir, cleantopo_tl):
+    """Extrapolate runtime and output size from sample tiles."""
+    config = cleantopo_tl.dict
+    config["pyramid"].update(metatiling=1)
+    result = estimate(config, zoom=[4, 5], samples=3, seed=1)
+    assert result.zooms == {4: (4, 3), 5: (9, 3)}
+    assert (result.tiles, result.samples) == (13, 6)
+    for hours in [
+        result.read_hours, result.process_hours, result.write_hours
+    ]:
+        assert hours > 0
+    assert result.cpu_hours == pytest.approx(
+        result.read_hours + result.process_hours + result.write_hours)
+    low, high = result.cpu_hours_interval
+    assert low <= result.cpu_hours <= high
+    low, high = result.output_bytes_interval
+    assert 0 < low <= result.output_bytes <= high
+    assert result.peak_memory > 0
+    # intervals are unbounded if there is a single sample out of many tiles
+    result = estimate(config, zoom=5, samples=1, seed=1)
+    assert result.zooms == {5: (9, 1)}
+    assert result.output_bytes > 0
+    assert result.cpu_hours_interval is None
+    assert result.output_bytes_interval is None
+    # sample output is not written into process output
+    assert not os.path.exists(os.path.join(mp_tmpdir, "4"))
+    # one tile out of every stratum
+    sample = _stratified_sample(iter(range(100)), 100, 10, random.Random(1))
+    assert [i // 10 for i in sample] == list(range(10))
+    # all tiles if there are less tiles than samples
+    assert _stratified_sample(
+        iter(range(3)), 3, 10, random.Random(1)) == [0, 1, 2]
+
+
 def test_batch_process(mp_tmpdir, cleantopo_tl):
     """Test batch_process function."""
     with mapchete.open(cleantopo_tl.path) as mp:
@@ -434,6 +968,190 @@ def test_batch_process(mp_tmpdir, cleantopo_tl):
         mp.batch_process(zoom=2, multi=1)
 
 
+def test_batch_process_worker_init(mp_tmpdir, cleantopo_tl):
+    """Pool workers are initialized once and receive only tile indexes."""
+    with mapchete.open(cleantopo_tl.path) as mp:
+        _batch._worker_init(mp)
+        try:
+            status = _batch._process_worker_from_id((2, 0, 0))
+            assert status.tile_id == (2, 0, 0)
+            assert status.status == "written"
+            assert mp.config.output.tiles_exist(mp.config.process_pyramid.tile(
+                *status.tile_id))
+        finally:
+            _batch._WORKER_ENV.__exit__()
+            _batch._WORKER_PROCESS = None
+            _batch._WORKER_ENV = None
+        # process multiple zoom levels using one pool
+        mp.batch_process(zoom=[1, 3], multi=2)
+        for zoom in range(1, 4):
+            for tile in mp.get_process_tiles(zoom):
+                assert mp.config.output.tiles_exist(tile)
+
+
+def test_batch_output(mp_tmpdir, cleantopo_tl):
+    """Process outputs are passed on through shared memory."""
+    with mapchete.open(cleantopo_tl.path) as mp:
+        expected = {
+            tile.id: mp.execute(tile) for tile in mp.get_process_tiles(2)}
+        # workers keep waiting for free slots until outputs are consumed
+        results = list(mp.batch_output(zoom=2, multi=2, slots=1))
+        assert len(results) == len(expected)
+        for status, output in results:
+            assert status.status == "written"
+            assert status.nbytes == output.nbytes
+            assert isinstance(output, ma.MaskedArray)
+            assert np.array_equal(output, expected[status.tile_id])
+            assert np.array_equal(
+                output.mask, ma.getmaskarray(expected[status.tile_id]))
+    # existing outputs are skipped in continue mode
+    with mapchete.open(cleantopo_tl.path) as mp:
+        for status, output in mp.batch_output(zoom=2, multi=1):
+            assert status.status == "skipped"
+            assert output is None
+
+
+def test_batch_process_continue(mp_tmpdir, cleantopo_tl, monkeypatch):
+    """Existing output tiles are skipped before being sent to the workers."""
+    with mapchete.open(cleantopo_tl.path) as mp:
+        mp.batch_process(zoom=[2, 3], multi=2)
+        tile = next(mp.get_process_tiles(3))
+        os.remove(mp.config.output.get_path(tile))
+        assert (tile.row, tile.col) not in mp.config.output.existing_tiles(3)
+        statuses = {
+            status.tile_id: status.status
+            for status, _ in mp.batch_output(zoom=[2, 3], multi=2)
+        }
+        assert statuses.pop(tile.id) == "written"
+        assert set(statuses.values()) == set(["skipped"])
+        assert mp.config.output.tiles_exist(tile)
+        # workers do not check tiles again which the scheduler already checked
+        output_tiles_exist = type(mp.config.output).tiles_exist
+
+        def _tiles_exist(*args):
+            raise RuntimeError("tile checked again")
+        monkeypatch.setattr(
+            type(mp.config.output), "tiles_exist", _tiles_exist)
+        for multi in [1, 2]:
+            os.remove(mp.config.output.get_path(tile))
+            mp.batch_process(zoom=[2, 3], multi=multi, journal=False)
+            assert output_tiles_exist(mp.config.output, tile)
+
+
+def test_shared_array_channel():
+    """Arrays are copied in and out of shared memory slots."""
+    channel = _batch._SharedArrayChannel(1, 64)
+    data = ma.masked_array(
+        np.arange(12, dtype="uint16").reshape(3, 4), mask=np.eye(3, 4))
+    ref = channel.put(data)
+    assert ref.slot == 0
+    result = channel.get(ref)
+    assert result.dtype == data.dtype
+    assert np.array_equal(result, data)
+    assert np.array_equal(result.mask, data.mask)
+    # slot is free again
+    assert channel.put(np.ones((8, 8), dtype="uint8")).slot == 0
+    # arrays too large for a slot are not stored
+    assert channel.put(np.ones((8, 8), dtype="float32")) is None
+
+
+def test_tile_dag(cleantopo_tl, baselevels):
+    """Process tiles are released once their dependencies are processed."""
+    # without baselevels, all zoom levels are released at once
+    with mapchete.open(cleantopo_tl.path) as mp:
+        dag = _batch._TileDAG(mp, reversed(mp.config.zoom_levels))
+        all_tiles = [tile.id for tile in mp.get_process_tiles()]
+        assert dag.next_chunk(len(all_tiles) + 1) == all_tiles
+        assert dag.finished
+    # baselevels are 5 and 6, zoom 4 depends on 5 and zoom 7 on 6
+    with mapchete.open(baselevels.path) as mp:
+        dag = _batch._TileDAG(mp, [7, 6, 5, 4])
+        processed = set()
+        while not dag.finished:
+            chunk = dag.next_chunk(3)
+            assert chunk
+            for zoom, row, col in chunk:
+                tile = mp.config.process_pyramid.tile(zoom, row, col)
+                if zoom == 4:
+                    assert all(
+                        child.id in processed
+                        for child in tile.get_children()
+                        if child.id in set(
+                            t.id for t in mp.get_process_tiles(5))
+                    )
+                elif zoom == 7:
+                    assert tile.get_parent().id in processed
+            for tile_id in chunk:
+                dag.done(tile_id)
+                processed.add(tile_id)
+        assert processed == set(
+            tile.id for zoom in [4, 5, 6, 7]
+            for tile in mp.get_process_tiles(zoom)
+        )
+
+
+def test_batch_process_baselevels(mp_tmpdir, baselevels):
+    """Interpolated zoom levels contain data after batch processing."""
+    with mapchete.open(baselevels.path) as mp:
+        mp.batch_process(multi=2, quiet=True)
+        for zoom in [7, 4, 3]:
+            tile = next(mp.get_process_tiles(zoom))
+            assert not mp.read(tile).mask.all()
+
+
+def test_batch_process_baselevel_store(mp_tmpdir, baselevels, monkeypatch):
+    """Interpolate from tiles kept in shared memory instead of output files."""
+    stores = []
+    baselevel_store = _batch._baselevel_store
+
+    def _baselevel_store(*args, **kwargs):
+        stores.append(baselevel_store(*args, **kwargs))
+        return stores[-1]
+    monkeypatch.setattr(_batch, "_baselevel_store", _baselevel_store)
+    # tiles read from output files
+    read_tiles = []
+    get_raw_output = mapchete.Mapchete.get_raw_output
+
+    def _get_raw_output(self, tile, **kwargs):
+        read_tiles.append(tile)
+        return get_raw_output(self, tile, **kwargs)
+    monkeypatch.setattr(mapchete.Mapchete, "get_raw_output", _get_raw_output)
+    outputs = []
+    for size in [0, 256]:
+        config = baselevels.dict
+        config["output"].update(path=os.path.join(mp_tmpdir, str(size)))
+        with mapchete.open(config) as mp:
+            del read_tiles[:]
+            mp.batch_process(multi=1, quiet=True, baselevel_store_size=size)
+            assert mp.baselevel_store is None
+            outputs.append([
+                mp.read(tile)
+                for zoom in [7, 4, 3] for tile in mp.get_process_tiles(zoom)
+            ])
+            # only tiles without output are read if tiles are stored
+            assert bool(size) != any(
+                mp.config.output.tiles_exist(tile) for tile in read_tiles)
+    assert stores[0] is None
+    assert stores[1].hits
+    for without_store, with_store in zip(*outputs):
+        assert np.array_equal(without_store.mask, with_store.mask)
+        assert np.array_equal(without_store.data, with_store.data)
+    with mapchete.open(config) as mp:
+        assert _batch._baselevel_store(mp, [5, 4], 1024 * 1024) is not None
+        # killed workers could leave the store locked or inconsistent
+        assert _batch._baselevel_store(
+            mp, [5, 4], 1024 * 1024, timeout=10) is None
+    # no shared memory is allocated without baselevels
+    with mapchete.open(
+        {k: v for k, v in config.items() if k != "baselevels"}
+    ) as mp:
+        assert _batch._baselevel_store(mp, [5, 4], 1024 * 1024) is None
+    # buffered output tiles contain pixels of their neighbors
+    config["output"].update(pixelbuffer=10)
+    with mapchete.open(config) as mp:
+        assert _batch._baselevel_store(mp, [5, 4], 1024 * 1024) is None
+
+
 def test_custom_grid(mp_tmpdir, custom_grid):
     """Cutom grid processing."""
     # process and save
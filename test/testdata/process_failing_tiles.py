@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+"""Example process file hanging or failing on some tiles."""
+
+import os
+import time
+
+# temporary test directory
+TEMP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tmp")
+
+
+def execute(mp):
+    """User defined process."""
+    if mp.tile.id == (5, 0, 0):
+        time.sleep(600)
+    elif mp.tile.id == (5, 0, 1):
+        raise RuntimeError("tile failed")
+    elif mp.tile.id == (5, 0, 2):
+        # fail only once
+        marker = os.path.join(TEMP_DIR, "failed_once")
+        if not os.path.exists(marker):
+            open(marker, "w").close()
+            raise RuntimeError("tile failed once")
+    with mp.open("file1") as raster_file:
+        return raster_file.read()